@@ -0,0 +1,304 @@
+"""asyncio execution engine for torrent workers.
+
+Every download runs as a task on a single event loop (instead of in its own
+thread). Blocking Deluge requests are run in the event loop's default
+executor.
+"""
+
+# pylint: disable=protected-access
+
+import asyncio
+from pathlib import Path
+import signal
+import sys
+import threading
+from typing import Dict, List, Optional, Set
+
+from bugyi.tools import notify
+from loguru import logger as log
+
+from . import deluge, metrics, worker
+from .deluge import DelugeClient, TorrentStatus
+from .poller import POLL_BATCH_WINDOW, POLL_INTERVAL, PollScheduler
+
+
+class EngineStoppedError(Exception):
+    """Raised when a torrent is submitted to an engine that is shutting
+    down.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            "Every torrent has already finished, so this torrent instance is"
+            " shutting down. Please try again."
+        )
+
+
+class AsyncStatusPoller:
+    """asyncio Counterpart of `poller.StatusPoller`
+
+    Must only be used from the event loop's thread.
+    """
+
+    def __init__(
+        self, client: DelugeClient, *, interval: float = POLL_INTERVAL
+    ) -> None:
+        self.client = client
+        self.interval = interval
+
+        # Maps torrent IDs to the (loop) time their next poll is due.
+        self._due: Dict[str, float] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._wakeup = asyncio.Event()
+
+    async def wait_for_status(
+        self, ID: str, delay: float = None
+    ) -> TorrentStatus:
+        """Returns @ID's status once it has been polled again."""
+        if delay is None:
+            delay = self.interval
+
+        loop = asyncio.get_event_loop()
+        due = loop.time() + delay
+        self._due[ID] = min(due, self._due.get(ID, due))
+
+        future = loop.create_future()
+        self._waiters.setdefault(ID, []).append(future)
+        self._wakeup.set()
+
+        status = await future
+        if status is None:
+            raise ValueError(
+                f"The P2P client has no record of the torrent with ID {ID!r}."
+            )
+
+        return status
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            self._wakeup.clear()
+            if not self._due:
+                await self._wakeup.wait()
+                continue
+
+            timeout = min(self._due.values()) - loop.time()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = loop.time()
+            ids = {
+                ID
+                for ID, due in self._due.items()
+                if due <= now + POLL_BATCH_WINDOW
+            }
+            for ID in ids:
+                del self._due[ID]
+
+            log.trace("Polling the status of {} torrent(s)...", len(ids))
+            try:
+                with metrics.poll_time.time():
+                    statuses = await loop.run_in_executor(
+                        None, self.client.statuses, ids
+                    )
+            except deluge.DelugeError as e:
+                log.warning("Failed to poll torrent statuses: {}", e)
+                retry_time = loop.time() + self.interval
+                for ID in ids:
+                    self._due.setdefault(ID, retry_time)
+                continue
+
+            for ID in ids:
+                for future in self._waiters.pop(ID, []):
+                    # The future is already done if its task was cancelled.
+                    if not future.done():
+                        future.set_result(statuses.get(ID))
+
+
+class AsyncEngine:
+    """Runs every torrent download as a task on a single event loop.
+
+    Torrents are submitted via `submit()` (which is thread-safe) and are
+    downloaded once `run()` is called. Once every torrent has finished (or
+    the engine has been cancelled), new submissions are rejected.
+    """
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        self._poller = AsyncStatusPoller(worker._deluge)
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._finished_workers: List[worker._TorrentWorker] = []
+        self._all_done = asyncio.Event()
+        self._signum: Optional[int] = None
+
+        # Guards the fields below, which are also used by submitting threads.
+        self._lock = threading.Lock()
+        self._accepting = True
+        # The number of submitted workers which have not been spawned yet.
+        self._pending = 0
+
+    def submit(
+        self,
+        magnet: str,
+        download_dir: Path,
+        timeout: float,
+        torrent_id: str = None,
+    ) -> int:
+        """Schedules @magnet to be downloaded.
+
+        Returns:
+            The magnet tracker key assigned to @magnet.
+
+        Raises:
+            EngineStoppedError: If the engine is shutting down.
+        """
+        with self._lock:
+            if not self._accepting:
+                raise EngineStoppedError()
+
+            torrent_worker = worker._TorrentWorker(
+                magnet=magnet,
+                download_dir=download_dir,
+                timeout=timeout,
+                torrent_id=torrent_id,
+            )
+            self._pending += 1
+            self.loop.call_soon_threadsafe(self._spawn, torrent_worker)
+
+        return torrent_worker.mt_key
+
+    def run(self) -> None:
+        """Blocks until every torrent has finished downloading.
+
+        If a SIGTERM or SIGINT signal is received, every download task is
+        cancelled and the process exits.
+        """
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signum, self._cancel_all, signum)
+
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+        if self._signum is not None:
+            worker.kill_all_workers()
+            sys.exit(128 + self._signum)
+
+    async def _main(self) -> None:
+        poller_task = self.loop.create_task(self._poller.run())
+        # Nothing may have been submitted (e.g. if every magnet was a
+        # duplicate).
+        self._check_all_done()
+        await self._all_done.wait()
+
+        poller_task.cancel()
+        await asyncio.gather(poller_task, *self._tasks, return_exceptions=True)
+
+        if self._signum is None:
+            for torrent_worker in self._finished_workers:
+                await self.loop.run_in_executor(
+                    None, self._cleanup, torrent_worker
+                )
+
+            notify("All torrents are complete.", title="torrent")
+
+    @staticmethod
+    def _cleanup(torrent_worker: worker._TorrentWorker) -> None:
+        """Removes a finished torrent from the P2P client."""
+        if torrent_worker.torrent_id is not None:
+            worker._kill_worker(torrent_worker.torrent_id)
+
+        torrent_worker.fix_ownership()
+
+    def _spawn(self, torrent_worker: worker._TorrentWorker) -> None:
+        # The job stays unfinished in the journal if we were cancelled, so it
+        # is resumed by the next session.
+        if self._signum is None:
+            task = self.loop.create_task(self._download(torrent_worker))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_task_done)
+
+        with self._lock:
+            self._pending -= 1
+
+    def _on_task_done(self, task: "asyncio.Task[None]") -> None:
+        self._tasks.discard(task)
+        self._check_all_done()
+
+    def _check_all_done(self) -> None:
+        """Stops accepting torrents once every torrent has finished."""
+        with self._lock:
+            if self._tasks or self._pending:
+                return
+
+            self._accepting = False
+
+        self._all_done.set()
+
+    def _cancel_all(self, signum: int) -> None:
+        log.debug(f"Terminated via {signal.Signals(signum).name} signal.")
+        self._signum = signum
+        with self._lock:
+            self._accepting = False
+
+        for task in self._tasks:
+            task.cancel()
+
+        self._all_done.set()
+
+    async def _download(self, torrent_worker: worker._TorrentWorker) -> None:
+        log.debug(f'Added "{torrent_worker.title}" to magnet queue.')
+
+        key = torrent_worker.mt_key
+        try:
+            await self._download_torrent(torrent_worker)
+        except asyncio.CancelledError:
+            # This job is left unfinished in the journal, so it can be
+            # resumed by the next session.
+            raise
+        except Exception:  # pylint: disable=broad-except
+            log.exception(f'Failed to download "{torrent_worker.title}".')
+            worker._journal.finished(key)
+        else:
+            worker._journal.finished(key)
+        finally:
+            if torrent_worker.torrent_id is not None:
+                metrics.forget_torrent(
+                    torrent_worker.torrent_id, torrent_worker.title
+                )
+
+            torrent_worker.magnet_tracker.done(key)
+            self._finished_workers.append(torrent_worker)
+
+    async def _download_torrent(
+        self, torrent_worker: worker._TorrentWorker
+    ) -> None:
+        deadline = torrent_worker._deadline()
+        scheduler = PollScheduler()
+        delay: float = POLL_INTERVAL
+        while True:
+            delay = torrent_worker._check_deadline(deadline, delay)
+
+            if not torrent_worker.is_enqueued:
+                await self.loop.run_in_executor(
+                    None, torrent_worker._start_download
+                )
+
+            status = await self._poller.wait_for_status(
+                torrent_worker.magnet_tracker[torrent_worker.mt_key],
+                delay=delay,
+            )
+            delay = scheduler.next_delay(status)
+
+            is_finished = await self.loop.run_in_executor(
+                None, torrent_worker._process_status, status
+            )
+            if is_finished:
+                return
@@ -6,35 +6,35 @@ and then sends me a text message to let me know the download is complete.
 
 Multiple torrents can be downloaded at the same time by simply running this
 script multiple times (using different magnet files). If another instance of
-this script is running, the primary instance will be signaled to enqueue the
-new magnet file for download.
+this script is running, the new magnet file is handed to the primary instance
+(over a Unix domain socket) to be enqueued for download. Magnets can also be
+read in bulk (from files, directories, or stdin) using the -f option.
 """
 
 import atexit
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import getpass
 import os
 from pathlib import Path
-import pickle
 import signal
 import subprocess as sp
 import sys
 import time
 import types
-from typing import NamedTuple, Sequence
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 
 import bugyi
-from bugyi import cli, xdg
+from bugyi import cli
 from bugyi.core import catch
 from loguru import logger as log
 
-from . import worker
-
-
-ARGS_FILE = xdg.init_full_dir("data") / "args"
+from . import aio, ipc, metrics, worker
 
 
 class Arguments(NamedTuple):
-    magnet: str
+    magnets: List[str]
+    sources: List[str]
     debug: bool
     verbose: bool
     download_dir: Path
@@ -58,25 +58,71 @@ def main(argv: Sequence[str] = None) -> None:
 
         pudb.set_trace()
 
+    magnets = list(args.magnets)
+    for source in args.sources:
+        magnets.extend(read_magnets(source))
+
+    if not magnets:
+        log.warning("No magnets were found. Nothing to do.")
+        return
+
     register_handlers()
-    create_pidfile(args)
+    create_pidfile(args, magnets)
+    metrics.serve()
+
+    engine = aio.AsyncEngine() if args.threading == "async" else None
+
+    start: Optional[worker.JobStarter] = None  # i.e. use a new thread
+    if engine is not None:
+        start = engine.submit
+    elif args.threading == "n":
+        start = download_magnet
+
+    # This must happen before we accept any magnets from other instances, so
+    # their keys never collide with the keys of the unfinished jobs.
+    unfinished_jobs = worker.recover_jobs()
+
+    enqueue_server = ipc.serve(
+        functools.partial(
+            worker.enqueue_magnets,
+            start=submit_magnet if engine is None else engine.submit,
+        )
+    )
+    atexit.register(enqueue_server.server_close)
 
     time.sleep(args.delay)
 
     setup_env(args.vpn, args.download_dir)
 
-    worker.new_torrent_worker(
-        args.magnet,
-        args.download_dir,
-        args.timeout,
-        use_threads=(args.threading == "y"),
+    worker.resume_jobs(
+        unfinished_jobs, None if engine is None else engine.submit
     )
-    worker.join_workers()
+    # Any magnet which was resumed from the last session is skipped here.
+    worker.enqueue_magnets(magnets, args.download_dir, args.timeout, start)
+
+    if engine is None:
+        worker.join_workers()
+    else:
+        engine.run()
 
 
 def parse_cli_args(argv: Sequence[str]) -> Arguments:
     parser = cli.ArgumentParser(description=__doc__)
-    parser.add_argument("magnet", help="The torrent magnet file.")
+    parser.add_argument(
+        "magnets", nargs="*", metavar="magnet", help="A torrent magnet file."
+    )
+    parser.add_argument(
+        "-f",
+        dest="sources",
+        action="append",
+        default=[],
+        metavar="SOURCE",
+        help=(
+            "Read magnets (one per line) from SOURCE, which can be a file, a"
+            " directory of files, or '-' (for stdin). This option can be"
+            " specified multiple times."
+        ),
+    )
     parser.add_argument(
         "-w",
         type=Path,
@@ -115,9 +161,13 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
     )
     parser.add_argument(
         "--threading",
-        choices=("y", "n"),
+        choices=("y", "n", "async"),
         default="y",
-        help="Enable multi-threading. Defaults to '%(default)s'.",
+        help=(
+            "Enable multi-threading. If set to 'async', every download is"
+            " run as a task on a single asyncio event loop instead."
+            " Defaults to '%(default)s'."
+        ),
     )
     parser.add_argument(
         "--vpn",
@@ -128,6 +178,9 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
     )
 
     args = parser.parse_args(argv[1:])
+    if not args.magnets and not args.sources:
+        parser.error("At least one magnet or SOURCE is required.")
+
     return Arguments(**dict(args._get_kwargs()))
 
 
@@ -140,39 +193,83 @@ def register_handlers() -> None:
         worker.kill_all_workers()
         sys.exit(128 + signum)
 
-    def usr1_handler(
-        signum: signal.Signals,  # pylint: disable=unused-argument
-        frame: types.FrameType,  # pylint: disable=unused-argument
-    ) -> None:
-        log.debug("SIGUSR1 signal received.")
-        with ARGS_FILE.open("rb") as f:
-            child_args = pickle.load(f)
-
-        worker.wait_for_first_magnet()
-        worker.new_torrent_worker(
-            child_args.magnet, child_args.download_dir, child_args.timeout,
-        )
-
     signal.signal(signal.SIGTERM, term_handler)
     signal.signal(signal.SIGINT, term_handler)
-    signal.signal(signal.SIGUSR1, usr1_handler)
 
 
-def create_pidfile(args: Arguments) -> None:
+def create_pidfile(args: Arguments, magnets: Sequence[str]) -> None:
     """Duplicate Process Management"""
     try:
         bugyi.create_pidfile()
     except bugyi.StillAliveException as e:
-        with ARGS_FILE.open("wb") as f:
-            pickle.dump(args, f)
-
-        log.debug(f"Sending SIGUSR1 to {e.pid}.")
-        os.kill(e.pid, signal.SIGUSR1)
+        log.debug(
+            f"Handing {len(magnets)} magnet(s) to primary instance (PID:"
+            f" {e.pid})."
+        )
+        keys = ipc.send_magnets(magnets, args.download_dir, args.timeout)
+        log.info(f"Magnets were enqueued by primary instance (keys: {keys}).")
 
         # Exit without invoking exit handler.
         os._exit(0)  # pylint: disable=protected-access
 
 
+def submit_magnet(
+    magnet: str, download_dir: Path, timeout: float, torrent_id: str = None
+) -> int:
+    """Enqueues a magnet that was handed to us by another instance."""
+    return worker.new_torrent_worker(
+        magnet,
+        download_dir,
+        timeout,
+        wait_for_first=True,
+        torrent_id=torrent_id,
+    )
+
+
+def download_magnet(
+    magnet: str, download_dir: Path, timeout: float, torrent_id: str = None
+) -> int:
+    """Downloads a magnet (blocks until the download is complete)."""
+    return worker.new_torrent_worker(
+        magnet,
+        download_dir,
+        timeout,
+        use_threads=False,
+        torrent_id=torrent_id,
+    )
+
+
+def read_magnets(source: str) -> List[str]:
+    """Reads magnets (one per line) from @source.
+
+    Blank lines and lines starting with '#' are ignored.
+
+    Args:
+        source: A file, a directory (every file in it is read), or '-'
+          (for stdin).
+    """
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        path = Path(source)
+        if path.is_dir():
+            files = sorted(p for p in path.iterdir() if p.is_file())
+        else:
+            files = [path]
+
+        lines = []
+        for f in files:
+            lines.extend(f.read_text().splitlines())
+
+    magnets = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            magnets.append(line)
+
+    return magnets
+
+
 def setup_env(vpn: str, download_dir: Path) -> None:
     log.info("Connecting to VPN and starting P2P client daemon...")
 
@@ -189,15 +286,64 @@ def setup_env(vpn: str, download_dir: Path) -> None:
     def teardown(cmd: str) -> None:
         atexit.register(lambda: sp.Popen(cmd, shell=True))
 
-    setup(f"PIA start {vpn}")
-    teardown("PIA stop")
+    def run_steps(
+        steps: Sequence[Tuple[str, str]], teardown_cmds: List[str]
+    ) -> None:
+        """Runs each (setup, teardown) step in @steps in order.
 
-    USER = getpass.getuser()
-    setup(f"sudo chown -R {USER}:{USER} {download_dir}")
-    teardown(f"sudo chown -R plex:plex {download_dir}")
+        The teardown command of each step that succeeds is appended to
+        @teardown_cmds.
+        """
+        for setup_cmd, teardown_cmd in steps:
+            setup(setup_cmd)
+            teardown_cmds.append(teardown_cmd)
 
-    setup("sudo -E deluged")
-    teardown("sudo killall deluged")
+    # Only the files downloaded during this session need their ownership
+    # fixed. Registered first, so that it runs after the teardowns below.
+    atexit.register(worker.fix_ownership)
 
-    setup("sudo -E deluge-web --fork")
-    teardown("sudo killall deluge-web")
+    USER = getpass.getuser()
+    # Each chain of steps is independent of the others, so the chains are run
+    # concurrently.
+    chains: List[List[Tuple[str, str]]] = [
+        # The P2P client daemon must not be started until we are connected
+        # to the VPN. It might also have outlived a previous (crashed)
+        # session, in which case we re-attach to any torrents it is still
+        # downloading.
+        [
+            (f"PIA start {vpn}", "PIA stop"),
+            ("pgrep -x deluged || sudo -E deluged", "sudo killall deluged"),
+        ],
+        [
+            (
+                f"sudo chown {USER}:{USER} {download_dir}",
+                f"sudo chown plex:plex {download_dir}",
+            )
+        ],
+        [
+            (
+                "pgrep -x deluge-web || sudo -E deluge-web --fork",
+                "sudo killall deluge-web",
+            )
+        ],
+    ]
+
+    teardown_cmd_lists: List[List[str]] = [[] for _ in chains]
+    error: Optional[sp.CalledProcessError] = None
+    with ThreadPoolExecutor(max_workers=len(chains)) as executor:
+        futures = [
+            executor.submit(run_steps, chain, teardown_cmds)
+            for chain, teardown_cmds in zip(chains, teardown_cmd_lists)
+        ]
+        for future in futures:
+            try:
+                future.result()
+            except sp.CalledProcessError as e:
+                error = e
+
+    for teardown_cmds in teardown_cmd_lists:
+        for cmd in teardown_cmds:
+            teardown(cmd)
+
+    if error is not None:
+        raise error
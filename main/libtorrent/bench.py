@@ -0,0 +1,374 @@
+"""Benchmark the torrent workers against a fake Deluge daemon.
+
+Each scenario downloads N (fake) torrents using the same code paths as the
+`torrent` command and reports how much work it took to notice that every
+torrent had finished: the number and cost of status polls, the CPU time we
+used, the number of `deluge-console` subprocesses we spawned, and how long it
+took us to notice that each torrent was complete.
+"""
+
+# pylint: disable=protected-access
+
+import collections
+from pathlib import Path
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Counter,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+import bugyi
+from bugyi import cli
+from loguru import logger as log
+
+from . import aio, deluge, fake_deluge, worker
+from .deluge import TorrentStatus
+from .fake_deluge import FakeSwarm
+from .journal import Journal
+from .poller import StatusPoller
+from .tracker import MagnetTracker
+
+
+DEFAULT_TORRENT_COUNTS = (1, 10, 100, 500)
+
+
+class Arguments(NamedTuple):
+    debug: bool
+    verbose: bool
+    torrent_counts: List[int]
+    client: str
+    engine: str
+    latency: float
+    queue_time: float
+    duration: float
+
+
+class Result(NamedTuple):
+    torrent_count: int
+    wall_time: float  # seconds
+    cpu_time: float  # seconds (including any child processes)
+    polls: int  # number of bulk status requests
+    poll_time: float  # total seconds spent waiting on status requests
+    requests: int  # total number of Deluge requests
+    subprocesses: int  # number of `deluge-console` processes spawned
+    detection_latencies: List[float]  # seconds (one per torrent)
+
+
+class FakeDaemonClient:
+    """In-process stand-in for `deluge.RPCClient`."""
+
+    def __init__(self, swarm: FakeSwarm, lock: threading.Lock) -> None:
+        self.swarm = swarm
+        self.lock = lock
+
+    def torrent_ids(self) -> List[str]:
+        return self._call(self.swarm.torrent_ids)
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        fields_by_id = self._call(self.swarm.statuses, ids)
+        return {
+            ID: TorrentStatus(
+                id=ID,
+                name=fields["name"],
+                state=fields["state"],
+                progress=fields["progress"],
+                download_rate=fields["download_payload_rate"],
+                upload_rate=fields["upload_payload_rate"],
+                total_done=fields["total_done"],
+                total_wanted=fields["total_wanted"],
+            )
+            for ID, fields in fields_by_id.items()
+        }
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        try:
+            return self._call(self.swarm.add, magnet, str(download_dir))
+        except ValueError as e:
+            raise deluge.DelugeError(str(e)) from e
+
+    def remove(self, ID: str) -> bool:
+        return self._call(self.swarm.remove, ID)
+
+    def close(self) -> None:
+        pass
+
+    def _call(self, func: Callable[..., Any], *args: Any) -> Any:
+        # Simulates the round trip to the daemon.
+        time.sleep(self.swarm.latency)
+        with self.lock:
+            return func(*args)
+
+
+class CountingClient:
+    """Wraps a Deluge client, counting (and timing) every request."""
+
+    def __init__(self, client: deluge.DelugeClient) -> None:
+        self.client = client
+
+        self.lock = threading.Lock()
+        self.calls: Counter[str] = collections.Counter()
+        self.seconds: Counter[str] = collections.Counter()
+
+    def torrent_ids(self) -> List[str]:
+        return self._call("torrent_ids")
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        return self._call("statuses", ids)
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        return self._call("add_magnet", magnet, download_dir)
+
+    def remove(self, ID: str) -> bool:
+        return self._call("remove", ID)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _call(self, method: str, *args: Any) -> Any:
+        start_time = time.monotonic()
+        try:
+            return getattr(self.client, method)(*args)
+        finally:
+            with self.lock:
+                self.calls[method] += 1
+                self.seconds[method] += time.monotonic() - start_time
+
+
+def main(argv: Sequence[str] = None) -> int:
+    if argv is None:
+        argv = sys.argv
+
+    args = parse_cli_args(argv)
+    bugyi.logging.configure(
+        "torrent_bench", debug=args.debug, verbose=args.verbose
+    )
+
+    # These would otherwise send a desktop notification per torrent.
+    finish_times: Dict[str, float] = {}
+    worker.notify = _notification_recorder(finish_times)  # type: ignore
+    aio.notify = lambda *_args, **_kwargs: None  # type: ignore
+
+    print(
+        f"client={args.client} engine={args.engine} latency={args.latency}s"
+        f" queue_time={args.queue_time}s duration={args.duration}s"
+    )
+    print(
+        f"{'torrents':>8} {'wall':>8} {'cpu':>8} {'polls':>6} {'poll_s':>8}"
+        f" {'reqs':>6} {'procs':>6} {'detect_avg':>10} {'detect_max':>10}"
+    )
+    for torrent_count in args.torrent_counts:
+        finish_times.clear()
+        result = run_scenario(torrent_count, args, finish_times)
+        latencies = result.detection_latencies
+        print(
+            f"{result.torrent_count:>8} {result.wall_time:>8.2f}"
+            f" {result.cpu_time:>8.2f} {result.polls:>6}"
+            f" {result.poll_time:>8.2f} {result.requests:>6}"
+            f" {result.subprocesses:>6}"
+            f" {statistics.mean(latencies):>10.2f}"
+            f" {max(latencies):>10.2f}",
+            flush=True,
+        )
+
+    return 0
+
+
+def parse_cli_args(argv: Sequence[str]) -> Arguments:
+    parser = cli.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "torrent_counts",
+        nargs="*",
+        type=int,
+        default=list(DEFAULT_TORRENT_COUNTS),
+        metavar="N",
+        help=(
+            "Run a scenario with N fake torrents. Defaults to"
+            f" {' '.join(map(str, DEFAULT_TORRENT_COUNTS))}."
+        ),
+    )
+    parser.add_argument(
+        "--client",
+        choices=("rpc", "console"),
+        default="rpc",
+        help=(
+            "Talk to the fake daemon over (fake) RPC or by spawning fake"
+            " deluge-console processes. Defaults to '%(default)s'."
+        ),
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("threads", "async"),
+        default="threads",
+        help="The execution engine to use. Defaults to '%(default)s'.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help=(
+            "How long (in seconds) each fake Deluge request takes."
+            " Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--queue-time",
+        type=float,
+        default=0,
+        help=(
+            "How long (in seconds) each fake torrent is queued before it"
+            " starts downloading. Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10,
+        help=(
+            "How long (in seconds) it takes to download each fake torrent."
+            " Defaults to %(default)s."
+        ),
+    )
+
+    args = parser.parse_args(argv[1:])
+    return Arguments(**dict(args._get_kwargs()))
+
+
+def run_scenario(
+    torrent_count: int, args: Arguments, finish_times: Dict[str, float]
+) -> Result:
+    """Downloads @torrent_count fake torrents.
+
+    Args:
+        finish_times: Maps torrent names to the (wall-clock) time at which we
+          noticed that they were finished. Filled in by our fake `notify()`.
+    """
+    swarm = FakeSwarm(
+        latency=args.latency,
+        queue_time=args.queue_time,
+        duration=args.duration,
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        state_file = Path(tmpdir) / "swarm.json"
+        fake_deluge.save_swarm(swarm, state_file)
+
+        client = CountingClient(_new_pool(args.client, swarm, state_file))
+        _reset_worker(client, Path(tmpdir) / "journal")
+
+        magnets = [
+            f"magnet:?xt=urn:btih:{i:040x}&dn=bench-{i}&tr=fake"
+            for i in range(1, torrent_count + 1)
+        ]
+        download_dir = Path(tmpdir) / "downloads"
+
+        start_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start_cpu_time = time.process_time()
+        start_time = time.monotonic()
+
+        _download(magnets, download_dir, args.engine)
+
+        wall_time = time.monotonic() - start_time
+        end_rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time = (
+            time.process_time()
+            - start_cpu_time
+            + end_rusage.ru_utime
+            - start_rusage.ru_utime
+            + end_rusage.ru_stime
+            - start_rusage.ru_stime
+        )
+
+        if args.client == "console":
+            with fake_deluge.locked_swarm(state_file) as swarm:
+                subprocesses = swarm.invocations
+        else:
+            subprocesses = 0
+
+    detection_latencies = [
+        detected_time - swarm.finish_time(name)
+        for name, detected_time in finish_times.items()
+    ]
+    return Result(
+        torrent_count=torrent_count,
+        wall_time=wall_time,
+        cpu_time=cpu_time,
+        polls=client.calls["statuses"],
+        poll_time=client.seconds["statuses"],
+        requests=sum(client.calls.values()),
+        subprocesses=subprocesses,
+        detection_latencies=detection_latencies,
+    )
+
+
+def _new_pool(
+    client: str, swarm: FakeSwarm, state_file: Path
+) -> deluge.ClientPool:
+    if client == "rpc":
+        lock = threading.Lock()
+        return deluge.ClientPool(lambda: FakeDaemonClient(swarm, lock))
+
+    def refuse_connection() -> deluge.DelugeClient:
+        raise deluge.DelugeConnectionError("The fake daemon only has a CLI.")
+
+    console = deluge.ConsoleClient(
+        [sys.executable, fake_deluge.__file__, str(state_file)]
+    )
+    return deluge.ClientPool(refuse_connection, fallback=console)
+
+
+def _reset_worker(client: deluge.DelugeClient, journal_path: Path) -> None:
+    """Points the worker module at @client and clears its state."""
+    worker._deluge = client  # type: ignore
+    worker._poller = StatusPoller(client)
+    worker._journal = Journal(journal_path)
+    worker._magnet_queue = worker.queue.Queue()
+    worker._TorrentWorker.magnet_tracker = MagnetTracker()
+
+
+def _download(magnets: List[str], download_dir: Path, engine: str) -> None:
+    """Blocks until every magnet in @magnets has been downloaded."""
+    if engine == "async":
+        async_engine = aio.AsyncEngine()
+        worker.enqueue_magnets(
+            magnets, download_dir, 0, start=async_engine.submit
+        )
+        async_engine.run()
+        return
+
+    worker.enqueue_magnets(magnets, download_dir, 0)
+    with worker._TorrentWorker.magnet_tracker.all_work_is_done:
+        pass
+
+    # Wait for every worker to remove its torrent from the fake daemon.
+    worker._magnet_queue.join()
+
+
+def _notification_recorder(
+    finish_times: Dict[str, float]
+) -> Callable[..., None]:
+    """Returns a fake `notify()` which records when each torrent finished."""
+
+    def notify(msg: str, **_kwargs: Any) -> None:
+        match = re.match(r'Finished Downloading "(.*)"\.', msg)
+        if match:
+            finish_times[match.group(1)] = time.time()
+        else:
+            log.debug("Notification: {}", msg)
+
+    return notify
@@ -0,0 +1,448 @@
+"""Clients used to talk to the Deluge daemon (deluged).
+
+The preferred client speaks Deluge's RPC protocol over a long-lived
+connection. If that is not possible (e.g. the `deluge-client` package is not
+installed or the daemon refuses our connection), we fall back to shelling out
+to `deluge-console`.
+"""
+
+import os
+from pathlib import Path
+import re
+import subprocess as sp
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from loguru import logger as log
+import prometheus_client as pc
+
+
+try:
+    from deluge_client import LocalDelugeRPCClient
+    from deluge_client.client import RemoteException
+except ImportError:
+    LocalDelugeRPCClient = None  # pylint: disable=invalid-name
+    RemoteException = Exception  # type: ignore
+
+
+try:
+    from typing import Protocol
+except ImportError:
+    Protocol = object  # type: ignore
+
+
+DEFAULT_CONSOLE_CMD = ("sudo", "-E", "deluge-console")
+DEFAULT_POOL_SIZE = 4
+DEFAULT_RPC_HOST = "127.0.0.1"
+DEFAULT_RPC_PORT = 58846
+
+# How long (in seconds) to wait before we try to open a new RPC connection
+# after our last attempt failed.
+RPC_RETRY_DELAY = 60
+
+error_count = pc.Counter(
+    "torrent_deluge_error_count",
+    "Count of failed requests made to the Deluge daemon.",
+    ["client"],
+)
+error_count.labels("rpc")
+error_count.labels("console")
+
+
+class DelugeError(Exception):
+    """Raised when the Deluge daemon fails to carry out a request."""
+
+
+class DelugeConnectionError(DelugeError):
+    """Raised when we are unable to communicate with the Deluge daemon."""
+
+
+class TorrentStatus(NamedTuple):
+    id: str
+    name: str
+    state: str
+    progress: float  # percent complete (0-100)
+    download_rate: float  # bytes per second
+    upload_rate: float  # bytes per second
+    total_done: int  # bytes
+    total_wanted: int  # bytes
+
+
+class DelugeClient(Protocol):
+    """Type protocol satisfied by every Deluge client."""
+
+    def torrent_ids(self) -> List[str]:
+        """Returns the IDs of all torrents (most recently added first)."""
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        """Returns the status of every torrent whose ID is in @ids.
+
+        The status of ALL torrents is returned if @ids is None.
+        """
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        """Adds @magnet to Deluge's download queue.
+
+        Returns:
+            The new torrent's ID (if the client is able to determine it).
+        """
+
+    def remove(self, ID: str) -> bool:
+        """Removes the torrent specified by @ID from Deluge.
+
+        Returns:
+            True if the torrent was removed and False otherwise.
+        """
+
+    def close(self) -> None:
+        """Releases any resources held by this client."""
+
+
+class RPCClient:
+    """Deluge client which talks to deluged using Deluge's RPC protocol."""
+
+    STATUS_KEYS = [
+        "name",
+        "state",
+        "progress",
+        "download_payload_rate",
+        "upload_payload_rate",
+        "total_done",
+        "total_wanted",
+    ]
+
+    def __init__(
+        self, host: str, port: int, username: str = "", password: str = ""
+    ) -> None:
+        if LocalDelugeRPCClient is None:
+            raise DelugeConnectionError(
+                "The 'deluge-client' package is not installed."
+            )
+
+        self._client = LocalDelugeRPCClient(
+            host, port, username, password, decode_utf8=True
+        )
+        self._call("connect")
+
+    @classmethod
+    def from_env(cls) -> "RPCClient":
+        """Constructs a new RPCClient using environment variables.
+
+        The DELUGE_{HOST,PORT,USERNAME,PASSWORD} environment variables are
+        used when set. Deluge's local credentials are used otherwise.
+        """
+        return cls(
+            os.environ.get("DELUGE_HOST", DEFAULT_RPC_HOST),
+            int(os.environ.get("DELUGE_PORT", DEFAULT_RPC_PORT)),
+            os.environ.get("DELUGE_USERNAME", ""),
+            os.environ.get("DELUGE_PASSWORD", ""),
+        )
+
+    def torrent_ids(self) -> List[str]:
+        torrents = self._call(
+            "call", "core.get_torrents_status", {}, ["time_added"]
+        )
+        return sorted(
+            torrents, key=lambda ID: torrents[ID]["time_added"], reverse=True
+        )
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        filter_dict = {} if ids is None else {"id": list(ids)}
+        torrents = self._call(
+            "call", "core.get_torrents_status", filter_dict, self.STATUS_KEYS
+        )
+        return {
+            ID: TorrentStatus(
+                id=ID,
+                name=fields["name"],
+                state=fields["state"],
+                progress=float(fields["progress"]),
+                download_rate=float(fields["download_payload_rate"]),
+                upload_rate=float(fields["upload_payload_rate"]),
+                total_done=int(fields["total_done"]),
+                total_wanted=int(fields["total_wanted"]),
+            )
+            for ID, fields in torrents.items()
+        }
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        options = {"download_location": str(download_dir)}
+        return self._call("call", "core.add_torrent_magnet", magnet, options)
+
+    def remove(self, ID: str) -> bool:
+        try:
+            return bool(self._call("call", "core.remove_torrent", ID, False))
+        except DelugeConnectionError:
+            raise
+        except DelugeError:
+            return False
+
+    def close(self) -> None:
+        try:
+            self._client.disconnect()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    def _call(self, attr: str, *args: Any) -> Any:
+        try:
+            return getattr(self._client, attr)(*args)
+        except RemoteException as e:
+            error_count.labels("rpc").inc()
+            raise DelugeError(f"Deluge RPC call failed: {e}") from e
+        except Exception as e:
+            error_count.labels("rpc").inc()
+            raise DelugeConnectionError(
+                f"Lost connection to the Deluge daemon: {e!r}"
+            ) from e
+
+
+class ConsoleClient:
+    """Deluge client which shells out to the `deluge-console` command."""
+
+    def __init__(self, cmd: Sequence[str] = None) -> None:
+        if cmd is None:
+            cmd = DEFAULT_CONSOLE_CMD
+
+        self.cmd = list(cmd)
+
+    def torrent_ids(self) -> List[str]:
+        return list(self.statuses())
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        id_list = [] if ids is None else list(ids)
+        if ids is not None and not id_list:
+            return {}
+
+        out = self._run(
+            "info", "--detailed", "--sort-reverse=time_added", *id_list
+        )
+        return parse_console_info(out)
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        self._run("add", "--path", str(download_dir), magnet)
+        return None
+
+    def remove(self, ID: str) -> bool:
+        try:
+            self._run("rm", "--confirm", ID)
+        except DelugeError:
+            return False
+        else:
+            return True
+
+    def close(self) -> None:
+        pass
+
+    def _run(self, *args: str) -> str:
+        cmd_list = self.cmd + list(args)
+        try:
+            out = sp.check_output(cmd_list)
+        except (OSError, sp.CalledProcessError) as e:
+            error_count.labels("console").inc()
+            raise DelugeError(
+                f"The following command failed: {cmd_list!r}"
+            ) from e
+
+        return out.decode()
+
+
+class ClientPool:
+    """Thread-Safe Pool of Long-Lived Deluge Clients
+
+    Clients are created on demand using @factory (at most @size of them are
+    ever open at once). Whenever a client cannot be created or loses its
+    connection, requests are serviced by the @fallback client instead.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], DelugeClient],
+        *,
+        size: int = DEFAULT_POOL_SIZE,
+        fallback: DelugeClient = None,
+    ) -> None:
+        if fallback is None:
+            fallback = ConsoleClient()
+
+        self.factory = factory
+        self.size = size
+        self.fallback = fallback
+
+        self._cond = threading.Condition()
+        self._idle: List[DelugeClient] = []
+        self._open_count = 0
+        self._last_failure: Optional[float] = None
+
+    def torrent_ids(self) -> List[str]:
+        return self.call("torrent_ids")
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        return self.call("statuses", None if ids is None else list(ids))
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        return self.call("add_magnet", magnet, download_dir)
+
+    def remove(self, ID: str) -> bool:
+        return self.call("remove", ID)
+
+    def close(self) -> None:
+        with self._cond:
+            idle_clients = self._idle
+            self._idle = []
+            self._open_count -= len(idle_clients)
+
+        for client in idle_clients:
+            client.close()
+
+    def call(self, method: str, *args: Any) -> Any:
+        """Calls @method on a pooled client (or the fallback client)."""
+        client = self._acquire()
+        if client is None:
+            return getattr(self.fallback, method)(*args)
+
+        try:
+            result = getattr(client, method)(*args)
+        except DelugeConnectionError as e:
+            log.warning(
+                "Falling back to {}: {}", type(self.fallback).__name__, e
+            )
+            self._discard(client)
+            return getattr(self.fallback, method)(*args)
+        except BaseException:
+            self._release(client)
+            raise
+        else:
+            self._release(client)
+            return result
+
+    def _acquire(self) -> Optional[DelugeClient]:
+        """Returns an idle client (or None if no client could be created)."""
+        with self._cond:
+            while not self._idle and self._open_count >= self.size:
+                self._cond.wait()
+
+            if self._idle:
+                return self._idle.pop()
+
+            if (
+                self._last_failure is not None
+                and time.monotonic() - self._last_failure < RPC_RETRY_DELAY
+            ):
+                return None
+
+            self._open_count += 1
+
+        try:
+            client = self.factory()
+        except DelugeError as e:
+            log.debug("Unable to open a new Deluge connection: {}", e)
+            self._forget_client()
+            return None
+
+        with self._cond:
+            self._last_failure = None
+
+        return client
+
+    def _release(self, client: DelugeClient) -> None:
+        with self._cond:
+            self._idle.append(client)
+            self._cond.notify()
+
+    def _discard(self, client: DelugeClient) -> None:
+        client.close()
+        self._forget_client()
+
+    def _forget_client(self) -> None:
+        with self._cond:
+            self._open_count -= 1
+            self._last_failure = time.monotonic()
+            self._cond.notify()
+
+
+def parse_console_info(out: str) -> Dict[str, TorrentStatus]:
+    """Parses the output of the `deluge-console info --detailed` command.
+
+    Examples:
+        >>> out = '''
+        ... Name: foo
+        ... ID: abc123
+        ... State: Downloading Down Speed: 1.0 MiB/s Up Speed: 2.0 KiB/s
+        ... Size: 512.0 KiB/1.0 MiB Ratio: 0.000
+        ... Progress: 50.00% [#####~~~~~]
+        ... '''
+        >>> parse_console_info(out)["abc123"]
+        TorrentStatus(id='abc123', name='foo', state='Downloading',
+        progress=50.0, download_rate=1048576.0, upload_rate=2048.0,
+        total_done=524288, total_wanted=1048576)
+    """
+    statuses = {}
+    for chunk in re.split(r"^(?=Name: )", out, flags=re.MULTILINE):
+        ID = _search(r"^ID: (\S+)", chunk)
+        if ID is None:
+            continue
+
+        size_match = re.search(
+            r"^Size: ([\d.]+ \S+)/([\d.]+ \S+)", chunk, re.MULTILINE
+        )
+        if size_match:
+            total_done = int(_parse_size(size_match.group(1)))
+            total_wanted = int(_parse_size(size_match.group(2)))
+        else:
+            total_done = total_wanted = 0
+
+        statuses[ID] = TorrentStatus(
+            id=ID,
+            name=_search(r"^Name: (.*)$", chunk) or "",
+            state=_search(r"^State: (\S+)", chunk) or "",
+            progress=float(_search(r"^Progress: ([\d.]+)%", chunk) or 0),
+            download_rate=_parse_size(
+                _search(r"Down Speed: ([\d.]+ \S+)/s", chunk)
+            ),
+            upload_rate=_parse_size(
+                _search(r"Up Speed: ([\d.]+ \S+)/s", chunk)
+            ),
+            total_done=total_done,
+            total_wanted=total_wanted,
+        )
+    return statuses
+
+
+def _search(pattern: str, string: str) -> Optional[str]:
+    match = re.search(pattern, string, re.MULTILINE)
+    return None if match is None else match.group(1)
+
+
+def _parse_size(size: Optional[str]) -> float:
+    """
+    Examples:
+        >>> _parse_size("1.5 KiB")
+        1536.0
+
+        >>> _parse_size(None)
+        0.0
+    """
+    if size is None:
+        return 0.0
+
+    units = {"B": 0, "KiB": 1, "MiB": 2, "GiB": 3, "TiB": 4}
+    number, unit = size.split()
+    return float(number) * 1024 ** units.get(unit, 0)
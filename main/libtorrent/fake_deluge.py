@@ -0,0 +1,254 @@
+"""Scriptable stand-in for the Deluge daemon and `deluge-console`.
+
+Used by `libtorrent.bench` to simulate a swarm of torrents without
+downloading anything. Every torrent sits in the "Queued" state for
+`queue_time` seconds after it is added, downloads for `duration` seconds, and
+then starts seeding.
+
+The swarm's state is kept in a JSON file, so that it can be shared by every
+fake `deluge-console` process. This module can be run as a script that
+emulates `deluge-console`:
+
+    python fake_deluge.py STATE_FILE info --detailed [ID ...]
+    python fake_deluge.py STATE_FILE add --path DIR MAGNET
+    python fake_deluge.py STATE_FILE rm --confirm ID
+
+Only the standard library is used here, so that each fake `deluge-console`
+process starts up quickly.
+"""
+
+import contextlib
+import fcntl
+import json
+from pathlib import Path
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+DEFAULT_SIZE = 1024 ** 3  # In bytes
+
+
+class FakeSwarm:
+    """The torrents known to a fake Deluge daemon.
+
+    All timestamps are wall-clock times, since they are shared between
+    processes.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0,
+        queue_time: float = 0,
+        duration: float = 10,
+        size: int = DEFAULT_SIZE,
+    ) -> None:
+        self.latency = latency
+        self.queue_time = queue_time
+        self.duration = duration
+        self.size = size
+
+        self.torrents: Dict[str, Dict[str, Any]] = {}
+        # Maps the name of every torrent ever added to the time it was added.
+        self.history: Dict[str, float] = {}
+        self.invocations = 0  # number of fake `deluge-console` processes
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FakeSwarm":
+        swarm = cls(
+            latency=data["latency"],
+            queue_time=data["queue_time"],
+            duration=data["duration"],
+            size=data["size"],
+        )
+        swarm.torrents = data["torrents"]
+        swarm.history = data["history"]
+        swarm.invocations = data["invocations"]
+        return swarm
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency,
+            "queue_time": self.queue_time,
+            "duration": self.duration,
+            "size": self.size,
+            "torrents": self.torrents,
+            "history": self.history,
+            "invocations": self.invocations,
+        }
+
+    def add(self, magnet: str, download_dir: str) -> str:
+        """Adds @magnet to the swarm and returns its ID (i.e. infohash)."""
+        match = re.search(r"xt=urn:btih:([0-9a-fA-F]{40})", magnet)
+        if match is None:
+            raise ValueError(f"Fake magnets need a hex infohash: {magnet}")
+
+        ID = match.group(1).lower()
+        if ID in self.torrents:
+            raise ValueError(f"Torrent is already in session: {ID}")
+
+        name_match = re.search(r"&dn=([^&]*)", magnet)
+        name = ID if name_match is None else name_match.group(1)
+        time_added = time.time()
+        self.torrents[ID] = {
+            "name": name,
+            "download_dir": download_dir,
+            "time_added": time_added,
+        }
+        self.history[name] = time_added
+        return ID
+
+    def remove(self, ID: str) -> bool:
+        return self.torrents.pop(ID, None) is not None
+
+    def torrent_ids(self) -> List[str]:
+        return sorted(
+            self.torrents,
+            key=lambda ID: self.torrents[ID]["time_added"],
+            reverse=True,
+        )
+
+    def finish_time(self, name: str) -> float:
+        """Returns the time at which the torrent named @name finished (or will
+        finish) downloading.
+        """
+        return self.history[name] + self.queue_time + self.duration
+
+    def status(self, ID: str, now: float = None) -> Dict[str, Any]:
+        """Returns @ID's status (using the same keys as Deluge's RPC API)."""
+        if now is None:
+            now = time.time()
+
+        torrent = self.torrents[ID]
+        elapsed = now - torrent["time_added"] - self.queue_time
+        if elapsed < 0:
+            state, done, rate = "Queued", 0, 0.0
+        elif elapsed < self.duration:
+            rate = self.size / self.duration
+            state, done = "Downloading", int(elapsed * rate)
+        else:
+            state, done, rate = "Seeding", self.size, 0.0
+
+        return {
+            "name": torrent["name"],
+            "state": state,
+            "progress": 100 * done / self.size,
+            "download_payload_rate": rate,
+            "upload_payload_rate": 0.0,
+            "total_done": done,
+            "total_wanted": self.size,
+            "time_added": torrent["time_added"],
+        }
+
+    def statuses(
+        self, ids: Iterable[str] = None, now: float = None
+    ) -> Dict[str, Dict[str, Any]]:
+        if now is None:
+            now = time.time()
+
+        if ids is None:
+            ids = self.torrent_ids()
+
+        return {
+            ID: self.status(ID, now) for ID in ids if ID in self.torrents
+        }
+
+
+@contextlib.contextmanager
+def locked_swarm(state_file: Path) -> Iterator[FakeSwarm]:
+    """Loads the swarm from @state_file and saves it again afterwards.
+
+    The state file is locked in the meantime.
+    """
+    with state_file.open("r+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        swarm = FakeSwarm.from_dict(json.load(f))
+        yield swarm
+
+        f.seek(0)
+        f.truncate()
+        json.dump(swarm.to_dict(), f)
+
+
+def save_swarm(swarm: FakeSwarm, state_file: Path) -> None:
+    state_file.write_text(json.dumps(swarm.to_dict()))
+
+
+def format_info(
+    swarm: FakeSwarm, ids: Sequence[str], now: float = None
+) -> str:
+    """Emulates the output of `deluge-console info --detailed`.
+
+    Examples:
+        >>> swarm = FakeSwarm(duration=10, size=2048)
+        >>> ID = swarm.add("magnet:?xt=urn:btih:" + 40 * "a" + "&dn=foo", "")
+        >>> now = swarm.torrents[ID]["time_added"] + 5
+        >>> print(format_info(swarm, [ID], now=now))
+        Name: foo
+        ID: aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa
+        State: Downloading Down Speed: 0.2 KiB/s Up Speed: 0.0 KiB/s
+        Size: 1.0 KiB/2.0 KiB Ratio: 0.000
+        Progress: 50.00% [#####~~~~~]
+        <BLANKLINE>
+    """
+
+    def kib(size: float) -> str:
+        return f"{size / 1024:.1f} KiB"
+
+    chunks = []
+    for ID, status in swarm.statuses(ids, now).items():
+        bars = int(status["progress"] // 10)
+        chunks.append(
+            f"Name: {status['name']}\n"
+            f"ID: {ID}\n"
+            f"State: {status['state']}"
+            f" Down Speed: {kib(status['download_payload_rate'])}/s"
+            f" Up Speed: {kib(status['upload_payload_rate'])}/s\n"
+            f"Size: {kib(status['total_done'])}/{kib(status['total_wanted'])}"
+            " Ratio: 0.000\n"
+            f"Progress: {status['progress']:.2f}%"
+            f" [{'#' * bars}{'~' * (10 - bars)}]\n"
+        )
+
+    return "\n".join(chunks)
+
+
+def console_main(argv: Sequence[str]) -> int:
+    """Emulates the `deluge-console` command."""
+    state_file = Path(argv[1])
+    cmd, *args = argv[2:]
+    positional = [arg for arg in args if not arg.startswith("--")]
+
+    with locked_swarm(state_file) as swarm:
+        swarm.invocations += 1
+        latency = swarm.latency
+
+        out: Optional[str] = ""
+        if cmd == "info":
+            out = format_info(swarm, positional or swarm.torrent_ids())
+        elif cmd == "add":
+            download_dir, magnet = positional[-2:]
+            try:
+                swarm.add(magnet, download_dir)
+            except ValueError as e:
+                out = None
+                print(e, file=sys.stderr)
+        elif cmd == "rm":
+            if not swarm.remove(positional[-1]):
+                out = None
+        else:
+            print(f"Unknown command: {cmd}", file=sys.stderr)
+            out = None
+
+    time.sleep(latency)
+    if out is None:
+        return 1
+
+    print(out, end="")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(console_main(sys.argv))
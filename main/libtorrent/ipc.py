@@ -0,0 +1,151 @@
+"""Unix domain socket API used to hand magnets to the primary instance.
+
+Each connection carries a single newline-terminated JSON request of the form
+{"magnets": [...], "download_dir": "...", "timeout": ...}. The server replies
+with {"keys": [...]}, where each key is the magnet tracker key assigned to the
+corresponding magnet, or with {"error": "..."} if the request was invalid.
+"""
+
+import json
+from pathlib import Path
+import socket
+import socketserver
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+from bugyi import xdg
+from loguru import logger as log
+
+
+SOCKET_FILE = xdg.init_full_dir("data") / "socket"
+
+# How long (in seconds) a client will keep trying to connect to the primary
+# instance (which might still be starting up).
+CONNECT_TIMEOUT = 30
+
+# Takes a batch of magnets, a download directory, and a timeout. Returns the
+# tracker key assigned to each magnet.
+Submitter = Callable[[Sequence[str], Path, float], List[int]]
+
+
+class EnqueueServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    """Accepts magnets from other `torrent` instances.
+
+    Every connection is handled in its own thread, so concurrent submissions
+    are never lost.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, submit: Submitter) -> None:
+        self.path = path
+        self.submit = submit
+
+        # Only the primary instance (which holds the PID file) ever starts a
+        # server, so any existing socket file must be stale.
+        if path.exists():
+            path.unlink()
+
+        super().__init__(str(path), _EnqueueHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class _EnqueueHandler(socketserver.StreamRequestHandler):
+    server: EnqueueServer
+
+    def handle(self) -> None:
+        response: Dict[str, Any]
+        try:
+            request = json.loads(self.rfile.readline())
+            magnets = request["magnets"]
+            if isinstance(magnets, str):
+                magnets = [magnets]
+
+            if not all(isinstance(magnet, str) for magnet in magnets):
+                raise TypeError("Every magnet must be a string.")
+
+            download_dir = Path(request["download_dir"])
+            timeout = float(request["timeout"])
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("Received an invalid enqueue request: {!r}", e)
+            response = {"error": f"Invalid request: {e!r}"}
+        else:
+            log.debug("Received {} magnet(s) over socket.", len(magnets))
+            try:
+                keys = self.server.submit(magnets, download_dir, timeout)
+            except Exception as e:  # pylint: disable=broad-except
+                # The client should be told why its magnets were rejected.
+                log.exception("Failed to enqueue {} magnet(s).", len(magnets))
+                response = {"error": f"Failed to enqueue magnets: {e!r}"}
+            else:
+                response = {"keys": keys}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def serve(submit: Submitter, *, path: Path = SOCKET_FILE) -> EnqueueServer:
+    """Starts an EnqueueServer in a background (daemon) thread."""
+    server = EnqueueServer(path, submit)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    log.debug(f"Listening for new magnets on {path}.")
+    return server
+
+
+def send_magnets(
+    magnets: Sequence[str],
+    download_dir: Path,
+    timeout: float,
+    *,
+    path: Path = SOCKET_FILE,
+) -> List[int]:
+    """Hands @magnets to the primary instance.
+
+    Returns:
+        The magnet tracker keys assigned to @magnets (in the same order).
+    """
+    request = {
+        "magnets": list(magnets),
+        "download_dir": str(download_dir),
+        "timeout": timeout,
+    }
+
+    with _connect(path) as sock:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+
+    if not line:
+        raise RuntimeError(
+            "The primary torrent instance closed the connection without"
+            " acknowledging our request."
+        )
+
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+
+    return response["keys"]
+
+
+def _connect(path: Path) -> socket.socket:
+    start_time = time.monotonic()
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(path))
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if time.monotonic() - start_time > CONNECT_TIMEOUT:
+                raise
+
+            time.sleep(0.1)
+        else:
+            return sock
@@ -0,0 +1,139 @@
+"""Crash-safe journal of torrent queue events.
+
+Every event (a magnet was enqueued, its download started, or it finished) is
+appended to the journal as a single JSON line and flushed to disk before we
+move on. If the `torrent` process dies, the jobs that were still in-flight
+can be recovered by replaying the journal on startup.
+"""
+
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from bugyi import xdg
+from loguru import logger as log
+
+
+JOURNAL_FILE = xdg.init_full_dir("data") / "journal"
+
+
+class Job(NamedTuple):
+    key: int
+    magnet: str
+    download_dir: Path
+    timeout: float
+    torrent_id: Optional[str] = None
+
+
+class Journal:
+    """Thread-Safe, Append-Only Log of Torrent Queue Events
+
+    Events are keyed by magnet tracker key. Since a new process starts
+    counting keys from zero again, callers must make sure that new keys do
+    not collide with the keys of the jobs returned by `replay()`.
+    """
+
+    def __init__(self, path: Path = JOURNAL_FILE) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+
+    def enqueued(
+        self, key: int, magnet: str, download_dir: Path, timeout: float
+    ) -> None:
+        self._append(
+            event="enqueued",
+            key=key,
+            magnet=magnet,
+            download_dir=str(download_dir),
+            timeout=timeout,
+        )
+
+    def started(self, key: int, torrent_id: str) -> None:
+        self._append(event="started", key=key, torrent_id=torrent_id)
+
+    def finished(self, key: int) -> None:
+        self._append(event="finished", key=key)
+
+    def replay(self) -> List[Job]:
+        """Returns every job which was enqueued but never finished.
+
+        The journal is also compacted, so it only contains events belonging
+        to these jobs.
+        """
+        with self.lock:
+            jobs = self._read_pending_jobs()
+            self._rewrite(jobs)
+
+        return sorted(jobs.values())
+
+    def _append(self, **event: Any) -> None:
+        line = json.dumps(event) + "\n"
+        with self.lock:
+            with self.path.open("a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_events(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+
+        events = []
+        with self.path.open() as f:
+            for i, line in enumerate(f, start=1):
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # This can happen if we crashed in the middle of a write.
+                    log.warning(
+                        "Skipping corrupted line #{} of journal: {!r}", i, line
+                    )
+
+        return events
+
+    def _read_pending_jobs(self) -> Dict[int, Job]:
+        jobs: Dict[int, Job] = {}
+        for event in self._read_events():
+            key = event["key"]
+            if event["event"] == "enqueued":
+                jobs[key] = Job(
+                    key,
+                    event["magnet"],
+                    Path(event["download_dir"]),
+                    event["timeout"],
+                )
+            elif event["event"] == "started" and key in jobs:
+                jobs[key] = jobs[key]._replace(torrent_id=event["torrent_id"])
+            elif event["event"] == "finished":
+                jobs.pop(key, None)
+
+        return jobs
+
+    def _rewrite(self, jobs: Dict[int, Job]) -> None:
+        """Atomically replaces the journal with the events of @jobs."""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            for job in sorted(jobs.values()):
+                enqueued = {
+                    "event": "enqueued",
+                    "key": job.key,
+                    "magnet": job.magnet,
+                    "download_dir": str(job.download_dir),
+                    "timeout": job.timeout,
+                }
+                f.write(json.dumps(enqueued) + "\n")
+
+                if job.torrent_id is not None:
+                    started = {
+                        "event": "started",
+                        "key": job.key,
+                        "torrent_id": job.torrent_id,
+                    }
+                    f.write(json.dumps(started) + "\n")
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
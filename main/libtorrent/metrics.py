@@ -0,0 +1,95 @@
+"""Prometheus metrics exported by the `torrent` daemon.
+
+Failed Deluge requests are counted by `deluge.error_count`.
+"""
+
+import threading
+from typing import Dict, Tuple
+
+import prometheus_client as pc
+
+from .deluge import TorrentStatus
+
+
+PROMETHEUS_METRICS_PORT = 9102
+
+TORRENT_LABELS = ["id", "name"]
+
+download_rate = pc.Gauge(
+    "torrent_download_rate_bytes",
+    "The download rate of each torrent (in bytes per second).",
+    TORRENT_LABELS,
+)
+upload_rate = pc.Gauge(
+    "torrent_upload_rate_bytes",
+    "The upload rate of each torrent (in bytes per second).",
+    TORRENT_LABELS,
+)
+bytes_remaining = pc.Gauge(
+    "torrent_bytes_remaining",
+    "The number of bytes each torrent has left to download.",
+    TORRENT_LABELS,
+)
+state = pc.Gauge(
+    "torrent_state",
+    "Set to 1 for the current state of each torrent.",
+    TORRENT_LABELS + ["state"],
+)
+worker_count = pc.Gauge(
+    "torrent_worker_count", "The number of active torrent workers."
+)
+download_time = pc.Summary(
+    "torrent_download_time",
+    "The amount of time it took to download each torrent.",
+)
+poll_time = pc.Summary(
+    "torrent_poll_time",
+    "The round-trip time of each (bulk) torrent status request.",
+)
+
+# Maps torrent IDs to the label values of each torrent's state gauge.
+_state_labels: Dict[str, Tuple[str, str, str]] = {}
+_state_lock = threading.Lock()
+
+
+def serve(port: int = PROMETHEUS_METRICS_PORT) -> None:
+    """Starts serving metrics over HTTP (from a daemon thread)."""
+    pc.start_http_server(port)
+
+
+def record_status(name: str, status: TorrentStatus) -> None:
+    """Updates the per-torrent metrics using @status.
+
+    Args:
+        name: A human-readable name for the torrent.
+    """
+    ID = status.id
+    download_rate.labels(ID, name).set(status.download_rate)
+    upload_rate.labels(ID, name).set(status.upload_rate)
+    bytes_remaining.labels(ID, name).set(
+        max(status.total_wanted - status.total_done, 0)
+    )
+
+    labels = (ID, name, status.state)
+    with _state_lock:
+        old_labels = _state_labels.get(ID)
+        if old_labels != labels:
+            if old_labels is not None:
+                state.remove(*old_labels)
+
+            state.labels(*labels).set(1)
+            _state_labels[ID] = labels
+
+
+def forget_torrent(ID: str, name: str) -> None:
+    """Stops exporting the per-torrent metrics of the torrent with ID @ID."""
+    for gauge in [download_rate, upload_rate, bytes_remaining]:
+        try:
+            gauge.remove(ID, name)
+        except KeyError:
+            pass
+
+    with _state_lock:
+        old_labels = _state_labels.pop(ID, None)
+        if old_labels is not None:
+            state.remove(*old_labels)
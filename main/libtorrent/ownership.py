@@ -0,0 +1,54 @@
+"""Ownership fix-ups for the files downloaded by the P2P client.
+
+The P2P client daemon runs as root, so everything it downloads is owned by
+root. Instead of recursively chown-ing the entire media library, we keep
+track of the files that this session actually downloaded and only fix the
+ownership of those.
+"""
+
+from pathlib import Path
+import subprocess as sp
+import threading
+from typing import Iterable, Set
+
+from loguru import logger as log
+
+
+MEDIA_OWNER = "plex:plex"
+
+
+class OwnershipTracker:
+    """Thread-Safe Set of Downloaded Paths Whose Ownership Needs Fixing"""
+
+    def __init__(self, owner: str = MEDIA_OWNER) -> None:
+        self.owner = owner
+
+        self.lock = threading.Lock()
+        self.pending: Set[Path] = set()
+
+    def add(self, path: Path) -> None:
+        with self.lock:
+            self.pending.add(path)
+
+    def fix(self, paths: Iterable[Path] = None) -> None:
+        """Recursively changes the owner of @paths to `self.owner`.
+
+        Args:
+            paths: Defaults to every pending path.
+        """
+        with self.lock:
+            if paths is None:
+                paths = set(self.pending)
+            else:
+                paths = set(paths)
+
+            self.pending -= paths
+
+        existing_paths = sorted(str(path) for path in paths if path.exists())
+        if not existing_paths:
+            return
+
+        log.debug(f"Changing owner of {existing_paths} to {self.owner}.")
+        cmd_list = ["sudo", "chown", "-R", self.owner, "--"] + existing_paths
+        if sp.call(cmd_list) != 0:
+            log.warning(f"The following command failed: {cmd_list!r}")
@@ -0,0 +1,203 @@
+"""Shared poller for the status of every active torrent."""
+
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from loguru import logger as log
+
+from . import deluge, metrics
+from .deluge import DelugeClient, TorrentStatus
+
+
+POLL_INTERVAL = 5  # In seconds
+MAX_POLL_INTERVAL = 60  # In seconds
+
+# Polls which are due within this many seconds of each other are merged into
+# a single request.
+POLL_BATCH_WINDOW = 1
+
+
+class StatusPoller:
+    """Thread-Safe Status Poller
+
+    Torrent workers block on `wait_for_status()` until their torrent's status
+    has been polled. A single background thread services these requests,
+    fetching the status of every torrent whose poll is due (using one bulk
+    request). This keeps the cost of each poll roughly constant no matter how
+    many torrents are active.
+    """
+
+    def __init__(
+        self, client: DelugeClient, *, interval: float = POLL_INTERVAL
+    ) -> None:
+        self.client = client
+        self.interval = interval
+
+        self._cond = threading.Condition()
+        self._tracked: Set[str] = set()
+        # Maps torrent IDs to the (monotonic) time their next poll is due.
+        self._due: Dict[str, float] = {}
+        self._statuses: Dict[str, Optional[TorrentStatus]] = {}
+        # Maps torrent IDs to the number of the last poll that included them.
+        self._last_poll: Dict[str, int] = {}
+        self._poll_count = 0  # number of successful polls
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, ID: str) -> None:
+        """Include the torrent specified by @ID in future polls."""
+        with self._cond:
+            self._tracked.add(ID)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def untrack(self, ID: str) -> None:
+        """Exclude the torrent specified by @ID from future polls."""
+        with self._cond:
+            self._tracked.discard(ID)
+            self._due.pop(ID, None)
+            self._statuses.pop(ID, None)
+            self._last_poll.pop(ID, None)
+
+    def wait_for_status(
+        self, ID: str, delay: float = None
+    ) -> TorrentStatus:
+        """Returns @ID's status once it has been polled again.
+
+        Args:
+            delay: The number of seconds to wait before polling @ID's status.
+              Defaults to the poller's interval.
+        """
+        if delay is None:
+            delay = self.interval
+
+        with self._cond:
+            if ID not in self._tracked:
+                raise ValueError(f"The torrent with ID {ID!r} is not tracked.")
+
+            due = time.monotonic() + delay
+            self._due[ID] = min(due, self._due.get(ID, due))
+            self._cond.notify_all()
+
+            last_poll = self._last_poll.get(ID, 0)
+            self._cond.wait_for(
+                lambda: self._last_poll.get(ID, 0) > last_poll
+                or ID not in self._tracked
+            )
+
+            status = self._statuses.get(ID)
+            if status is None:
+                raise ValueError(
+                    f"The P2P client has no record of the torrent with ID"
+                    f" {ID!r}."
+                )
+
+            return status
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                ids = self._wait_for_due_polls()
+
+            log.trace("Polling the status of {} torrent(s)...", len(ids))
+            try:
+                with metrics.poll_time.time():
+                    statuses = self.client.statuses(ids)
+            except deluge.DelugeError as e:
+                log.warning("Failed to poll torrent statuses: {}", e)
+                with self._cond:
+                    retry_time = time.monotonic() + self.interval
+                    for ID in ids:
+                        if ID in self._tracked:
+                            self._due.setdefault(ID, retry_time)
+                continue
+
+            with self._cond:
+                self._poll_count += 1
+                for ID in ids:
+                    if ID in self._tracked:
+                        self._statuses[ID] = statuses.get(ID)
+                        self._last_poll[ID] = self._poll_count
+
+                self._cond.notify_all()
+
+    def _wait_for_due_polls(self) -> Set[str]:
+        """Blocks until at least one poll is due.
+
+        Must be called while holding `self._cond`.
+
+        Returns:
+            The IDs of all torrents whose polls are (nearly) due.
+        """
+        while True:
+            now = time.monotonic()
+            if self._due:
+                next_due = min(self._due.values())
+                if next_due <= now:
+                    break
+
+                self._cond.wait(next_due - now)
+            else:
+                self._cond.wait()
+
+        ids = {
+            ID
+            for ID, due in self._due.items()
+            if due <= now + POLL_BATCH_WINDOW
+        }
+        for ID in ids:
+            del self._due[ID]
+
+        return ids
+
+
+class PollScheduler:
+    """Decides how long a worker should wait before polling its torrent again.
+
+    Polls back off (exponentially) while a torrent is stalled and tighten as
+    the torrent's estimated time-to-completion shrinks.
+    """
+
+    def __init__(
+        self,
+        *,
+        min_interval: float = POLL_INTERVAL,
+        max_interval: float = MAX_POLL_INTERVAL,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.delay = min_interval
+
+    def next_delay(self, status: TorrentStatus) -> float:
+        """
+        Examples:
+            >>> from libtorrent.deluge import TorrentStatus
+            >>> scheduler = PollScheduler(min_interval=5, max_interval=60)
+            >>> stalled = TorrentStatus("ID", "foo", "Downloading", 0, 0, 0,
+            ...                         0, 1000)
+            >>> [scheduler.next_delay(stalled) for _ in range(5)]
+            [10, 20, 40, 60, 60]
+
+            >>> far = stalled._replace(download_rate=1.0)
+            >>> scheduler.next_delay(far)
+            60
+
+            >>> near = far._replace(total_done=900)
+            >>> scheduler.next_delay(near)
+            25.0
+
+            >>> nearer = far._replace(total_done=990)
+            >>> scheduler.next_delay(nearer)
+            5
+        """
+        remaining = status.total_wanted - status.total_done
+        if status.state != "Downloading" or status.download_rate <= 0:
+            self.delay = min(self.delay * 2, self.max_interval)
+        else:
+            eta = max(remaining, 0) / status.download_rate
+            self.delay = min(
+                max(eta / 4, self.min_interval), self.max_interval
+            )
+
+        return self.delay
@@ -1,12 +1,26 @@
+import base64
+import binascii
+import re
 import threading
-from typing import Dict
-from typing import List
+from typing import Dict, Iterable, Optional, Set
 
 from loguru import logger as log
 
 
+class DuplicateMagnetError(Exception):
+    """Raised when a magnet matches a torrent that is still active."""
+
+    def __init__(self, key: int) -> None:
+        super().__init__(f"This magnet is already being downloaded (#{key}).")
+        self.key = key
+
+
 class MagnetTracker:
-    """Thread-Safe Counter of Magnet Files"""
+    """Thread-Safe Counter of Magnet Files
+
+    Every lookup (in either direction) is backed by an index, so none of
+    these operations grow more expensive as the queue history grows.
+    """
 
     def __init__(self) -> None:
         self.lock = threading.Lock()
@@ -14,6 +28,11 @@ class MagnetTracker:
         self.ids: Dict[int, str] = {}
         self.next_key = 0  # used to index into `self.ids`
         self.active_torrents = 0
+        self.active_keys: Set[int] = set()
+
+        self.keys_by_id: Dict[str, int] = {}
+        self.keys_by_infohash: Dict[str, int] = {}
+        self.claimed_ids: Set[str] = set()
 
         # This threading lock is not released again
         # until the last torrent worker is finished.
@@ -23,36 +42,124 @@ class MagnetTracker:
     def __getitem__(self, i: int) -> str:
         return self.ids[i]
 
-    def done(self) -> None:
-        """Called everytime a torrent finishes downloading."""
+    def done(self, key: int) -> None:
+        """Called everytime a torrent finishes downloading.
+
+        The torrent's ID is released, so the same magnet can be downloaded
+        (and bound to the same ID) again.
+        """
         with self.lock:
             self.active_torrents -= 1
+            self.active_keys.discard(key)
 
-            if self.active_torrents == 0:
+            ID = self.ids.pop(key, None)
+            if ID is not None:
+                self.claimed_ids.discard(ID)
+                if self.keys_by_id.get(ID) == key:
+                    del self.keys_by_id[ID]
+
+            if self.active_torrents == 0 and self.all_work_is_done.locked():
                 self.all_work_is_done.release()
 
-    def new(self, id_list: List[str]) -> int:
-        """Captures ID of new torrent.
+    def new(self, magnet: str) -> int:
+        """Reserves a key for a new torrent.
 
         Returns:
             An integer key that can be used to retrieve the torrent's ID
-            (by indexing into `self.ids`).
+            (by indexing into `self.ids`) once the ID has been captured via
+            `self.bind()`.
+
+        Raises:
+            DuplicateMagnetError: If @magnet has the same infohash as a
+              torrent that is still active.
         """
-        log.trace("id_list = {}", id_list)
+        ihash = infohash(magnet)
         with self.lock:
+            old_key = self.keys_by_infohash.get(ihash or "")
+            if old_key in self.active_keys:
+                raise DuplicateMagnetError(old_key)
+
             self.next_key += 1
             self.active_torrents += 1
+            self.active_keys.add(self.next_key)
 
-            for ID in id_list:
-                if ID in self.ids.values():
-                    continue
+            if ihash is not None:
+                self.keys_by_infohash[ihash] = self.next_key
+
+            return self.next_key
 
-                self.ids[self.next_key] = ID
-                break
-            else:
+    def bind(self, key: int, ID: str) -> None:
+        """Captures ID of new torrent."""
+        log.trace("key = {}, ID = {}", key, ID)
+        with self.lock:
+            if ID in self.claimed_ids:
                 raise RuntimeError(
                     "Something has gone wrong. "
-                    "All Magnet IDs appear to have been used already."
+                    f"Magnet ID {ID!r} appears to have been used already."
                 )
 
-            return self.next_key
+            self.ids[key] = ID
+            self.keys_by_id[ID] = key
+            self.claimed_ids.add(ID)
+
+    def first_unclaimed(self, id_list: Iterable[str]) -> str:
+        """Returns the first ID in @id_list that has not been claimed yet."""
+        log.trace("id_list = {}", id_list)
+        with self.lock:
+            for ID in id_list:
+                if ID not in self.claimed_ids:
+                    return ID
+
+        raise RuntimeError(
+            "Something has gone wrong. "
+            "All Magnet IDs appear to have been used already."
+        )
+
+    def key_for_id(self, ID: str) -> Optional[int]:
+        """Returns the key of the torrent whose Deluge ID is @ID."""
+        return self.keys_by_id.get(ID)
+
+    def key_for_magnet(self, magnet: str) -> Optional[int]:
+        """Returns the key of the most recent torrent matching @magnet."""
+        ihash = infohash(magnet)
+        if ihash is None:
+            return None
+
+        return self.keys_by_infohash.get(ihash)
+
+
+def infohash(magnet: str) -> Optional[str]:
+    """Returns @magnet's (hex-encoded) BitTorrent infohash.
+
+    Deluge uses this infohash as the torrent's ID.
+
+    Examples:
+        >>> infohash(
+        ...     "magnet:?xt=urn:btih:C12FE1C06BBA254A9DC9F519B335AA7C1367A88A"
+        ...     "&dn=foo"
+        ... )
+        'c12fe1c06bba254a9dc9f519b335aa7c1367a88a'
+
+        >>> infohash(
+        ...     "magnet:?dn=foo&xt=urn:btih:YEX6DQDLXISUVHOJ6UM3GNNKPQJWPKEK"
+        ... )
+        'c12fe1c06bba254a9dc9f519b335aa7c1367a88a'
+
+        >>> infohash("magnet:?dn=foo") is None
+        True
+    """
+    match = re.search(r"xt=urn:btih:([0-9a-zA-Z]+)", magnet)
+    if match is None:
+        return None
+
+    ihash = match.group(1)
+    if len(ihash) == 40:
+        return ihash.lower()
+
+    if len(ihash) == 32:
+        try:
+            return base64.b32decode(ihash.upper()).hex()
+        except binascii.Error:
+            return None
+
+    return None
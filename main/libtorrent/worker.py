@@ -1,19 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import queue
 import re
-import subprocess as sp
 import threading
 import time
-from typing import List, Union
+from typing import Callable, Dict, List, Optional, Sequence
 
-from bugyi.core import shell
 from bugyi.tools import notify
 from loguru import logger as log
 
-from .tracker import MagnetTracker
+from . import deluge, metrics
+from .journal import Job, Journal
+from .ownership import OwnershipTracker
+from .poller import POLL_INTERVAL, PollScheduler, StatusPoller
+from .tracker import DuplicateMagnetError, MagnetTracker, infohash
 
 
+# At most this many magnets are being added to Deluge at any given time.
+ENQUEUE_CONCURRENCY = deluge.DEFAULT_POOL_SIZE
+# How long (in seconds) we keep trying to add a magnet to Deluge.
+ENQUEUE_TIMEOUT = 60
+MAX_ENQUEUE_RETRY_DELAY = 8  # In seconds
+
+# Takes a magnet, download directory, timeout, and (optionally) the Deluge ID
+# assigned by a previous session. Returns a magnet tracker key.
+JobStarter = Callable[[str, Path, float, Optional[str]], int]
+
 _magnet_queue: "queue.Queue[str]" = queue.Queue()
+_first_magnet_enqueued = threading.Event()
+
+# All Deluge requests made by this module (from any thread) go through this
+# pool of long-lived daemon connections.
+_deluge = deluge.ClientPool(deluge.RPCClient.from_env)
+_poller = StatusPoller(_deluge)
+_journal = Journal()
+_ownership = OwnershipTracker()
+_enqueue_pool = ThreadPoolExecutor(
+    max_workers=ENQUEUE_CONCURRENCY, thread_name_prefix="enqueue"
+)
 
 
 def new_torrent_worker(
@@ -22,21 +46,154 @@ def new_torrent_worker(
     timeout: float,
     *,
     use_threads: bool = True,
-) -> None:
+    wait_for_first: bool = False,
+    torrent_id: str = None,
+) -> int:
+    """Starts downloading @magnet.
+
+    Args:
+        use_threads: If set, the download is run in a new thread. Otherwise,
+          this function blocks until the download is complete.
+        wait_for_first: If set, the download is not started until the first
+          magnet has been enqueued (i.e. until the P2P client is ready).
+        torrent_id: The Deluge ID that @magnet was assigned by a previous
+          session. If the P2P client still has this torrent, we re-attach to
+          it instead of adding @magnet again.
+
+    Returns:
+        The magnet tracker key assigned to @magnet.
+    """
     torrent_worker = _TorrentWorker(
-        magnet=magnet, download_dir=download_dir, timeout=timeout
+        magnet=magnet,
+        download_dir=download_dir,
+        timeout=timeout,
+        torrent_id=torrent_id,
     )
 
+    def run_worker() -> None:
+        if wait_for_first:
+            wait_for_first_magnet()
+
+        torrent_worker()
+
     if use_threads:
-        thread = threading.Thread(target=torrent_worker, daemon=True)
+        thread = threading.Thread(target=run_worker, daemon=True)
         thread.start()
     else:
-        torrent_worker()
+        run_worker()
+
+    return torrent_worker.mt_key
+
+
+def enqueue_magnets(
+    magnets: Sequence[str],
+    download_dir: Path,
+    timeout: float,
+    start: JobStarter = None,
+) -> List[int]:
+    """Starts downloading every unique magnet in @magnets.
+
+    Magnets are de-duplicated by infohash, both against the other magnets
+    in @magnets and against the torrents that are still being downloaded.
+
+    Args:
+        start: Used to start each job. Must construct the job's worker
+          before it starts downloading anything. Defaults to starting a new
+          worker thread.
+
+    Returns:
+        The magnet tracker key of each magnet in @magnets (in the same
+        order). Duplicate magnets are given the key of the original.
+    """
+    if start is None:
+        start = _start_threaded_job
+
+    # Magnets without an infohash are de-duplicated by their contents.
+    keys_by_infohash: Dict[str, int] = {}
+    keys = []
+    for magnet in magnets:
+        ihash = infohash(magnet) or magnet
+        key = keys_by_infohash.get(ihash)
+        if key is None:
+            try:
+                key = start(magnet, download_dir, timeout, None)
+            except DuplicateMagnetError as e:
+                key = e.key
+                log.info(f"Skipping duplicate of magnet #{key}: {magnet}")
+        else:
+            log.info(f"Skipping duplicate of magnet #{key}: {magnet}")
+
+        keys_by_infohash[ihash] = key
+        keys.append(key)
+
+    return keys
+
+
+def recover_jobs() -> List[Job]:
+    """Returns every job that a previous session failed to finish.
+
+    The journal is compacted and the magnet tracker skips past every
+    journaled key, so this must be called before any new job is created
+    (e.g. before we start accepting magnets from other instances).
+    Otherwise, a new job could be journaled under the key of an unfinished
+    job.
+    """
+    jobs = _journal.replay()
+    if jobs:
+        tracker = _TorrentWorker.magnet_tracker
+        with tracker.lock:
+            tracker.next_key = max(tracker.next_key, jobs[-1].key)
+
+    return jobs
+
+
+def resume_jobs(jobs: Sequence[Job], start: JobStarter = None) -> List[str]:
+    """Restarts the jobs returned by `recover_jobs()`.
+
+    This function should not be called until the P2P client is ready.
+
+    Args:
+        start: Used to start each job. Must construct the job's worker
+          (which re-journals the job) before returning. Defaults to starting
+          a new worker thread.
+
+    Returns:
+        The magnets of the resumed jobs.
+    """
+    if start is None:
+        start = _start_threaded_job
+
+    resumed_magnets = []
+    for job in jobs:
+        log.info(f"Resuming unfinished job #{job.key} from last session.")
+        try:
+            start(job.magnet, job.download_dir, job.timeout, job.torrent_id)
+        except DuplicateMagnetError as e:
+            log.info(f"Job #{job.key} is a duplicate of job #{e.key}.")
+        else:
+            resumed_magnets.append(job.magnet)
+
+        # The job was re-journaled (under a new key) by the lines above.
+        _journal.finished(job.key)
+
+    return resumed_magnets
+
+
+def _start_threaded_job(
+    magnet: str, download_dir: Path, timeout: float, torrent_id: Optional[str]
+) -> int:
+    return new_torrent_worker(
+        magnet, download_dir, timeout, torrent_id=torrent_id
+    )
+
+
+def fix_ownership() -> None:
+    """Fixes the ownership of every file downloaded during this session."""
+    _ownership.fix()
 
 
 def wait_for_first_magnet() -> None:
-    while _magnet_queue.empty():
-        time.sleep(0.5)
+    _first_magnet_enqueued.wait()
 
 
 def join_workers() -> None:
@@ -48,70 +205,72 @@ def join_workers() -> None:
 def kill_all_workers() -> None:
     """Each torrent will be removed from the P2P client."""
     try:
-        full_id_list = _parse_info("ID")
-        log.trace("full_id_list = {}", full_id_list)
-    except ValueError:
+        all_ids = _deluge.torrent_ids()
+        log.trace("all_ids = {}", all_ids)
+    except deluge.DelugeError:
         return
 
-    all_ids = [ID.split()[1] for ID in full_id_list]
     for ID in all_ids:
         _kill_worker(ID)
 
 
 def _kill_worker(ID: str) -> None:
     """Remove torrent specified by @ID from the P2P client."""
-    try:
-        sp.check_call(["sudo", "-E", "deluge-console", "rm", "--confirm", ID])
+    if _deluge.remove(ID):
         log.debug(f"Removed magnet #{ID}.")
-    except sp.CalledProcessError:
+    else:
         log.debug(f"Attempted to remove magnet #{ID} but it is NOT active.")
 
 
-def _parse_info(field: str, ID: str = None) -> Union[str, List[str]]:
-    """Wrapper for the `deluge-console info` command.
-
-    Returns:
-        Return type is `str` when @ID is given and `List[str]` otherwise.
-    """
-    log.trace(f"ID = {ID}")
-
-    cmd = (
-        "sudo -E deluge-console info --detailed --sort-reverse=time_added"
-        f" {'' if ID is None else ID} | perl -nE 'print if /^{field}:/'"
-    )
-    out = shell(cmd)
-    ret = out.split("\n")
-
-    if ret[0] == "":
-        raise ValueError(
-            "Something went wrong with the `info` function. "
-            f"Local state:\n\n{locals()}"
-        )
-
-    return ret if ID is None else ret[0]
-
-
 class _TorrentWorker:
     magnet_tracker = MagnetTracker()
-    INVALID_TRACKER_KEY = -1
 
-    def __init__(self, magnet: str, download_dir: Path, timeout: float):
+    def __init__(
+        self,
+        magnet: str,
+        download_dir: Path,
+        timeout: float,
+        torrent_id: str = None,
+    ):
         self.magnet = magnet
         self.download_dir = download_dir
         self.timeout = timeout
+        self.resumed_torrent_id = torrent_id
 
-        self._mt_key = self.INVALID_TRACKER_KEY
+        # A key which can be used to index into the magnet tracker in order
+        # to retrieve the Deluge ID corresponding to this worker's magnet.
+        self.mt_key = self.magnet_tracker.new(magnet)
         self.is_enqueued = False
+        self.download_started = False
+        self.start_time = time.monotonic()
+        self.path: Optional[Path] = None  # where our files are downloaded to
+        # The magnet tracker forgets this ID once we are done.
+        self._torrent_id: Optional[str] = None
+
+        _journal.enqueued(self.mt_key, magnet, download_dir, timeout)
 
     def __call__(self) -> None:
         log.debug(f'Added "{self.title}" to magnet queue.')
 
         try:
             self.download_torrent()
+        except Exception:
+            _journal.finished(self.mt_key)
+            raise
+        else:
+            _journal.finished(self.mt_key)
         finally:
-            self.magnet_tracker.done()
+            ID = self.torrent_id
+            if ID is not None:
+                _poller.untrack(ID)
+                metrics.forget_torrent(ID, self.title)
+
+            self.magnet_tracker.done(self.mt_key)
             with self.magnet_tracker.all_work_is_done:
-                _kill_worker(self.magnet_tracker[self.mt_key])
+                if ID is not None:
+                    _kill_worker(ID)
+
+                self.fix_ownership()
 
                 _magnet_queue.get()
                 _magnet_queue.task_done()
@@ -125,94 +284,148 @@ class _TorrentWorker:
             return "UNKNOWN TITLE"
 
     @property
-    def mt_key(self) -> int:
-        """Magnet Tracker Key
+    def torrent_id(self) -> Optional[str]:
+        """The Deluge ID of this worker's torrent (if it has been captured)."""
+        return self._torrent_id
+
+    def download_torrent(self) -> None:
+        deadline = self._deadline()
+        scheduler = PollScheduler()
+        delay: float = POLL_INTERVAL
+        while True:
+            delay = self._check_deadline(deadline, delay)
+
+            if not self.is_enqueued:
+                self._start_download()
+                _poller.track(self.magnet_tracker[self.mt_key])
+
+            # Blocks until the shared poller's next bulk status request.
+            status = _poller.wait_for_status(
+                self.magnet_tracker[self.mt_key], delay=delay
+            )
+            delay = scheduler.next_delay(status)
+
+            if self._process_status(status):
+                return
+
+    def _deadline(self) -> Optional[float]:
+        """Returns the (monotonic) time at which this download times out."""
+        if not self.timeout:
+            return None
+
+        SECONDS_IN_HOUR = 3600
+        return time.monotonic() + self.timeout * SECONDS_IN_HOUR
 
-        A key which can be used to index into the magnet tracker in order to
-        retrieve the Deluge ID corresponding to this worker's magnet.
+    def _check_deadline(
+        self, deadline: Optional[float], delay: float
+    ) -> float:
+        """Raises an error if @deadline has passed.
+
+        Returns:
+            @delay, clamped so we do not wait past @deadline.
         """
-        if not self.is_enqueued:
+        if deadline is None:
+            return delay
+
+        time_left = deadline - time.monotonic()
+        if time_left <= 0:
             raise RuntimeError(
-                "Download must first be enqueued before attempting to access "
-                "the magnet tracker key."
+                "Torrent is still attempting to download "
+                f"\"{self.title}\" after {self.timeout:.1f} hour(s) "
+                "elapsed time. Shutting down early."
             )
 
-        if self._mt_key == self.INVALID_TRACKER_KEY:
-            id_list = [ID.split()[1] for ID in _parse_info("ID")]
-            self._mt_key = self.magnet_tracker.new(id_list)
+        return min(delay, time_left)
+
+    def fix_ownership(self) -> None:
+        """Fixes the ownership of the files this worker downloaded."""
+        if self.path is not None:
+            _ownership.fix([self.path])
+
+    def _process_status(self, status: deluge.TorrentStatus) -> bool:
+        """Returns True if @status shows that our download is complete."""
+        if self.path is None and status.name:
+            self.path = self.download_dir / status.name
+            _ownership.add(self.path)
+
+        metrics.record_status(self.title, status)
+
+        state = status.state
+        if state == "Downloading":
+            self.download_started = True
+        elif state == "Seeding" or (
+            state == "Queued" and self.download_started
+        ):
+            metrics.download_time.observe(time.monotonic() - self.start_time)
+            notify(
+                f'Finished Downloading "{self.title}".', title="torrent",
+            )
+            return True
+
+        return False
+
+    def _start_download(self) -> None:
+        """Enqueues our magnet or re-attaches to an existing download."""
+        ID = self.resumed_torrent_id
+        if ID is not None and ID in _deluge.statuses([ID]):
+            log.debug(f'Re-attached to "{self.title}" download.')
+            self.is_enqueued = True
+            _magnet_queue.put(self.magnet)
+            _first_magnet_enqueued.set()
+        else:
+            ID = self._enqueue_download() or infohash(self.magnet)
+            if ID is None:
+                id_list = _deluge.torrent_ids()
+                ID = self.magnet_tracker.first_unclaimed(id_list)
 
-        log.trace("mt_key = {mt_key}", mt_key=self._mt_key)
-        return self._mt_key
+        self.magnet_tracker.bind(self.mt_key, ID)
+        self._torrent_id = ID
+        _journal.started(self.mt_key, ID)
 
-    def download_torrent(self) -> None:
-        download_started = False
+    def _enqueue_download(self) -> Optional[str]:
+        """Add magnet file to Deluge's download queue.
 
-        i = 0
-        while True:
-            SLEEP_TIME = 5
+        Returns:
+            The new torrent's Deluge ID (if the P2P client reported it).
+        """
+        self.is_enqueued = True
 
-            i += 1
-            if self.timeout:
-                SECONDS_IN_HOUR = 3600
-                if i > (self.timeout * SECONDS_IN_HOUR / SLEEP_TIME):
-                    raise RuntimeError(
-                        "Torrent is still attempting to download "
-                        f"\"{self.title}\" after {self.timeout:.1f} hour(s) "
-                        "elapsed time. Shutting down early."
-                    )
+        # Blocks until one of the (shared) enqueue threads is free.
+        ID = _enqueue_pool.submit(
+            _add_magnet, self.magnet, self.download_dir
+        ).result()
+        log.debug(f'Enqueued "{self.title}" download.')
 
-            time.sleep(SLEEP_TIME)
+        # Careful where you put this line. It is responsible for
+        # preventing a race condition.
+        _magnet_queue.put(self.magnet)
+        _first_magnet_enqueued.set()
 
-            if not self.is_enqueued:
-                self._enqueue_download()
+        return ID
 
-            full_state = _parse_info(
-                "State", ID=self.magnet_tracker[self.mt_key]
-            )
 
-            state = str(full_state).split()[1]
-            if state == "Downloading":
-                download_started = True
-            elif state == "Seeding" or (
-                state == "Queued" and download_started
-            ):
-                notify(
-                    f'Finished Downloading "{self.title}".', title="torrent",
-                )
-                return
+def _add_magnet(magnet: str, download_dir: Path) -> Optional[str]:
+    """Adds @magnet to Deluge's download queue.
 
-    def _enqueue_download(self) -> None:
-        """Add magnet file to Deluge's download queue."""
-        self.is_enqueued = True
-        for _ in range(10):
-            time.sleep(1)
+    Failed requests are retried (with exponential backoff) until
+    ENQUEUE_TIMEOUT seconds have elapsed, since the P2P client daemon might
+    still be starting up.
+    """
+    deadline = time.monotonic() + ENQUEUE_TIMEOUT
+    delay = 0.5
+    while True:
+        try:
+            return _deluge.add_magnet(magnet, download_dir)
+        except deluge.DelugeError as e:
+            if time.monotonic() + delay > deadline:
+                raise RuntimeError(
+                    f"Unable to add magnet to deluge's download queue: {e}"
+                ) from e
 
-            try:
-                sp.check_call(
-                    [
-                        "sudo",
-                        "-E",
-                        "deluge-console",
-                        "add",
-                        "--path",
-                        str(self.download_dir),
-                        self.magnet,
-                    ]
-                )
-            except sp.CalledProcessError:
-                magnet_was_added = False
-            else:
-                magnet_was_added = True
-
-            if magnet_was_added:
-                log.debug(f'Enqueued "{self.title}" download.')
-
-                # Careful where you put this line. It is responsible for
-                # preventing a race condition.
-                _magnet_queue.put(self.magnet)
-
-                break
-        else:
-            raise RuntimeError(
-                f'Unable to add "{self.title}" to deluges\'s download queue.'
-            )
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_ENQUEUE_RETRY_DELAY)
+
+
+metrics.worker_count.set_function(
+    lambda: _TorrentWorker.magnet_tracker.active_torrents
+)
@@ -1,6 +1,8 @@
+import collections
 import logging
+import threading
 import time
-from typing import Set
+from typing import Deque
 
 from .types import AccessRecord, AuthStatus
 
@@ -8,37 +10,85 @@ from .types import AccessRecord, AuthStatus
 ATTEMPT_LIMIT = 10
 ATTEMPT_PERIOD = 10  # In minutes
 
+# The maximum number of client addresses whose failed attempts are tracked at
+# any given time. This bounds our memory usage when a client sprays requests
+# from many different addresses.
+MAX_TRACKED_CLIENTS = 10000
+
 
 log = logging.getLogger(__name__)
 
 
 class Authenticator:
+    """Thread-Safe Access Token Checker
+
+    Clients that fail to authenticate more than ATTEMPT_LIMIT times within
+    any ATTEMPT_PERIOD minute window are suspended.
+    """
+
     def __init__(self, server_token: str) -> None:
         self.server_token = server_token
-        self.access_records: Set[AccessRecord] = set()
+        self.lock = threading.Lock()
+
+        # Maps client addresses to the (monotonic) times of their most recent
+        # failed attempts. Ordered by each client's most recent failure.
+        self.failures: "collections.OrderedDict[str, Deque[float]]" = (
+            collections.OrderedDict()
+        )
 
     def check(self, client_addr: str, client_token: str) -> AuthStatus:
-        now = time.time()
-
-        for arec in self.access_records.copy():
-            if (now - arec.time) > (ATTEMPT_PERIOD * 60):
-                self.access_records.remove(arec)
-
-        recent_failed_attempts = [
-            arec
-            for arec in self.access_records
-            if arec.client_addr == client_addr
-            and not arec.granted
-        ]
-        if len(recent_failed_attempts) > ATTEMPT_LIMIT:
-            status = AuthStatus.SUSPENDED
-        elif client_token == self.server_token:
-            status = AuthStatus.GRANTED
-        else:
-            status = AuthStatus.DENIED
-
-        arec = AccessRecord(client_addr, status == AuthStatus.GRANTED, now)
+        now = time.monotonic()
+        with self.lock:
+            self._expire_clients(now)
+            if self._recent_failure_count(client_addr, now) > ATTEMPT_LIMIT:
+                status = AuthStatus.SUSPENDED
+            elif client_token == self.server_token:
+                status = AuthStatus.GRANTED
+            else:
+                status = AuthStatus.DENIED
+
+            if status is not AuthStatus.GRANTED:
+                self._add_failure(client_addr, now)
+
+        arec = AccessRecord(
+            client_addr, status == AuthStatus.GRANTED, time.time()
+        )
         log.info(f"Access {status}: {arec}")
-        self.access_records.add(arec)
 
         return status
+
+    def _expire_clients(self, now: float) -> None:
+        """Stops tracking clients whose failures have all expired."""
+        while self.failures:
+            client_addr, failures = next(iter(self.failures.items()))
+            if not _is_expired(failures[-1], now):
+                break
+
+            del self.failures[client_addr]
+
+    def _recent_failure_count(self, client_addr: str, now: float) -> int:
+        failures = self.failures.get(client_addr)
+        if failures is None:
+            return 0
+
+        while failures and _is_expired(failures[0], now):
+            failures.popleft()
+
+        return len(failures)
+
+    def _add_failure(self, client_addr: str, now: float) -> None:
+        failures = self.failures.pop(client_addr, None)
+        if failures is None:
+            # We never need to remember more failures than it takes to get
+            # suspended.
+            failures = collections.deque(maxlen=ATTEMPT_LIMIT + 1)
+
+        failures.append(now)
+        self.failures[client_addr] = failures
+
+        if len(self.failures) > MAX_TRACKED_CLIENTS:
+            self.failures.popitem(last=False)
+
+
+def _is_expired(attempt_time: float, now: float) -> bool:
+    return (now - attempt_time) > (ATTEMPT_PERIOD * 60)
@@ -0,0 +1,432 @@
+"""Load test the remote function server.
+
+Each scenario starts C client threads which send requests to an in-process
+rfserver (whose /sendmail route uses a stub mail backend) for a fixed amount of
+time, and reports the throughput, latency percentiles, and error rate of each
+kind of request.
+"""
+
+import argparse
+import collections
+import http.client
+import itertools
+import math
+from pathlib import Path
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import urllib.parse
+
+from . import jobs
+from .path_dispatcher import PathDispatcher
+from .routes import route_registry
+from .servers import (
+    DEFAULT_BACKLOG,
+    DEFAULT_WORKERS,
+    KeepAliveRequestHandler,
+    ThreadPoolWSGIServer,
+)
+
+
+DEFAULT_CONCURRENCIES = (1, 10, 50)
+DEFAULT_MIX = "valid=70,badtoken=10,notfound=10,large=10"
+DEFAULT_LARGE_BODY_SIZE = 512 * 1024  # In bytes
+TOKEN = "bench-token"
+
+# The HTTP status codes that we expect for each kind of request. Any other
+# response (or a connection error) is counted as an error.
+EXPECTED_STATUSES = {
+    "valid": {200, 202},
+    "badtoken": {401},
+    "notfound": {404},
+    "large": {200, 202},
+}
+
+
+class Arguments(NamedTuple):
+    concurrencies: List[int]
+    duration: float
+    mix: Dict[str, int]
+    workers: int
+    backlog: int
+    large_body_size: int
+    sendmail_latency: float
+    rate_limits: bool
+    keepalive: bool
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    body: bytes
+    headers: Dict[str, str]
+
+
+class Result(NamedTuple):
+    kind: str
+    requests: int
+    errors: int
+    wall_time: float  # seconds
+    latencies: List[float]  # seconds (one per request)
+    statuses: Dict[str, int]  # status code (or error name) -> count
+
+
+def main(argv: Sequence[str] = None) -> int:
+    if argv is None:
+        argv = sys.argv
+
+    args = parse_cli_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        httpd = start_server(args, Path(tmpdir))
+        port = httpd.server_address[1]
+        try:
+            print(
+                f"workers={args.workers} duration={args.duration}s"
+                f" keepalive={args.keepalive} rate_limits={args.rate_limits}"
+                f" sendmail_latency={args.sendmail_latency}s"
+                f" mix={format_mix(args.mix)}"
+            )
+            print(
+                f"{'clients':>7} {'kind':>8} {'reqs':>7} {'req/s':>8}"
+                f" {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'err%':>6}"
+                "  statuses"
+            )
+            for concurrency in args.concurrencies:
+                results = run_scenario(port, concurrency, args)
+                for result in results:
+                    print(format_result(concurrency, result), flush=True)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            jobs.job_queue.shutdown()
+
+    return 0
+
+
+def parse_cli_args(argv: Sequence[str]) -> Arguments:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "concurrencies",
+        nargs="*",
+        type=int,
+        default=list(DEFAULT_CONCURRENCIES),
+        metavar="C",
+        help=(
+            "Run a scenario with C concurrent clients. Defaults to"
+            f" {' '.join(map(str, DEFAULT_CONCURRENCIES))}."
+        ),
+    )
+    parser.add_argument(
+        "-d",
+        "--duration",
+        type=float,
+        default=5,
+        help="How long (in seconds) each scenario runs for.",
+    )
+    parser.add_argument(
+        "-m",
+        "--mix",
+        type=parse_mix,
+        default=parse_mix(DEFAULT_MIX),
+        help=(
+            "The relative weight of each kind of request"
+            f" ({', '.join(EXPECTED_STATUSES)}). Defaults to '{DEFAULT_MIX}'."
+        ),
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="The server's number of worker threads.",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=DEFAULT_BACKLOG,
+        help="The maximum number of pending connections.",
+    )
+    parser.add_argument(
+        "--large-body-size",
+        type=int,
+        default=DEFAULT_LARGE_BODY_SIZE,
+        help=(
+            "The size (in bytes) of the email body sent by 'large' requests."
+            " Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--sendmail-latency",
+        type=float,
+        default=0,
+        help="How long (in seconds) the stub mail backend takes per email.",
+    )
+    parser.add_argument(
+        "--rate-limits",
+        action="store_true",
+        help="Enforce the server's per-client rate limits.",
+    )
+    parser.add_argument(
+        "--no-keepalive",
+        dest="keepalive",
+        action="store_false",
+        help="Open a new connection for every request.",
+    )
+
+    args = parser.parse_args(argv[1:])
+    return Arguments(**dict(args._get_kwargs()))
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """
+    Examples:
+        >>> parse_mix("valid=3, notfound=1")
+        {'valid': 3, 'notfound': 1}
+        >>> parse_mix("valid=3,bogus=1")
+        Traceback (most recent call last):
+        ...
+        argparse.ArgumentTypeError: Unknown request kind: 'bogus'
+    """
+    mix = {}
+    for item in spec.split(","):
+        kind, _, weight = item.strip().partition("=")
+        if kind not in EXPECTED_STATUSES:
+            raise argparse.ArgumentTypeError(f"Unknown request kind: {kind!r}")
+
+        try:
+            mix[kind] = int(weight)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(
+                f"Invalid weight for {kind!r}: {weight!r}"
+            ) from e
+
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("At least one weight must be > 0.")
+
+    return mix
+
+
+def format_mix(mix: Dict[str, int]) -> str:
+    return ",".join(f"{kind}={weight}" for kind, weight in mix.items())
+
+
+class QuietRequestHandler(KeepAliveRequestHandler):
+    """Request handler which does not log every request to stderr."""
+
+    def log_message(self, *_args: object) -> None:
+        pass
+
+
+def start_server(args: Arguments, jobs_dir: Path) -> ThreadPoolWSGIServer:
+    """Starts serving rfserver's routes (from a daemon thread).
+
+    The /sendmail route is backed by a stub `pymail` module and its jobs are
+    stored in @jobs_dir.
+    """
+    sys.modules["pymail"] = _stub_pymail(args.sendmail_latency)
+    jobs.job_queue.store = jobs.JobStore(jobs_dir)
+
+    dispatcher = PathDispatcher(
+        TOKEN,
+        route_map=route_registry.to_route_map(),
+        route_caches=route_registry.caches,
+        route_rate_limits=(
+            route_registry.rate_limits if args.rate_limits else None
+        ),
+    )
+    httpd = ThreadPoolWSGIServer(
+        ("127.0.0.1", 0),
+        QuietRequestHandler,
+        workers=args.workers,
+        backlog=args.backlog,
+    )
+    httpd.set_app(dispatcher)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def run_scenario(
+    port: int, concurrency: int, args: Arguments
+) -> List[Result]:
+    """Sends requests using @concurrency client threads.
+
+    Returns:
+        One result per kind of request, followed by the overall result.
+    """
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = collections.defaultdict(list)
+    statuses: Dict[str, collections.Counter] = collections.defaultdict(
+        collections.Counter
+    )
+
+    start_time = time.monotonic()
+    deadline = start_time + args.duration
+
+    def client(client_id: int) -> None:
+        rng = random.Random(client_id)
+        kinds = list(args.mix)
+        weights = [args.mix[kind] for kind in kinds]
+        conn: Optional[http.client.HTTPConnection] = None
+        while time.monotonic() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            request = make_request(kind, client_id, args.large_body_size)
+
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+
+            request_start = time.monotonic()
+            try:
+                status, will_close = _send(conn, request)
+            except (OSError, http.client.HTTPException) as e:
+                status, will_close = type(e).__name__, True
+
+            latency = time.monotonic() - request_start
+            if will_close or not args.keepalive:
+                conn.close()
+                conn = None
+
+            with lock:
+                latencies[kind].append(latency)
+                statuses[kind][status] += 1
+
+        if conn is not None:
+            conn.close()
+
+    threads = [
+        threading.Thread(target=client, args=(i,))
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    wall_time = time.monotonic() - start_time
+    results = [
+        _result(kind, wall_time, latencies[kind], statuses[kind])
+        for kind in args.mix
+        if latencies[kind]
+    ]
+    results.append(
+        Result(
+            kind="all",
+            requests=sum(result.requests for result in results),
+            errors=sum(result.errors for result in results),
+            wall_time=wall_time,
+            latencies=list(
+                itertools.chain.from_iterable(r.latencies for r in results)
+            ),
+            statuses={},
+        )
+    )
+    return results
+
+
+def make_request(kind: str, client_id: int, large_body_size: int) -> Request:
+    # Each client uses its own (fake) address, so that bad tokens and rate
+    # limits only ever affect the client that caused them.
+    headers = {
+        "X-RFServer-Token": TOKEN,
+        "X-Forwarded-For": f"10.{client_id // 256 % 256}.{client_id % 256}.1",
+        "Content-Type": "application/x-www-form-urlencoded",
+    }
+    params = {"to": "bench@example.com", "subject": "bench", "body": "Hi!"}
+
+    if kind == "badtoken":
+        headers["X-RFServer-Token"] = "not-the-token"
+        headers["X-Forwarded-For"] = (
+            f"10.255.{random.randrange(256)}.{random.randrange(256)}"
+        )
+    elif kind == "notfound":
+        return Request("GET", "/no-such-route", b"", headers)
+    elif kind == "large":
+        params["body"] = "x" * large_body_size
+
+    body = urllib.parse.urlencode(params).encode()
+    return Request("POST", "/sendmail", body, headers)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Returns the @pct-th percentile of @values (using nearest-rank).
+
+    Examples:
+        >>> percentile([4, 1, 3, 2], 50)
+        2
+        >>> percentile([4, 1, 3, 2], 99)
+        4
+        >>> percentile(list(range(1, 101)), 95)
+        95
+    """
+    ordered = sorted(values)
+    rank = max(math.ceil(pct * len(ordered) / 100), 1)
+    return ordered[rank - 1]
+
+
+def format_result(concurrency: int, result: Result) -> str:
+    error_rate = 100 * result.errors / result.requests
+    return (
+        f"{concurrency:>7} {result.kind:>8} {result.requests:>7}"
+        f" {result.requests / result.wall_time:>8.1f}"
+        f" {1000 * percentile(result.latencies, 50):>8.1f}"
+        f" {1000 * percentile(result.latencies, 95):>8.1f}"
+        f" {1000 * percentile(result.latencies, 99):>8.1f}"
+        f" {error_rate:>6.1f}"
+        f"  {' '.join(f'{k}={v}' for k, v in sorted(result.statuses.items()))}"
+    ).rstrip()
+
+
+def _send(
+    conn: http.client.HTTPConnection, request: Request
+) -> Tuple[str, bool]:
+    """Sends @request and reads its response.
+
+    Returns:
+        The response's status code and whether the server will close the
+        connection.
+    """
+    conn.request(
+        request.method,
+        request.path,
+        body=request.body,
+        headers=request.headers,
+    )
+    resp = conn.getresponse()
+    resp.read()
+    return str(resp.status), resp.will_close
+
+
+def _result(
+    kind: str,
+    wall_time: float,
+    latencies: List[float],
+    statuses: Dict[str, int],
+) -> Result:
+    expected = {str(status) for status in EXPECTED_STATUSES[kind]}
+    errors = sum(
+        count for status, count in statuses.items() if status not in expected
+    )
+    return Result(
+        kind=kind,
+        requests=len(latencies),
+        errors=errors,
+        wall_time=wall_time,
+        latencies=latencies,
+        statuses=dict(statuses),
+    )
+
+
+def _stub_pymail(latency: float) -> types.ModuleType:
+    """Returns a stand-in for the `pymail` module which never sends mail."""
+    pymail = types.ModuleType("pymail")
+
+    def sendmail(**_kwargs: object) -> int:
+        time.sleep(latency)
+        return 0
+
+    pymail.sendmail = sendmail  # type: ignore
+    return pymail
@@ -0,0 +1,226 @@
+"""Request Parameter Parsing
+
+Parameters are read from the query string and from the request body, which
+can be URL-encoded, JSON, or multipart form data. Bodies are read in chunks
+and are never allowed to grow larger than a configurable maximum size.
+"""
+
+from email.message import Message
+import email.parser
+import email.policy
+import json
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+import urllib.parse
+
+from . import metrics
+from .types import Environ
+
+
+MAX_BODY_SIZE = 1024 * 1024  # In bytes
+CHUNK_SIZE = 64 * 1024  # In bytes
+
+
+class BodyError(ValueError):
+    """Raised when a request body cannot be parsed."""
+
+
+class BodyTooLarge(BodyError):
+    """Raised when a request body is larger than the maximum size."""
+
+
+class LazyParams(Mapping[str, Any]):
+    """The parameters of a request, which are parsed on first access.
+
+    This means that requests which are rejected before their route reads
+    any parameters never pay for parsing the request body.
+
+    The "token" parameter is removed from the mapping and is available as
+    the `token` attribute instead.
+
+    Raises:
+        BodyError: (on first access) If the request body cannot be parsed.
+    """
+
+    def __init__(self, environ: Environ, max_size: int = MAX_BODY_SIZE):
+        self.environ = environ
+        self.max_size = max_size
+
+        self._params: Optional[Dict[str, Any]] = None
+        self._token: Optional[str] = None
+
+    def __getitem__(self, key: str) -> Any:
+        return self._parsed()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._parsed())
+
+    def __len__(self) -> int:
+        return len(self._parsed())
+
+    def __repr__(self) -> str:
+        if self._params is None:
+            return f"{type(self).__name__}(<unparsed>)"
+        return f"{type(self).__name__}({self._params!r})"
+
+    @property
+    def token(self) -> Optional[str]:
+        """The access token that was sent as a parameter (if any)."""
+        self._parsed()
+        return self._token
+
+    def _parsed(self) -> Dict[str, Any]:
+        if self._params is None:
+            with metrics.phase_time.labels("parse").time():
+                params = parse_params(self.environ, self.max_size)
+            token = params.pop("token", None)
+            self._token = token if isinstance(token, str) else None
+            self._params = params
+
+        return self._params
+
+
+def content_length(environ: Environ) -> int:
+    try:
+        return max(int(environ.get("CONTENT_LENGTH") or 0), 0)
+    except ValueError:
+        return 0
+
+
+def parse_params(
+    environ: Environ, max_size: int = MAX_BODY_SIZE
+) -> Dict[str, Any]:
+    """Returns the parameters sent in the query string and request body.
+
+    Repeated parameters are collected into a list (like the `getvalue()`
+    method of `cgi.FieldStorage`).
+    """
+    pairs = urllib.parse.parse_qsl(
+        environ.get("QUERY_STRING", ""), keep_blank_values=True
+    )
+
+    body = read_body(environ, max_size)
+    if body:
+        content_type, options = _parse_header(
+            environ.get("CONTENT_TYPE", "")
+        )
+        if content_type == "application/json":
+            pairs.extend(_parse_json(body, options))
+        elif content_type == "multipart/form-data":
+            pairs.extend(_parse_multipart(body, environ["CONTENT_TYPE"]))
+        else:
+            charset = options.get("charset", "utf-8")
+            try:
+                query = body.decode(charset)
+            except (LookupError, UnicodeDecodeError) as e:
+                raise BodyError(f"Unable to decode request body: {e}") from e
+
+            pairs.extend(
+                urllib.parse.parse_qsl(query, keep_blank_values=True)
+            )
+
+    return _collect(pairs)
+
+
+def read_body(environ: Environ, max_size: int = MAX_BODY_SIZE) -> bytes:
+    """Reads the request body (in chunks).
+
+    Raises:
+        BodyTooLarge: If the body is larger than @max_size bytes.
+    """
+    length = content_length(environ)
+    if length > max_size:
+        raise BodyTooLarge(
+            f"Request body is {length} bytes (the limit is {max_size})."
+        )
+
+    stream = environ["wsgi.input"]
+    chunks = []
+    remaining = length
+    while remaining > 0:
+        chunk = stream.read(min(remaining, CHUNK_SIZE))
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _parse_header(value: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Examples:
+        >>> _parse_header('text/plain; charset="latin-1"')
+        ('text/plain', {'charset': 'latin-1'})
+    """
+    message = Message()
+    message["Content-Type"] = value
+    options = {
+        key: str(val)
+        for key, val in message.get_params(failobj=[])[1:]  # type: ignore
+    }
+    return message.get_content_type(), options
+
+
+def _parse_json(body: bytes, options: Dict[str, str]) -> List[Tuple[str, Any]]:
+    try:
+        data = json.loads(body.decode(options.get("charset", "utf-8")))
+    except (LookupError, UnicodeDecodeError, ValueError) as e:
+        raise BodyError(f"Invalid JSON request body: {e}") from e
+
+    if not isinstance(data, dict):
+        raise BodyError("JSON request bodies must contain an object.")
+
+    return list(data.items())
+
+
+def _parse_multipart(body: bytes, content_type: str) -> List[Tuple[str, Any]]:
+    """Parses a multipart/form-data request body.
+
+    File uploads are returned as bytes. Every other field is returned as a
+    string.
+    """
+    parser = email.parser.BytesParser(policy=email.policy.HTTP)
+    message = parser.parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    if not message.is_multipart() or message.defects:
+        raise BodyError("Malformed multipart request body.")
+
+    pairs: List[Tuple[str, Any]] = []
+    for part in message.iter_parts():  # type: ignore
+        name = part.get_param("name", header="content-disposition")
+        if name is None:
+            continue
+
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is None:
+            charset = part.get_content_charset() or "utf-8"
+            try:
+                payload = payload.decode(charset)
+            except (LookupError, UnicodeDecodeError) as e:
+                raise BodyError(f"Unable to decode {name!r}: {e}") from e
+
+        pairs.append((str(name), payload))
+
+    return pairs
+
+
+def _collect(pairs: List[Tuple[str, Any]]) -> Dict[str, Any]:
+    """
+    Examples:
+        >>> _collect([("a", "1"), ("b", "2"), ("a", "3")])
+        {'a': ['1', '3'], 'b': '2'}
+    """
+    params: Dict[str, Any] = {}
+    repeated_keys = set()
+    for key, value in pairs:
+        if key not in params:
+            params[key] = value
+        elif key in repeated_keys:
+            params[key].append(value)
+        else:
+            params[key] = [params[key], value]
+            repeated_keys.add(key)
+
+    return params
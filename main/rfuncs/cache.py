@@ -0,0 +1,152 @@
+"""Response Caching
+
+Idempotent GET routes can be registered with a CachePolicy, in which case
+their successful responses are cached (per path and params) and served by the
+PathDispatcher without running the route again.
+
+Each worker process (when pre-forking) has its own cache.
+"""
+
+from collections import OrderedDict
+import json
+import threading
+import time
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+import prometheus_client as pc
+
+from .types import AnyStr, Environ, Route, StartResponse
+
+
+DEFAULT_MAX_ENTRIES = 256
+
+cache_hit_count = pc.Counter(
+    "rfserver_cache_hit_count",
+    "Count of responses served from the response cache.",
+    ["endpoint"],
+)
+cache_miss_count = pc.Counter(
+    "rfserver_cache_miss_count",
+    "Count of cacheable requests which were not found in the cache.",
+    ["endpoint"],
+)
+
+
+class CachePolicy(NamedTuple):
+    """A Route's Caching Policy
+
+    Responses are cached for @ttl seconds (keyed by the request's path and
+    params). Once more than @max_entries responses have been cached, the
+    least recently used response is evicted.
+    """
+
+    ttl: float  # In seconds.
+    max_entries: int = DEFAULT_MAX_ENTRIES
+
+
+class CachedResponse(NamedTuple):
+    status: str
+    headers: List[Tuple[str, str]]
+    body: bytes
+    expires: float
+
+
+class ResponseCache:
+    """Thread-Safe TTL Cache which evicts the least recently used entry."""
+
+    def __init__(self, endpoint: str, policy: CachePolicy) -> None:
+        self.endpoint = endpoint
+        self.policy = policy
+
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None and response.expires <= time.monotonic():
+                del self._entries[key]
+                response = None
+
+            if response is None:
+                cache_miss_count.labels(self.endpoint).inc()
+                return None
+
+            self._entries.move_to_end(key)
+
+        cache_hit_count.labels(self.endpoint).inc()
+        return response
+
+    def put(
+        self,
+        key: str,
+        status: str,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        response = CachedResponse(
+            status, headers, body, time.monotonic() + self.policy.ttl
+        )
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.policy.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cache_key(path: str, params: Mapping[str, Any]) -> str:
+    """
+    Examples:
+        >>> cache_key("/jobs/abc", {"b": ["2", "3"], "a": "1"})
+        '["/jobs/abc", [["a", "1"], ["b", ["2", "3"]]]]'
+    """
+    return json.dumps([path, sorted(params.items())], default=repr)
+
+
+RouteCaches = Dict[Route, ResponseCache]
+
+
+def cached(route: Route, cache: ResponseCache) -> Route:
+    """Wraps @route so that its (successful) responses are cached."""
+
+    def cached_route(
+        environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        key = cache_key(environ["PATH_INFO"], environ["params"])
+        response = cache.get(key)
+        if response is not None:
+            start_response(response.status, list(response.headers))
+            yield response.body
+            return
+
+        started: List[Any] = []
+
+        def capturing_start_response(
+            status: str, headers: Any, exc_info: Any = None
+        ) -> Any:
+            started[:] = [status, list(headers)]
+            return start_response(status, headers, exc_info)
+
+        chunks = []
+        for chunk in route(environ, capturing_start_response):
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            chunks.append(chunk)
+            yield chunk
+
+        if started and started[0].startswith("2"):
+            cache.put(key, started[0], started[1], b"".join(chunks))
+
+    return cached_route
@@ -1,12 +1,30 @@
 """(R)emote (F)unction Client"""
 
+import contextlib
+import functools
+import json
 import os
-from typing import Any
+import threading
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+)
 
 try:
-    from requests import Response
+    from requests import Response, Session
 except ImportError:
     Response = object  # type: ignore
+    Session = object  # type: ignore
+
+
+TOKEN_HEADER = "X-RFServer-Token"
+# The maximum number of pooled (keep-alive) connections kept per client.
+POOL_SIZE = 10
 
 
 def default_port() -> int:
@@ -21,12 +39,122 @@ def default_hostname() -> str:
     return os.environ["RFSERVER_HOSTNAME"]
 
 
+class BatchResult(NamedTuple):
+    status: Optional[str]
+    body: str
+
+    @property
+    def status_code(self) -> int:
+        return int(self.status.split()[0]) if self.status else 0
+
+
+class Batch:
+    """Remote function calls which are sent using a single request.
+
+    Use Client.batch() to create a Batch.
+    """
+
+    def __init__(self) -> None:
+        self.calls: List[Dict[str, Any]] = []
+        self.results: List[BatchResult] = []
+
+    def post(self, handler_name: str, **kwargs: Any) -> None:
+        """Queues up a call to the @handler_name remote function.
+
+        The call's result is appended to self.results once the batch is sent.
+        """
+        self.calls.append(
+            {"method": "POST", "path": handler_name, "params": kwargs}
+        )
+
+
+class Client:
+    """Remote function client which reuses its connections to the server."""
+
+    def __init__(
+        self,
+        hostname: str = None,
+        port: int = None,
+        token: str = None,
+    ) -> None:
+        self.hostname = default_hostname() if hostname is None else hostname
+        self.port = default_port() if port is None else port
+        self.token = default_token() if token is None else token
+
+        self._session: Optional[Session] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> Session:
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=POOL_SIZE
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.headers[TOKEN_HEADER] = self.token
+                self._session = session
+
+            return self._session
+
+    def url(self, handler_name: str) -> str:
+        return f"http://{self.hostname}:{self.port}/{handler_name}"
+
+    def post(self, handler_name: str, **kwargs: Any) -> Response:
+        return self.session.post(self.url(handler_name), data=kwargs)
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[Batch]:
+        """Sends every call made using the yielded Batch in one request.
+
+        Examples:
+            with client.batch() as batch:
+                batch.post("sendmail", to="a@example.com", body="...")
+                batch.post("sendmail", to="b@example.com", body="...")
+
+            for result in batch.results:
+                print(result.status_code, result.body)
+
+        Raises:
+            requests.HTTPError: If the batch request itself fails.
+        """
+        batch = Batch()
+        yield batch
+
+        if not batch.calls:
+            return
+
+        resp = self.session.post(
+            self.url("batch"),
+            data=json.dumps({"calls": batch.calls}),
+            headers={"Content-Type": "application/json"},
+        )
+        resp.raise_for_status()
+        batch.results.extend(
+            BatchResult(result["status"], result["body"])
+            for result in resp.json()["results"]
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+@functools.lru_cache(maxsize=None)
+def default_client() -> Client:
+    """Returns a (shared) client configured using RFSERVER_* env vars."""
+    return Client()
+
+
 def post(handler_name: str, **kwargs: Any) -> Response:
-    import requests
-
-    data = kwargs
-    data["token"] = default_token()
-    return requests.post(
-        f"http://{default_hostname()}:{default_port()}/{handler_name}",
-        data=data,
-    )
+    return default_client().post(handler_name, **kwargs)
+
+
+def batch() -> ContextManager[Batch]:
+    return default_client().batch()
@@ -0,0 +1,279 @@
+"""Asynchronous Jobs
+
+Routes which are registered as jobs do not block the HTTP response. Instead,
+the client immediately receives a "202 Accepted" response containing a job ID
+while the route runs in a bounded pool of worker threads. The job's status
+(and eventually its result) can then be retrieved from the /jobs/<id> route.
+
+Jobs are stored as JSON files, so that every worker process (when
+pre-forking) can report on any job. Job results can contain sensitive data,
+so only the current user can access these files.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import stat
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+import uuid
+
+from .responses import capture
+from .types import Environ, Route
+
+
+DEFAULT_JOB_WORKERS = 4
+# The maximum number of jobs that can be waiting to run (per process).
+MAX_PENDING_JOBS = 100
+# The maximum number of finished jobs whose results are kept around.
+MAX_STORED_JOBS = 1000
+# Jobs are stored in a per-user directory (never in a shared directory
+# like /tmp, where another user could create it first).
+JOBS_DIR = (
+    Path(
+        os.environ.get("XDG_RUNTIME_DIR")
+        or os.environ.get("XDG_CACHE_HOME")
+        or Path.home() / ".cache"
+    )
+    / "rfserver-jobs"
+)
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the job queue is full."""
+
+
+class Job(NamedTuple):
+    id: str
+    path: str
+    status: str  # one of: pending, running, succeeded, failed
+    created: float
+    http_status: Optional[str] = None
+    result: Optional[str] = None
+    finished: Optional[float] = None
+
+
+class JobStore:
+    """Thread-Safe (and Process-Safe) Store of Jobs"""
+
+    def __init__(
+        self, directory: Path = JOBS_DIR, max_jobs: int = MAX_STORED_JOBS
+    ) -> None:
+        self.directory = directory
+        self.max_jobs = max_jobs
+
+        self._save_count = 0
+        self._lock = threading.Lock()
+
+    def save(self, job: Job) -> None:
+        self._init_directory()
+
+        # Write to a temporary file first, so that readers never see a
+        # partially written job.
+        path = self._job_path(job.id)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        fd = os.open(
+            tmp_path,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW,
+            0o600,
+        )
+        with open(fd, "w") as f:
+            f.write(json.dumps(job._asdict()))
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._save_count += 1
+            should_prune = self._save_count % 100 == 0
+
+        if should_prune:
+            self.prune()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        try:
+            uuid.UUID(hex=job_id)
+        except ValueError:
+            return None
+
+        try:
+            data = json.loads(self._job_path(job_id).read_text())
+        except (OSError, ValueError):
+            return None
+
+        return Job(**data)
+
+    def prune(self) -> None:
+        """Deletes the oldest jobs if we have stored too many."""
+        paths: List[Path] = []
+        mtimes: Dict[Path, float] = {}
+        for path in self.directory.glob("*.json"):
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except OSError:
+                continue
+
+            paths.append(path)
+
+        paths.sort(key=mtimes.__getitem__)
+        for path in paths[: max(len(paths) - self.max_jobs, 0)]:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _init_directory(self) -> None:
+        """Creates our directory (if necessary) and makes sure it is ours.
+
+        Raises:
+            PermissionError: If our directory is a symlink, is not a
+              directory, or is owned by another user.
+        """
+        self.directory.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self.directory.mkdir(mode=0o700)
+        except FileExistsError:
+            pass
+
+        st = os.lstat(self.directory)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+            raise PermissionError(
+                f"Unable to store jobs in {self.directory}. It must be a"
+                " directory (not a symlink) owned by the current user."
+            )
+
+        if stat.S_IMODE(st.st_mode) != 0o700:
+            os.chmod(self.directory, 0o700)
+
+    def _job_path(self, job_id: str) -> Path:
+        return self.directory / f"{job_id}.json"
+
+
+class JobQueue:
+    """Runs routes (as jobs) in a bounded pool of worker threads."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        *,
+        workers: int = DEFAULT_JOB_WORKERS,
+        max_pending: int = MAX_PENDING_JOBS,
+    ) -> None:
+        self.store = store
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.configure(workers=workers, max_pending=max_pending)
+
+    def configure(
+        self, *, workers: int = None, max_pending: int = None
+    ) -> None:
+        """Changes the number of worker threads and/or pending jobs allowed.
+
+        Raises:
+            RuntimeError: If a job has already been submitted.
+        """
+        with self._lock:
+            if self._executor is not None:
+                raise RuntimeError(
+                    "Unable to configure the job queue once jobs have been"
+                    " submitted."
+                )
+
+            if workers is not None:
+                self.workers = workers
+            if max_pending is not None:
+                self.max_pending = max_pending
+
+            # Running jobs hold a slot too, so that at most @max_pending jobs
+            # are ever waiting for a worker.
+            self._slots = threading.BoundedSemaphore(
+                self.max_pending + self.workers
+            )
+
+    def submit(self, route: Route, environ: Environ) -> Job:
+        """Schedules @route to be run with a copy of @environ.
+
+        Raises:
+            QueueFull: If too many jobs are already waiting to run.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("The job queue is full.")
+
+        try:
+            job_environ = detach_environ(environ)
+            job = Job(
+                id=uuid.uuid4().hex,
+                path=environ["PATH_INFO"],
+                status="pending",
+                created=time.time(),
+            )
+            self.store.save(job)
+            self._get_executor().submit(self._run, job, route, job_environ)
+        except BaseException:
+            self._slots.release()
+            raise
+
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def shutdown(self) -> None:
+        """Waits for every submitted job to finish."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # The executor is created lazily, so that it is never shared with
+        # (pre-forked) child processes.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="rfjob"
+                )
+
+            return self._executor
+
+    def _run(self, job: Job, route: Route, environ: Environ) -> None:
+        try:
+            self.store.save(job._replace(status="running"))
+
+            http_status, result = capture(route, environ)
+            succeeded = http_status is not None and http_status[0] == "2"
+            job = job._replace(
+                status="succeeded" if succeeded else "failed",
+                http_status=http_status,
+                result=result,
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            log.exception(f"Job {job.id} ({job.path}) has crashed.")
+            job = job._replace(status="failed", result=repr(e))
+        finally:
+            self._slots.release()
+
+        self.store.save(job._replace(finished=time.time()))
+
+
+def detach_environ(environ: Environ) -> Dict[str, Any]:
+    """Returns a copy of @environ which outlives the current request.
+
+    The request's params are parsed (since the request body can not be read
+    once the request is finished).
+    """
+    job_environ = dict(environ)
+    if "params" in environ:
+        job_environ["params"] = dict(environ["params"])
+
+    job_environ["wsgi.input"] = io.BytesIO()
+    return job_environ
+
+
+job_queue = JobQueue(JobStore())
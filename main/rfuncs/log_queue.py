@@ -0,0 +1,111 @@
+"""Non-Blocking Logging
+
+Log records are pushed onto a bounded in-memory queue and are written (to
+disk, the console, etc.) by a background thread, so that request handling
+never blocks on disk I/O. If the queue is full, records are dropped (and
+counted) instead.
+"""
+
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+from typing import Optional, Sequence
+
+import prometheus_client as pc
+
+
+DEFAULT_QUEUE_SIZE = 10000
+
+dropped_log_count = pc.Counter(
+    "rfserver_dropped_log_count",
+    "Count of log records which were dropped because the log queue was full.",
+)
+
+
+# The queue listener started by start_queued_logging() (if any).
+_listener: Optional["_QueueListener"] = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler which drops records (rather than blocking or raising)
+    when its queue is full.
+    """
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_log_count.inc()
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room on the (bounded) queue, so that stop() does not fail.
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        # This may be called more than once (e.g. at exit).
+        if self._thread is not None:
+            super().stop()
+
+
+def start_queued_logging(
+    handlers: Sequence[logging.Handler],
+    *,
+    maxsize: int = DEFAULT_QUEUE_SIZE,
+    logger: logging.Logger = None,
+) -> QueueListener:
+    """Sends @logger's records to @handlers via a background thread.
+
+    Args:
+        handlers: These handlers are called from the background thread.
+          Their levels and filters are respected.
+        logger: Defaults to the root logger. Any existing handlers are
+          replaced.
+
+    Returns:
+        The (already started) queue listener. It is stopped at exit, after
+        any queued records have been handled. Processes which exit via
+        os._exit() (which skips exit handlers) must call
+        stop_queued_logging() first.
+    """
+    global _listener  # pylint: disable=global-statement
+
+    if logger is None:
+        logger = logging.getLogger()
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize)
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = _QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+
+    def restart_in_child() -> None:
+        # Only the forking thread survives a fork(), so each (pre-forked)
+        # worker process needs its own queue and background thread.
+        child_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize)
+        queue_handler.queue = child_queue
+        listener.queue = child_queue
+        listener._thread = None  # pylint: disable=protected-access
+        listener.start()
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+
+    listener.start()
+    os.register_at_fork(after_in_child=restart_in_child)
+    atexit.register(listener.stop)
+    _listener = listener
+    return listener
+
+
+def stop_queued_logging() -> None:
+    """Handles any queued records and then stops the background thread.
+
+    Records which are logged after this is called are never handled.
+    """
+    if _listener is not None:
+        _listener.stop()
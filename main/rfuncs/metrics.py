@@ -0,0 +1,78 @@
+"""Prometheus metrics exported by the remote function server.
+
+Failed requests are also counted (by status code) by `routes.error_count`.
+"""
+
+import prometheus_client as pc
+
+
+# In seconds. Most routes finish in a few milliseconds, but some (e.g. jobs
+# that send email) can take several seconds.
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    float("inf"),
+)
+# In bytes.
+SIZE_BUCKETS = tuple(4 ** n for n in range(3, 12)) + (float("inf"),)
+
+PHASES = ["auth", "parse", "handler"]
+
+route_time = pc.Histogram(
+    "rfserver_route_time",
+    "The amount of time spent in each route (in seconds).",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+request_time = pc.Histogram(
+    "rfserver_request_time",
+    "The amount of time spent handling each request (in seconds).",
+    buckets=LATENCY_BUCKETS,
+)
+phase_time = pc.Histogram(
+    "rfserver_request_phase_time",
+    (
+        "The amount of time spent in each phase of handling a request (in"
+        " seconds). The handler phase includes the parse phase, since request"
+        " bodies are parsed lazily."
+    ),
+    ["phase"],
+    buckets=LATENCY_BUCKETS,
+)
+requests_in_progress = pc.Gauge(
+    "rfserver_requests_in_progress",
+    "The number of requests which are currently being handled.",
+    multiprocess_mode="livesum",
+)
+request_size = pc.Histogram(
+    "rfserver_request_size_bytes",
+    "The size of each route's request bodies.",
+    ["endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+response_size = pc.Histogram(
+    "rfserver_response_size_bytes",
+    "The size of each route's response bodies.",
+    ["endpoint"],
+    buckets=SIZE_BUCKETS,
+)
+response_count = pc.Counter(
+    "rfserver_response_count",
+    "Count of responses (by HTTP status code).",
+    ["code"],
+)
+
+for _phase in PHASES:
+    phase_time.labels(_phase)
@@ -1,41 +1,120 @@
-import cgi
+import functools
 import logging
-from typing import Iterable
+import random
+import sys
+import time
+from typing import Any, Iterable, List, Optional
 
-from . import routes
+from . import metrics, routes
 from .authenticator import Authenticator
-from .types import AuthStatus, Environ, MutableEnviron, RouteMap, StartResponse
+from .body_parser import (
+    MAX_BODY_SIZE,
+    BodyError,
+    BodyTooLarge,
+    LazyParams,
+    content_length,
+)
+from .cache import RouteCaches, cached
+from .rate_limiter import RateLimiter, RouteRateLimits
+from .route_registry import match_route
+from .types import (
+    AuthStatus,
+    Environ,
+    MutableEnviron,
+    Route,
+    RouteMap,
+    StartResponse,
+)
 
 
+# Logged response chunks are truncated to this many bytes.
+MAX_LOGGED_CHUNK_SIZE = 1024
+
 log = logging.getLogger(__name__)
 
 
 class PathDispatcher:
-    def __init__(self, server_token: str, route_map: RouteMap) -> None:
+    def __init__(
+        self,
+        server_token: str,
+        route_map: RouteMap,
+        *,
+        route_caches: RouteCaches = None,
+        route_rate_limits: RouteRateLimits = None,
+        max_body_size: int = MAX_BODY_SIZE,
+        response_log_rate: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            response_log_rate: The fraction of response chunks (between 0 and
+              1) which are logged.
+        """
         self.route_map = route_map
+        self.route_caches = {} if route_caches is None else route_caches
+        self.route_rate_limits = (
+            {} if route_rate_limits is None else route_rate_limits
+        )
+        # Created now, so that it is shared with any worker processes that
+        # are forked later.
+        self.rate_limiter = RateLimiter() if self.route_rate_limits else None
+        self.response_log_rate = response_log_rate
         self.authenticator = Authenticator(server_token)
+        self.max_body_size = max_body_size
 
     def __call__(
         self, environ: MutableEnviron, start_response: StartResponse
     ) -> Iterable[bytes]:
-        _params = cgi.FieldStorage(environ["wsgi.input"], environ=environ)
-        params = {key: _params.getvalue(key) for key in _params.keys()}
+        statuses: List[str] = []
+
+        def counting_start_response(
+            status: str, headers: Any, exc_info: Any = None
+        ) -> Any:
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        metrics.requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            yield from self._dispatch(environ, counting_start_response)
+        finally:
+            metrics.requests_in_progress.dec()
+            metrics.request_time.observe(time.perf_counter() - start)
+            # Only the final status is counted, since the status can be
+            # replaced (using exc_info) before the response is sent.
+            if statuses:
+                code = statuses[-1].split(" ", 1)[0]
+                metrics.response_count.labels(code).inc()
 
+    def _dispatch(
+        self, environ: MutableEnviron, start_response: StartResponse
+    ) -> Iterable[bytes]:
+        # The request body is not parsed until a route reads these params.
+        environ["params"] = LazyParams(environ, self.max_body_size)
+
+        auth_start = time.perf_counter()
         method = None
-        if "token" in params:
-            client_token = params["token"]
-            del params["token"]
-            environ["params"] = params
+        client_token = None
+        if content_length(environ) > self.max_body_size:
+            route = routes.Errors.toolarge_413
+        else:
+            try:
+                client_token = _get_client_token(environ)
+            except BodyError as e:
+                route = _body_error_route(e)
+            else:
+                route = routes.Errors.no_token_401
 
+        if client_token is not None:
             path = environ["PATH_INFO"]
             method = environ["REQUEST_METHOD"].lower()
-            route = self.route_map.get(
-                (method, path), routes.Errors.notfound_404
+            route, environ["path_params"] = match_route(
+                self.route_map, method, path
             )
+            if route is None:
+                route = routes.Errors.notfound_404
 
             log.info(
-                f"New Client Request: method={method!r}, path={path!r},"
-                f" params={params!r}"
+                f"New Client Request: method={method!r}, path={path!r}"
             )
 
             client_addr = _get_client_address(environ)
@@ -44,19 +123,132 @@ class PathDispatcher:
                 route = routes.Errors.badauth_401
             elif auth_status is AuthStatus.SUSPENDED:
                 route = routes.Errors.suspended_403
-        else:
-            route = routes.Errors.no_token_401
+            else:
+                # Routes which call other routes (e.g. /batch) must apply
+                # the same policies to each call.
+                environ["apply_route_policies"] = functools.partial(
+                    self._apply_route_policies, client_addr=client_addr
+                )
+                route = self._apply_route_policies(
+                    route, method, environ, client_addr=client_addr
+                )
 
-        for resp_msg in route(environ, start_response):
-            if isinstance(resp_msg, str):
-                resp_msg = resp_msg.encode("utf-8")
+        metrics.phase_time.labels("auth").observe(
+            time.perf_counter() - auth_start
+        )
 
-            if method is not None:
-                log.info(
-                    f"{method.upper()} response from {path} route: {resp_msg!r}"
-                )
+        with metrics.phase_time.labels("handler").time():
+            for resp_msg in _run_route(route, environ, start_response):
+                if isinstance(resp_msg, str):
+                    resp_msg = resp_msg.encode("utf-8")
+
+                if method is not None and self._should_log_response():
+                    log.info(
+                        f"{method.upper()} response from {path} route:"
+                        f" {_truncate(resp_msg)!r}"
+                    )
+
+                yield resp_msg
+
+    def _apply_route_policies(
+        self,
+        route: Route,
+        method: str,
+        environ: MutableEnviron,
+        *,
+        client_addr: str,
+    ) -> Route:
+        """Applies @route's rate limit and response cache (if it has any).
+
+        Returns:
+            The route which should be run instead of @route.
+        """
+        if route in self.route_rate_limits:
+            assert self.rate_limiter is not None
+            endpoint, limit = self.route_rate_limits[route]
+            retry_after = self.rate_limiter.acquire(
+                client_addr, endpoint, limit
+            )
+            if retry_after:
+                environ["retry_after"] = retry_after
+                return routes.Errors.toomany_429
+
+        if method == "get" and route in self.route_caches:
+            return cached(route, self.route_caches[route])
+
+        return route
+
+    def _should_log_response(self) -> bool:
+        if not log.isEnabledFor(logging.INFO):
+            return False
+
+        return (
+            self.response_log_rate >= 1
+            or random.random() < self.response_log_rate
+        )
+
+
+def _truncate(chunk: bytes) -> bytes:
+    """
+    Examples:
+        >>> _truncate(b"x" * 2000)[-24:]
+        b'xxxx... (976 more bytes)'
+    """
+    if len(chunk) <= MAX_LOGGED_CHUNK_SIZE:
+        return chunk
+
+    extra = f"... ({len(chunk) - MAX_LOGGED_CHUNK_SIZE} more bytes)"
+    return chunk[:MAX_LOGGED_CHUNK_SIZE] + extra.encode()
+
+
+def _get_client_token(environ: Environ) -> Optional[str]:
+    """Returns the access token sent by the client (if any).
+
+    The token should be sent using the X-RFServer-Token header, so that the
+    request body does not need to be parsed until it is actually used. For
+    backwards compatibility, it may also be sent as a "token" parameter.
+
+    Raises:
+        BodyError: If the token is not sent using a header and the request
+          body cannot be parsed.
+    """
+    token = environ.get("HTTP_X_RFSERVER_TOKEN")
+    if token is None:
+        token = environ["params"].token
+
+    return token
+
+
+def _run_route(
+    route: Route, environ: Environ, start_response: StartResponse
+) -> Iterable[Any]:
+    """Runs @route, handling any errors raised by lazy param parsing."""
+    response = iter(route(environ, start_response))
+    try:
+        first_msg = next(response)
+    except StopIteration:
+        return
+    except BodyError as e:
+        # No part of the response has been sent yet, so we can still replace
+        # the route's status and headers.
+        exc_info = sys.exc_info()
+
+        def restart_response(status: str, headers: Any) -> Any:
+            return start_response(status, headers, exc_info)
+
+        yield from _body_error_route(e)(environ, restart_response)
+        return
+
+    yield first_msg
+    yield from response
+
+
+def _body_error_route(e: BodyError) -> Route:
+    if isinstance(e, BodyTooLarge):
+        return routes.Errors.toolarge_413
 
-            yield resp_msg
+    log.warning(f"Unable to parse request body: {e}")
+    return routes.Errors.badrequest_400
 
 
 def _get_client_address(environ: Environ) -> str:
@@ -0,0 +1,245 @@
+"""Route Plugins
+
+Routes can be added without editing routes.py, either by installing a package
+which declares "rfuncs.routes" entry points or by pointing rfserver at a
+plugin directory. A plugin directory contains Python modules plus a
+routes.ini file which uses the entry point format. For example:
+
+    [rfuncs.routes]
+    /weather = weather_routes:weather [cache=60]
+    /sendsms = sms_routes:sendsms [post, job, rate_limit=0.1/5]
+
+Each entry maps a path to a route ("module:function") and may specify the
+route's HTTP methods (default: get) and the following options:
+
+    job                   Run the route asynchronously (as a job).
+    cache=TTL             Cache the route's responses for TTL seconds.
+    rate_limit=RATE/BURST Rate limit each client's requests.
+
+Plugin modules are not imported until their route is first called (or until
+they are warmed up), so they do not slow down server (or worker) startup.
+"""
+
+import configparser
+import importlib
+import importlib.metadata
+import logging
+from pathlib import Path
+import re
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .cache import CachePolicy
+from .rate_limiter import RateLimit
+from .route_registry import RouteRegistry
+from .types import AnyStr, Environ, Route, StartResponse
+
+
+ENTRY_POINT_GROUP = "rfuncs.routes"
+PLUGIN_MANIFEST = "routes.ini"
+HTTP_METHODS = {"get", "head", "post", "put", "patch", "delete"}
+
+log = logging.getLogger(__name__)
+
+
+class PluginError(Exception):
+    """Raised when a route plugin is invalid or cannot be loaded."""
+
+
+class LazyRoute:
+    """A route which is not imported until it is first used."""
+
+    def __init__(self, target: str) -> None:
+        module_name, _, attr = target.partition(":")
+        if not module_name or not attr:
+            raise PluginError(
+                f"Invalid route {target!r}. Routes must have the form"
+                " 'module:function'."
+            )
+
+        self.target = target
+        self.__name__ = attr.rpartition(".")[-1]
+
+        self._route: Optional[Route] = None
+        self._lock = threading.Lock()
+
+    def __call__(
+        self, environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        return self.load()(environ, start_response)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.target!r})"
+
+    @property
+    def loaded(self) -> bool:
+        return self._route is not None
+
+    def load(self) -> Route:
+        """Imports (and returns) the route."""
+        if self._route is None:
+            with self._lock:
+                if self._route is None:
+                    self._route = self._import()
+
+        return self._route
+
+    def _import(self) -> Route:
+        module_name, _, attr = self.target.partition(":")
+        try:
+            obj: Any = importlib.import_module(module_name)
+            for name in attr.split("."):
+                obj = getattr(obj, name)
+        except (ImportError, AttributeError) as e:
+            raise PluginError(
+                f"Unable to load the {self.target!r} route: {e}"
+            ) from e
+
+        log.info(f"Loaded the {self.target!r} route.")
+        return obj
+
+
+def discover_routes(
+    registry: RouteRegistry,
+    directories: Sequence[Path] = (),
+    *,
+    use_entry_points: bool = True,
+) -> List[str]:
+    """Registers (lazily loaded) plugin routes with @registry.
+
+    Args:
+        directories: Plugin directories, each of which must contain a
+          routes.ini file. These directories are added to sys.path.
+        use_entry_points: If set, routes are also discovered from the
+          "rfuncs.routes" entry points of installed packages.
+
+    Returns:
+        The paths of the routes that were registered. Routes whose paths have
+        already been registered are skipped.
+
+    Raises:
+        PluginError: If a route is invalid.
+    """
+    entry_points: List[Tuple[str, str]] = []
+    for directory in directories:
+        entry_points.extend(_read_manifest(directory))
+        if str(directory) not in sys.path:
+            sys.path.insert(0, str(directory))
+
+    if use_entry_points:
+        entry_points.extend(_installed_entry_points())
+
+    registered = []
+    for name, value in entry_points:
+        path = "/" + name.strip().lstrip("/")
+        if any(route_path == path for _, route_path in registry.map):
+            log.warning(
+                f"Skipping the {value!r} plugin route, since the {path} route"
+                " is already registered."
+            )
+            continue
+
+        _register(registry, path, value)
+        registered.append(path)
+
+    return registered
+
+
+def warm_up(
+    registry: RouteRegistry, paths: Iterable[str] = None
+) -> List[str]:
+    """Imports lazily loaded routes ahead of time.
+
+    This should be called before serving (and before forking any worker
+    processes), so that the first requests to these routes are not slowed
+    down by their imports.
+
+    Args:
+        paths: The routes to import. Defaults to every lazily loaded route.
+
+    Returns:
+        The paths of the routes that were imported.
+    """
+    lazy_routes = registry.lazy_routes
+    if paths is None:
+        paths = list(lazy_routes)
+
+    warmed_up = []
+    for path in paths:
+        if path not in lazy_routes:
+            log.warning(f"Unable to warm up {path}: No such plugin route.")
+            continue
+
+        lazy_routes[path].load()
+        warmed_up.append(path)
+
+    return warmed_up
+
+
+def _register(registry: RouteRegistry, path: str, value: str) -> None:
+    match = re.match(r"^\s*([\w.]+:[\w.]+)\s*(?:\[(.*)\])?\s*$", value)
+    if match is None:
+        raise PluginError(
+            f"Invalid {path} plugin route: {value!r}. Routes must have the"
+            " form 'module:function [option, ...]'."
+        )
+
+    target, extras = match.group(1), match.group(2) or ""
+    methods: List[str] = []
+    options: Dict[str, Any] = {}
+    for extra in filter(None, map(str.strip, extras.split(","))):
+        name, _, value = extra.partition("=")
+        name = name.strip().lower()
+        value = value.strip()
+        try:
+            if name in HTTP_METHODS and not value:
+                methods.append(name.upper())
+            elif name == "job" and not value:
+                options["job"] = True
+            elif name == "cache":
+                options["cache"] = CachePolicy(ttl=float(value))
+            elif name == "rate_limit":
+                rate, _, burst = value.partition("/")
+                options["rate_limit"] = RateLimit(
+                    rate=float(rate), burst=int(burst)
+                )
+            else:
+                raise ValueError(f"Unknown option: {extra!r}")
+        except ValueError as e:
+            raise PluginError(f"Invalid {path} plugin route: {e}") from e
+
+    lazy_route = LazyRoute(target)
+    try:
+        registry.register(path, methods or None, **options)(lazy_route)
+    except ValueError as e:
+        raise PluginError(f"Invalid {path} plugin route: {e}") from e
+
+    registry.lazy_routes[path] = lazy_route
+
+
+def _read_manifest(directory: Path) -> List[Tuple[str, str]]:
+    manifest = directory / PLUGIN_MANIFEST
+    parser = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+    parser.optionxform = str  # type: ignore  # Paths are case-sensitive.
+    try:
+        with manifest.open() as f:
+            parser.read_file(f)
+    except (OSError, configparser.Error) as e:
+        raise PluginError(f"Unable to read {manifest}: {e}") from e
+
+    if not parser.has_section(ENTRY_POINT_GROUP):
+        return []
+
+    return parser.items(ENTRY_POINT_GROUP)
+
+
+def _installed_entry_points() -> List[Tuple[str, str]]:
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        group = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        # Python < 3.10 returns a dict (of groups).
+        group = entry_points.get(ENTRY_POINT_GROUP, [])  # type: ignore
+
+    return [(entry_point.name, entry_point.value) for entry_point in group]
@@ -0,0 +1,114 @@
+"""Per-Client (and Per-Route) Rate Limiting
+
+Each client gets its own token bucket for every rate-limited route. The
+buckets are stored in a shared memory-mapped file, so they are shared by every
+thread and every (pre-forked) worker process.
+"""
+
+import fcntl
+import math
+import mmap
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, NamedTuple, Tuple
+import zlib
+
+from .types import Route
+
+
+# The number of token buckets that can be tracked at any given time. When two
+# (client, route) pairs map to the same slot, the newest pair takes the slot
+# over (with a full bucket).
+DEFAULT_SLOTS = 4096
+
+# Each slot holds a bucket's key checksum, token count, and the (monotonic)
+# time at which the token count was last updated.
+_SLOT = struct.Struct("=Idd")
+
+
+class RateLimit(NamedTuple):
+    """A Route's Rate Limit
+
+    Each client can make up to @burst requests at once, after which requests
+    are allowed at a rate of @rate requests per second.
+    """
+
+    rate: float
+    burst: int
+
+
+# Maps routes to their endpoints (i.e. registered paths) and rate limits.
+RouteRateLimits = Dict[Route, Tuple[str, RateLimit]]
+
+
+class RateLimiter:
+    """Thread-Safe (and Process-Safe) Token Bucket Rate Limiter
+
+    The limiter must be created before any worker processes are forked.
+    """
+
+    def __init__(self, slots: int = DEFAULT_SLOTS) -> None:
+        self.slots = slots
+
+        # This file is deleted as soon as it is closed. Child processes
+        # inherit (and share) its memory mapping.
+        self._file = tempfile.TemporaryFile(prefix="rfserver-buckets-")
+        self._file.truncate(slots * _SLOT.size)
+        self._buckets = mmap.mmap(self._file.fileno(), slots * _SLOT.size)
+        # File locks do not exclude other threads in the same process.
+        self._lock = threading.Lock()
+
+    def acquire(
+        self, client_addr: str, endpoint: str, limit: RateLimit
+    ) -> float:
+        """Takes a token from the client's bucket for @endpoint.
+
+        Returns:
+            Zero if the request is allowed. Otherwise, the number of seconds
+            until the client's next request would be allowed.
+        """
+        key = f"{client_addr} {endpoint}".encode("utf-8")
+        checksum = zlib.crc32(key)
+        offset = (zlib.adler32(key) % self.slots) * _SLOT.size
+
+        with self._lock:
+            fcntl.lockf(self._file, fcntl.LOCK_EX, _SLOT.size, offset)
+            try:
+                now = time.monotonic()
+                slot_checksum, tokens, updated = _SLOT.unpack_from(
+                    self._buckets, offset
+                )
+                if slot_checksum != checksum or updated == 0:
+                    tokens = float(limit.burst)
+                else:
+                    elapsed = max(now - updated, 0.0)
+                    tokens = min(tokens + elapsed * limit.rate, limit.burst)
+
+                if tokens >= 1:
+                    tokens -= 1
+                    retry_after = 0.0
+                else:
+                    retry_after = (1 - tokens) / limit.rate
+
+                _SLOT.pack_into(self._buckets, offset, checksum, tokens, now)
+            finally:
+                fcntl.lockf(self._file, fcntl.LOCK_UN, _SLOT.size, offset)
+
+        return retry_after
+
+    def close(self) -> None:
+        self._buckets.close()
+        self._file.close()
+
+
+def retry_after_header(retry_after: float) -> str:
+    """
+    Examples:
+        >>> retry_after_header(0.2)
+        '1'
+        >>> retry_after_header(2.5)
+        '3'
+    """
+    return str(max(math.ceil(retry_after), 1))
@@ -0,0 +1,23 @@
+"""Helpers for Running Routes Outside of a WSGI Server"""
+
+from typing import Any, List, Optional, Tuple
+
+from .types import Environ, Route
+
+
+def capture(route: Route, environ: Environ) -> Tuple[Optional[str], str]:
+    """Runs @route and returns its (final) HTTP status and response body."""
+    statuses: List[str] = []
+
+    def start_response(
+        status: str, _headers: Any, _exc_info: Any = None
+    ) -> None:
+        statuses.append(status)
+
+    chunks = []
+    for chunk in route(environ, start_response):
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode("utf-8", errors="replace")
+        chunks.append(chunk)
+
+    return (statuses[-1] if statuses else None), "".join(chunks)
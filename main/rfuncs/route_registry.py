@@ -1,35 +1,177 @@
-from typing import Callable, Sequence
-
-import prometheus_client as pc
-
-from .types import Route, RouteMap
-
-
-route_time = pc.Summary(
-    "rfserver_route_time",
-    "The amount of time spent in each route.",
-    ["endpoint"],
+import functools
+import json
+import re
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
 )
 
+from . import metrics
+from .body_parser import content_length
+from .cache import CachePolicy, ResponseCache, RouteCaches
+from .jobs import QueueFull, job_queue
+from .rate_limiter import RateLimit, RouteRateLimits
+from .types import AnyStr, Environ, Route, RouteMap, StartResponse
+
 
 class RouteRegistry:
     def __init__(self) -> None:
         self.map: RouteMap = {}
+        self.caches: RouteCaches = {}
+        self.rate_limits: RouteRateLimits = {}
+        # Maps paths to the routes (registered by plugins) which are not
+        # imported until they are first used.
+        self.lazy_routes: Dict[str, Any] = {}
 
     def to_route_map(self) -> RouteMap:
         return self.map
 
     def register(
-        self, path: str, methods: Sequence[str] = None
+        self,
+        path: str,
+        methods: Sequence[str] = None,
+        *,
+        job: bool = False,
+        cache: CachePolicy = None,
+        rate_limit: RateLimit = None,
     ) -> Callable[[Route], Route]:
+        """Registers a route.
+
+        Args:
+            path: The route's path. Path segments of the form <name> match
+              any single path segment, which is then made available to the
+              route via environ["path_params"]["name"].
+            job: If set, the route is run asynchronously (as a job).
+            cache: If set, the route's responses are cached according to
+              this policy. Only idempotent GET routes should be cached.
+            rate_limit: If set, each client's requests to this route are
+              limited to this rate.
+        """
         if methods is None:
             methods = ["GET"]
 
+        if cache is not None and (
+            job or [m.upper() for m in methods] != ["GET"]
+        ):
+            raise ValueError(
+                f"Unable to cache the {path} route. Only (non-job) GET routes"
+                " can be cached."
+            )
+
         def _register(route: Route) -> Route:
             assert methods is not None
-            timed_route = route_time.labels(endpoint=path).time()(route)
+            timed_route = _instrument_route(route, path)
+            registered_route = (
+                _job_route(timed_route) if job else timed_route
+            )
             for method in methods:
-                self.map[method.lower(), path] = timed_route
+                self.map[method.lower(), path] = registered_route
+
+            if cache is not None:
+                self.caches[registered_route] = ResponseCache(path, cache)
+
+            if rate_limit is not None:
+                self.rate_limits[registered_route] = (path, rate_limit)
+
             return timed_route
 
         return _register
+
+
+def match_route(
+    route_map: RouteMap, method: str, path: str
+) -> Tuple[Optional[Route], Dict[str, str]]:
+    """Finds the route in @route_map that matches @method and @path.
+
+    Returns:
+        The matching route (or None) and the values of its path parameters.
+    """
+    route = route_map.get((method, path))
+    if route is not None:
+        return route, {}
+
+    for (route_method, route_path), route in route_map.items():
+        if route_method != method or "<" not in route_path:
+            continue
+
+        match = _path_pattern(route_path).match(path)
+        if match:
+            return route, match.groupdict()
+
+    return None, {}
+
+
+@functools.lru_cache(maxsize=None)
+def _path_pattern(route_path: str) -> Pattern[str]:
+    """
+    Examples:
+        >>> _path_pattern("/jobs/<job_id>").match("/jobs/abc").groupdict()
+        {'job_id': 'abc'}
+    """
+    pattern = re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", re.escape(route_path))
+    # re.escape() escapes the angle brackets on older versions of Python.
+    pattern = re.sub(r"\\<(\w+)\\>", r"(?P<\1>[^/]+)", pattern)
+    return re.compile(pattern + "$")
+
+
+def _instrument_route(route: Route, endpoint: str) -> Route:
+    """Wraps @route so that its latency and request/response sizes are
+    recorded.
+
+    Routes are generators, so a route is only considered finished once its
+    response has been exhausted.
+    """
+
+    @functools.wraps(route)
+    def instrumented_route(
+        environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        metrics.request_size.labels(endpoint).observe(content_length(environ))
+
+        size = 0
+        start = time.perf_counter()
+        try:
+            for chunk in route(environ, start_response):
+                if isinstance(chunk, str):
+                    size += len(chunk.encode("utf-8"))
+                else:
+                    size += len(chunk)
+                yield chunk
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.route_time.labels(endpoint).observe(elapsed)
+            metrics.response_size.labels(endpoint).observe(size)
+
+    return instrumented_route
+
+
+def _job_route(route: Route) -> Route:
+    """Wraps @route so that it is run as an asynchronous job."""
+
+    def job_route(
+        environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        # Imported here, since the routes module imports this one.
+        from .routes import Errors
+
+        try:
+            job = job_queue.submit(route, environ)
+        except QueueFull:
+            yield from Errors.unavailable_503(environ, start_response)
+            return
+
+        status_url = f"/jobs/{job.id}"
+        start_response(
+            "202 Accepted",
+            [("Content-type", "application/json"), ("Location", status_url)],
+        )
+        yield json.dumps({"job_id": job.id, "status_url": status_url})
+
+    return job_route
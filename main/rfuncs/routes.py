@@ -1,27 +1,47 @@
 import json
 import logging
-from typing import Iterable
+from typing import Any, Dict, Iterable, Optional, Tuple
 
 import prometheus_client as pc
 
 from .authenticator import ATTEMPT_LIMIT, ATTEMPT_PERIOD
-from .route_registry import RouteRegistry
+from .cache import CachePolicy
+from .jobs import detach_environ, job_queue
+from .rate_limiter import RateLimit, retry_after_header
+from .responses import capture
+from .route_registry import RouteRegistry, match_route
 from .types import AnyStr, Environ, StartResponse
 
 
+JSON_HEADER = [("Content-type", "application/json")]
 PLAIN_HEADER = [("Content-type", "text/plain")]
 
+# The maximum number of calls that can be made using a single /batch request.
+MAX_BATCH_CALLS = 100
+
 log = logging.getLogger(__name__)
 route_registry = RouteRegistry()
 route = route_registry.register
 
 error_count = pc.Counter("rfserver_error_count", "Count of failed requests.", ["code"])
+error_count.labels(400)
 error_count.labels(401)
 error_count.labels(403)
 error_count.labels(404)
+error_count.labels(413)
+error_count.labels(429)
+error_count.labels(503)
 
 
 class Errors:
+    @staticmethod
+    def badrequest_400(
+        _environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        error_count.labels(400).inc()
+        start_response("400 Bad Request", PLAIN_HEADER)
+        yield "Bad Request: Unable to parse the request body"
+
     @staticmethod
     def badauth_401(
         _environ: Environ, start_response: StartResponse
@@ -54,12 +74,129 @@ class Errors:
     def notfound_404(
         _environ: Environ, start_response: StartResponse
     ) -> Iterable[AnyStr]:
-        error_count.labels(403).inc()
+        error_count.labels(404).inc()
         start_response("404 Not Found", PLAIN_HEADER)
         yield "Not Found"
 
+    @staticmethod
+    def toolarge_413(
+        _environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        error_count.labels(413).inc()
+        start_response("413 Payload Too Large", PLAIN_HEADER)
+        yield "Payload Too Large: The request body is too large"
+
+    @staticmethod
+    def toomany_429(
+        environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        error_count.labels(429).inc()
+        retry_after = retry_after_header(environ.get("retry_after", 1))
+        start_response(
+            "429 Too Many Requests",
+            PLAIN_HEADER + [("Retry-After", retry_after)],
+        )
+        yield (
+            "Too Many Requests: This route's rate limit has been exceeded."
+            f" Try again in {retry_after} seconds."
+        )
+
+    @staticmethod
+    def unavailable_503(
+        environ: Environ, start_response: StartResponse
+    ) -> Iterable[AnyStr]:
+        error_count.labels(503).inc()
+        retry_after = retry_after_header(environ.get("retry_after", 1))
+        start_response(
+            "503 Service Unavailable",
+            PLAIN_HEADER + [("Retry-After", retry_after)],
+        )
+        yield (
+            "Service Unavailable: Too many jobs are queued."
+            f" Try again in {retry_after} seconds."
+        )
+
+
+# Job statuses are polled frequently, so they are cached (briefly).
+@route("/jobs/<job_id>", cache=CachePolicy(ttl=1))
+def job_status(
+    environ: Environ, start_response: StartResponse
+) -> Iterable[AnyStr]:
+    job = job_queue.get(environ["path_params"]["job_id"])
+    if job is None:
+        yield from Errors.notfound_404(environ, start_response)
+        return
+
+    start_response("200 OK", JSON_HEADER)
+    yield json.dumps(job._asdict())
+
+
+@route("/batch", methods=["POST"])
+def batch(environ: Environ, start_response: StartResponse) -> Iterable[AnyStr]:
+    """Makes several calls (to other routes) using a single request.
+
+    The request body should be a JSON object of the form
+    {"calls": [{"method": ..., "path": ..., "params": {...}}, ...]}. The
+    response contains one {"status": ..., "body": ...} result per call (in
+    the same order).
+    """
+    calls = environ["params"].get("calls")
+    if (
+        not isinstance(calls, list)
+        or len(calls) > MAX_BATCH_CALLS
+        or not all(isinstance(call, dict) for call in calls)
+    ):
+        yield from Errors.badrequest_400(environ, start_response)
+        return
+
+    results = []
+    for call in calls:
+        status, body = _batch_call(environ, call)
+        results.append({"status": status, "body": body})
+
+    start_response("200 OK", JSON_HEADER)
+    yield json.dumps({"results": results})
+
+
+def _batch_call(
+    environ: Environ, call: Dict[str, Any]
+) -> Tuple[Optional[str], str]:
+    method = str(call.get("method", "POST")).lower()
+    path = "/" + str(call.get("path", "")).lstrip("/")
+    params = call.get("params") or {}
+
+    call_route, path_params = match_route(
+        route_registry.to_route_map(), method, path
+    )
+
+    call_environ = detach_environ(environ)
+    call_environ.update(
+        REQUEST_METHOD=method.upper(),
+        PATH_INFO=path,
+        CONTENT_LENGTH="0",
+        params=params if isinstance(params, dict) else {},
+        path_params=path_params,
+    )
+
+    if call_route is None or call_route is batch:
+        call_route = Errors.notfound_404
+    elif "apply_route_policies" in environ:
+        # Each call counts against the client's rate limits (and can be
+        # served from the response cache).
+        call_route = environ["apply_route_policies"](
+            call_route, method, call_environ
+        )
+
+    return capture(call_route, call_environ)
+
 
-@route("/sendmail", methods=["POST"])
+# Allows bursts of up to 10 emails, and then one email every 6 seconds.
+@route(
+    "/sendmail",
+    methods=["POST"],
+    job=True,
+    rate_limit=RateLimit(rate=1 / 6, burst=10),
+)
 def sendmail(
     environ: Environ, start_response: StartResponse
 ) -> Iterable[AnyStr]:
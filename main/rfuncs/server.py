@@ -3,15 +3,26 @@
 import argparse
 import logging
 import os
+from pathlib import Path
 import sys
-from typing import NamedTuple, Sequence
-from wsgiref.simple_server import make_server
+from typing import List, NamedTuple, Sequence
 
 import prometheus_client as pc
+from prometheus_client import multiprocess
 
 from . import client
+from .body_parser import MAX_BODY_SIZE
+from .jobs import DEFAULT_JOB_WORKERS, job_queue
+from .log_queue import DEFAULT_QUEUE_SIZE, start_queued_logging
 from .path_dispatcher import PathDispatcher
+from .plugins import discover_routes, warm_up
 from .routes import route_registry
+from .servers import (
+    DEFAULT_BACKLOG,
+    DEFAULT_WORKERS,
+    make_wsgi_server,
+    serve_prefork,
+)
 
 
 log = logging.getLogger(__name__)
@@ -20,6 +31,16 @@ PROMETHEUS_METRICS_PORT = 9101
 
 class Arguments(NamedTuple):
     port: int
+    workers: int
+    processes: int
+    backlog: int
+    job_workers: int
+    max_body_size: int
+    log_queue_size: int
+    response_log_rate: float
+    routes_dirs: List[Path]
+    warm_up: List[str]
+    warm_up_all: bool
     token: str
 
 
@@ -32,6 +53,98 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
         default=client.default_port(),
         help="The network port this server will listen on.",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=(
+            "The number of worker threads (per process) used to handle"
+            " requests. If set to 1, requests are handled one at a time."
+            " Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "-P",
+        "--processes",
+        type=int,
+        default=1,
+        help=(
+            "The number of (pre-forked) worker processes. Defaults to"
+            " %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=DEFAULT_BACKLOG,
+        help=(
+            "The maximum number of pending connections. Defaults to"
+            " %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--job-workers",
+        type=int,
+        default=DEFAULT_JOB_WORKERS,
+        help=(
+            "The number of worker threads (per process) used to run"
+            " asynchronous jobs. Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--max-body-size",
+        type=int,
+        default=MAX_BODY_SIZE,
+        help=(
+            "The maximum size (in bytes) of a request body. Defaults to"
+            " %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--log-queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=(
+            "The maximum number of log records waiting to be written. Any"
+            " more are dropped. Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--response-log-rate",
+        type=float,
+        default=1.0,
+        help=(
+            "The fraction (between 0 and 1) of response chunks which are"
+            " logged. Defaults to %(default)s."
+        ),
+    )
+    parser.add_argument(
+        "--routes-dir",
+        dest="routes_dirs",
+        type=Path,
+        action="append",
+        default=[],
+        help=(
+            "A plugin directory containing route modules and a routes.ini"
+            " file. Can be given multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--warm-up",
+        metavar="PATH",
+        action="append",
+        default=[],
+        help=(
+            "Import the plugin route at this path before serving requests."
+            " Can be given multiple times."
+        ),
+    )
+    parser.add_argument(
+        "--warm-up-all",
+        action="store_true",
+        help="Import every plugin route before serving requests.",
+    )
     parser.add_argument(
         "-T",
         "--token",
@@ -42,18 +155,47 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
     return Arguments(**dict(args._get_kwargs()))
 
 
-def init_logging() -> None:
+def init_logging(queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+    """Sets up logging to a file (and to the console, for this module).
+
+    Records are written by a background thread, so that request handling
+    never blocks on disk I/O.
+    """
     log_dir = "/var/log" if os.access("/var/log", os.W_OK) else "/var/tmp"
     log_file = f"{log_dir}/rfserver.log"
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
-        datefmt="%y-%m-%d %H:%M:%S",
-        filename=log_file,
-        filemode="a+",
+
+    file_handler = logging.FileHandler(log_file, mode="a+")
+    file_handler.setFormatter(
+        logging.Formatter(
+            "%(asctime)s %(name)-12s %(levelname)-8s %(message)s",
+            datefmt="%y-%m-%d %H:%M:%S",
+        )
     )
     console = logging.StreamHandler()
-    log.addHandler(console)
+    console.addFilter(logging.Filter(log.name))
+
+    logging.getLogger().setLevel(logging.INFO)
+    start_queued_logging([file_handler, console], maxsize=queue_size)
+
+
+def start_metrics_server(prefork: bool) -> None:
+    """Starts the HTTP server which serves our Prometheus metrics.
+
+    Metrics are only collected from every worker process (when pre-forking)
+    if the PROMETHEUS_MULTIPROC_DIR environment variable is set.
+    """
+    if prefork and "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = pc.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        pc.start_http_server(PROMETHEUS_METRICS_PORT, registry=registry)
+    else:
+        if prefork:
+            log.warning(
+                "The PROMETHEUS_MULTIPROC_DIR environment variable is not"
+                " set, so metrics from the worker processes will be lost."
+            )
+
+        pc.start_http_server(PROMETHEUS_METRICS_PORT)
 
 
 def main(argv: Sequence[str] = None) -> int:
@@ -62,23 +204,52 @@ def main(argv: Sequence[str] = None) -> int:
 
     args = parse_cli_args(argv)
 
-    init_logging()
+    init_logging(args.log_queue_size)
     try:
-        pc.start_http_server(PROMETHEUS_METRICS_PORT)
+        prefork = args.processes > 1
+        start_metrics_server(prefork)
         pid_dir = "/var/run" if os.access("/var/run", os.W_OK) else "/tmp"
         pid_file = f"{pid_dir}/rfserver.pid"
         with open(pid_file, "w") as f:
             f.write(str(os.getpid()))
 
+        job_queue.configure(workers=args.job_workers)
+        plugin_paths = discover_routes(route_registry, args.routes_dirs)
+        if plugin_paths:
+            log.info(f"Discovered plugin routes: {', '.join(plugin_paths)}")
+
         dispatcher = PathDispatcher(
-            args.token, route_map=route_registry.to_route_map()
+            args.token,
+            route_map=route_registry.to_route_map(),
+            route_caches=route_registry.caches,
+            route_rate_limits=route_registry.rate_limits,
+            max_body_size=args.max_body_size,
+            response_log_rate=args.response_log_rate,
+        )
+
+        httpd = make_wsgi_server(
+            args.port,
+            dispatcher,
+            workers=args.workers,
+            backlog=args.backlog,
         )
+        if args.warm_up_all or args.warm_up:
+            warm_up(route_registry, None if args.warm_up_all else args.warm_up)
 
-        httpd = make_server("", args.port, dispatcher)
         log.info(f"Serving on port {args.port}...")
-        httpd.serve_forever()
+        if prefork:
+            serve_prefork(
+                httpd, args.processes, on_child_exit=_mark_process_dead
+            )
+        else:
+            httpd.serve_forever()
     except Exception:
         log.exception("The remote function server has crashed.")
         raise
 
     return 0
+
+
+def _mark_process_dead(pid: int) -> None:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,300 @@
+"""Concurrent WSGI Servers
+
+The wsgiref server handles one request at a time, so a single slow route
+stalls every other client. The servers defined here hand each request off to a
+bounded pool of worker threads and can (optionally) be shared by several
+pre-forked worker processes. They also keep HTTP/1.1 connections alive, so
+that clients can reuse a single connection for many requests.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import types
+from typing import Any, Callable, Set, Tuple
+from wsgiref.simple_server import (
+    ServerHandler,
+    WSGIRequestHandler,
+    WSGIServer,
+    make_server,
+)
+
+from .log_queue import stop_queued_logging
+from .types import WSGIApp
+
+
+DEFAULT_BACKLOG = 64
+DEFAULT_WORKERS = 8
+
+# How long (in seconds) an idle keep-alive connection is kept open. Each open
+# connection ties up a worker thread, so this should be kept short.
+KEEPALIVE_TIMEOUT = 5
+# The maximum number of requests served over a single connection.
+MAX_KEEPALIVE_REQUESTS = 100
+# Unread request bodies larger than this (in bytes) are not drained. The
+# connection is closed instead.
+MAX_DRAIN_SIZE = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """WSGI request handler which supports persistent HTTP/1.1 connections.
+
+    Responses are buffered, so that their Content-Length is always known.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    # Otherwise, small responses on a reused connection can be delayed (by
+    # up to 40ms) waiting for the client to ACK the previous write.
+    disable_nagle_algorithm = True
+
+    # WSGIRequestHandler.handle() only ever handles a single request.
+    handle = BaseHTTPRequestHandler.handle
+
+    def handle_one_request(self) -> None:
+        self.close_connection = True
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except socket.timeout:
+            return
+
+        if not self.raw_requestline:
+            return
+
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return
+
+        if not self.parse_request():
+            return
+
+        self.request_count = getattr(self, "request_count", 0) + 1
+        if self.request_count >= MAX_KEEPALIVE_REQUESTS:
+            self.close_connection = True
+
+        body = _RequestBody(self.rfile, self.headers.get("Content-Length"))
+        handler = _KeepAliveServerHandler(
+            body, self.wfile, self.get_stderr(), self.get_environ()
+        )
+        handler.request_handler = self  # backpointer for logging
+        handler.run(self.server.get_app())
+
+        if not self.close_connection and not body.drain():
+            self.close_connection = True
+
+
+class _KeepAliveServerHandler(ServerHandler):
+    http_version = "1.1"
+
+    def start_response(
+        self, status: str, headers: Any, exc_info: Any = None
+    ) -> Any:
+        # The headers are modified in place by cleanup_headers(), so we copy
+        # them (routes often pass us a shared, module-level list).
+        return super().start_response(status, list(headers), exc_info)
+
+    def finish_response(self) -> None:
+        try:
+            body = b"".join(self.result)
+        finally:
+            if hasattr(self.result, "close"):
+                self.result.close()
+
+        self.result = [body]
+        super().finish_response()
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        # If the app left too much of the request body unread, we have to
+        # close the connection (and must tell the client so).
+        if self.stdin.remaining > MAX_DRAIN_SIZE:
+            self.request_handler.close_connection = True
+
+        if self.request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+
+class _RequestBody:
+    """A request's body (which must not be read past its Content-Length)."""
+
+    def __init__(self, rfile: Any, content_length: str = None) -> None:
+        self.rfile = rfile
+        try:
+            self.remaining = max(int(content_length or 0), 0)
+        except ValueError:
+            self.remaining = 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.rfile.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.rfile.readline(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def drain(self) -> bool:
+        """Discards the unread part of the body.
+
+        Returns:
+            True if the connection can be reused.
+        """
+        if self.remaining > MAX_DRAIN_SIZE:
+            return False
+
+        while self.remaining > 0:
+            if not self.read(self.remaining):
+                return False
+
+        return True
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """WSGI server which handles requests using a bounded thread pool.
+
+    When every worker thread is busy, we stop accepting new connections, so
+    they queue up in the socket's accept backlog instead.
+    """
+
+    def __init__(
+        self,
+        server_address: Tuple[str, int],
+        handler_class: type = KeepAliveRequestHandler,
+        *,
+        workers: int = DEFAULT_WORKERS,
+        backlog: int = DEFAULT_BACKLOG,
+    ) -> None:
+        # Used by server_activate() as the argument to listen().
+        self.request_queue_size = backlog
+        self.workers = workers
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="rfserver"
+        )
+        self._idle_workers = threading.BoundedSemaphore(workers)
+
+        super().__init__(server_address, handler_class)
+
+    def process_request(
+        self, request: socket.socket, client_address: Tuple[str, int]
+    ) -> None:
+        self._idle_workers.acquire()
+        self._executor.submit(self._process_request, request, client_address)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
+    def _process_request(
+        self, request: socket.socket, client_address: Tuple[str, int]
+    ) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._idle_workers.release()
+
+
+def make_wsgi_server(
+    port: int,
+    app: WSGIApp,
+    *,
+    workers: int = DEFAULT_WORKERS,
+    backlog: int = DEFAULT_BACKLOG,
+) -> WSGIServer:
+    """Returns a WSGI server which serves @app on @port.
+
+    Args:
+        workers: The number of requests that can be handled at once. If set
+          to 1, requests are handled by the server's own thread.
+        backlog: The maximum number of pending connections.
+    """
+    if workers == 1:
+        return make_server("", port, app)
+
+    httpd = ThreadPoolWSGIServer(("", port), workers=workers, backlog=backlog)
+    httpd.set_app(app)
+    return httpd
+
+
+def serve_prefork(
+    httpd: WSGIServer,
+    processes: int,
+    on_child_exit: Callable[[int], None] = None,
+) -> None:
+    """Serves forever using @processes worker processes.
+
+    Each worker process is forked from this one and accepts connections
+    from @httpd's (shared) listening socket. Any worker that dies is
+    replaced.
+
+    Args:
+        on_child_exit: Called with the PID of each worker process that exits.
+    """
+    children: Set[int] = set()
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+            ec = 0
+            try:
+                httpd.serve_forever()
+            except BaseException:  # pylint: disable=broad-except
+                log.exception(f"Worker process {os.getpid()} has crashed.")
+                ec = 1
+            finally:
+                # os._exit() skips exit handlers, so queued log records
+                # (e.g. the crash above) must be written first.
+                stop_queued_logging()
+                os._exit(ec)  # pylint: disable=protected-access
+
+        children.add(pid)
+
+    def term_handler(
+        signum: int, frame: types.FrameType,  # pylint: disable=unused-argument
+    ) -> None:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+        sys.exit(128 + signum)
+
+    for _ in range(processes):
+        spawn()
+
+    signal.signal(signal.SIGTERM, term_handler)
+    signal.signal(signal.SIGINT, term_handler)
+
+    log.info(f"Started {processes} worker processes.")
+    while True:
+        pid, status = os.wait()
+        children.discard(pid)
+        if on_child_exit is not None:
+            on_child_exit(pid)
+
+        log.warning(
+            f"Worker process {pid} exited with status {status}. Restarting"
+            " it..."
+        )
+        spawn()
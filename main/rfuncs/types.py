@@ -29,6 +29,7 @@ Environ = Mapping[str, Any]
 MutableEnviron = MutableMapping[str, Any]
 Route = Callable[[Environ, 'StartResponse'], Iterable[AnyStr]]
 RouteMap = Dict[Tuple[str, str], Route]
+WSGIApp = Callable[[MutableEnviron, 'StartResponse'], Iterable[bytes]]
 
 
 class StartResponse(Protocol):
@@ -0,0 +1,452 @@
+import asyncio
+from pathlib import Path
+import tempfile
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence
+import unittest
+from unittest import mock
+
+import prometheus_client as pc
+
+from libtorrent import deluge, ipc, metrics, worker
+from libtorrent.aio import AsyncEngine, AsyncStatusPoller, EngineStoppedError
+from libtorrent.deluge import TorrentStatus
+from libtorrent.journal import Job, Journal
+from libtorrent.poller import StatusPoller
+from libtorrent.tracker import DuplicateMagnetError, MagnetTracker
+
+
+def _status(ID: str, state: str = "Downloading") -> TorrentStatus:
+    return TorrentStatus(
+        id=ID,
+        name=f"torrent-{ID}",
+        state=state,
+        progress=0.0,
+        download_rate=0.0,
+        upload_rate=0.0,
+        total_done=0,
+        total_wanted=0,
+    )
+
+
+class FakeDaemon:
+    """Stands in for deluged. Every client talks to the same fake daemon."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.torrents: Dict[str, TorrentStatus] = {}
+        self.connections = 0
+        self.calls = 0
+        self.is_up = True
+
+
+class FakeClient:
+    def __init__(self, daemon: FakeDaemon) -> None:
+        if not daemon.is_up:
+            raise deluge.DelugeConnectionError("Connection refused.")
+
+        self.daemon = daemon
+        self.closed = False
+        with daemon.lock:
+            daemon.connections += 1
+
+    def torrent_ids(self) -> List[str]:
+        self._check()
+        return list(self.daemon.torrents)
+
+    def statuses(
+        self, ids: Iterable[str] = None
+    ) -> Dict[str, TorrentStatus]:
+        self._check()
+        return {
+            ID: status
+            for ID, status in self.daemon.torrents.items()
+            if ids is None or ID in ids
+        }
+
+    def add_magnet(self, magnet: str, download_dir: Path) -> Optional[str]:
+        self._check()
+        self.daemon.torrents[magnet] = _status(magnet)
+        return magnet
+
+    def remove(self, ID: str) -> bool:
+        self._check()
+        return self.daemon.torrents.pop(ID, None) is not None
+
+    def close(self) -> None:
+        self.closed = True
+
+    def _check(self) -> None:
+        with self.daemon.lock:
+            self.daemon.calls += 1
+
+        if not self.daemon.is_up:
+            raise deluge.DelugeConnectionError("Connection lost.")
+
+
+class FakeFallback(FakeClient):
+    def __init__(self) -> None:
+        super().__init__(FakeDaemon())
+
+
+class TestClientPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.daemon = FakeDaemon()
+        self.fallback = FakeFallback()
+        self.pool = deluge.ClientPool(
+            lambda: FakeClient(self.daemon), size=2, fallback=self.fallback
+        )
+
+    def test_connection_is_reused(self) -> None:
+        for i in range(10):
+            self.pool.add_magnet(str(i), Path("/tmp"))
+
+        self.assertEqual(self.daemon.connections, 1)
+        self.assertEqual(len(self.pool.torrent_ids()), 10)
+        self.assertTrue(self.pool.remove("0"))
+        self.assertFalse(self.pool.remove("0"))
+
+    def test_pool_size_is_bounded(self) -> None:
+        def hammer() -> None:
+            for _ in range(50):
+                self.pool.statuses()
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(self.daemon.connections, 2)
+        self.assertEqual(self.daemon.calls, 8 * 50)
+
+    def test_fallback_when_daemon_is_unreachable(self) -> None:
+        self.daemon.is_up = False
+        self.pool.add_magnet("foo", Path("/tmp"))
+
+        self.assertEqual(self.daemon.connections, 0)
+        self.assertEqual(self.fallback.torrent_ids(), ["foo"])
+
+    def test_fallback_when_connection_is_lost(self) -> None:
+        self.pool.add_magnet("foo", Path("/tmp"))
+        self.daemon.is_up = False
+        self.pool.add_magnet("bar", Path("/tmp"))
+
+        self.assertEqual(list(self.daemon.torrents), ["foo"])
+        self.assertEqual(self.fallback.torrent_ids(), ["bar"])
+
+
+class TestStatusPoller(unittest.TestCase):
+    def test_one_request_per_poll(self) -> None:
+        daemon = FakeDaemon()
+        client = FakeClient(daemon)
+        for i in range(20):
+            client.add_magnet(str(i), Path("/tmp"))
+
+        poller = StatusPoller(client, interval=0.01)
+        for ID in client.torrent_ids():
+            poller.track(ID)
+
+        results: Dict[str, TorrentStatus] = {}
+
+        def wait(ID: str) -> None:
+            results[ID] = poller.wait_for_status(ID)
+
+        threads = [
+            threading.Thread(target=wait, args=(ID,))
+            for ID in client.torrent_ids()
+        ]
+        calls_before = daemon.calls
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(results), set(daemon.torrents))
+        self.assertLessEqual(daemon.calls - calls_before, 3)
+
+    def test_untracked_torrent(self) -> None:
+        poller = StatusPoller(FakeClient(FakeDaemon()), interval=0.01)
+        with self.assertRaises(ValueError):
+            poller.wait_for_status("foo")
+
+
+class TestAsyncStatusPoller(unittest.TestCase):
+    def test_one_request_per_poll(self) -> None:
+        daemon = FakeDaemon()
+        client = FakeClient(daemon)
+        for i in range(20):
+            client.add_magnet(str(i), Path("/tmp"))
+
+        async def wait_for_all() -> List[TorrentStatus]:
+            poller = AsyncStatusPoller(client, interval=0.01)
+            poller_task = asyncio.ensure_future(poller.run())
+            statuses = await asyncio.gather(
+                *[poller.wait_for_status(ID) for ID in daemon.torrents]
+            )
+            poller_task.cancel()
+            return statuses
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        calls_before = daemon.calls
+        try:
+            statuses = loop.run_until_complete(wait_for_all())
+        finally:
+            loop.close()
+
+        self.assertEqual(
+            [status.id for status in statuses], list(daemon.torrents)
+        )
+        self.assertEqual(daemon.calls - calls_before, 1)
+
+
+class TestAsyncEngine(unittest.TestCase):
+    def test_run_without_torrents(self) -> None:
+        magnet = "magnet:?xt=urn:btih:c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+        tracker = MagnetTracker()
+        key = tracker.new(magnet)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal = Journal(Path(tmpdir) / "journal")
+            patch_tracker = mock.patch.object(
+                worker._TorrentWorker, "magnet_tracker", tracker
+            )
+            with mock.patch.object(worker, "_journal", journal), patch_tracker:
+                engine = AsyncEngine()
+                # Every magnet is a duplicate, so no task is ever spawned.
+                keys = worker.enqueue_magnets(
+                    [magnet], Path("/tmp"), 0, engine.submit
+                )
+                self.assertEqual(keys, [key])
+
+                # This would block forever if the engine waited for a task.
+                engine.run()
+
+                with self.assertRaises(EngineStoppedError):
+                    engine.submit("magnet:?dn=foo", Path("/tmp"), 0)
+
+
+class TestEnqueueServer(unittest.TestCase):
+    def test_concurrent_submissions(self) -> None:
+        lock = threading.Lock()
+        submitted: List[str] = []
+
+        def submit(
+            magnets: Sequence[str], _download_dir: Path, _timeout: float
+        ) -> List[int]:
+            keys = []
+            with lock:
+                for magnet in magnets:
+                    submitted.append(magnet)
+                    keys.append(len(submitted))
+            return keys
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "socket"
+            server = ipc.serve(submit, path=path)
+
+            keys: List[int] = []
+
+            def send(i: int) -> None:
+                keys.extend(
+                    ipc.send_magnets(
+                        [f"foo{i}", f"bar{i}"], Path("/tmp"), 0, path=path
+                    )
+                )
+
+            threads = [
+                threading.Thread(target=send, args=(i,)) for i in range(20)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(len(submitted), 40)
+        self.assertEqual(sorted(keys), list(range(1, 41)))
+
+    def test_errors_are_sent_to_the_client(self) -> None:
+        def submit(
+            magnets: Sequence[str], _download_dir: Path, _timeout: float
+        ) -> List[int]:
+            raise RuntimeError(f"Unable to enqueue {magnets[0]}.")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "socket"
+            server = ipc.serve(submit, path=path)
+            try:
+                with self.assertRaisesRegex(RuntimeError, "Unable to enqueue"):
+                    ipc.send_magnets(["foo"], Path("/tmp"), 0, path=path)
+
+                bad_magnets: List = [1]
+                with self.assertRaisesRegex(RuntimeError, "Invalid request"):
+                    ipc.send_magnets(bad_magnets, Path("/tmp"), 0, path=path)
+            finally:
+                server.shutdown()
+                server.server_close()
+
+
+class TestJournal(unittest.TestCase):
+    def test_replay(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "journal"
+            journal = Journal(path)
+            journal.enqueued(1, "foo", Path("/tmp"), 0)
+            journal.enqueued(2, "bar", Path("/tmp"), 1.5)
+            journal.enqueued(3, "baz", Path("/tmp"), 0)
+            journal.started(1, "abc")
+            journal.started(2, "def")
+            journal.finished(2)
+
+            # Simulate a crash in the middle of a write.
+            with path.open("a") as f:
+                f.write('{"event": "fini')
+
+            expected = [
+                Job(1, "foo", Path("/tmp"), 0, "abc"),
+                Job(3, "baz", Path("/tmp"), 0),
+            ]
+            self.assertEqual(journal.replay(), expected)
+
+            # The journal should have been compacted.
+            self.assertEqual(len(path.read_text().splitlines()), 3)
+            self.assertEqual(Journal(path).replay(), expected)
+
+
+class TestResumeJobs(unittest.TestCase):
+    def test_new_keys_do_not_collide_with_unfinished_jobs(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            journal = Journal(Path(tmpdir) / "journal")
+            journal.enqueued(1, "foo", Path("/tmp"), 0)
+            journal.enqueued(2, "bar", Path("/tmp"), 0)
+            journal.finished(1)
+
+            tracker = MagnetTracker()
+            patch_tracker = mock.patch.object(
+                worker._TorrentWorker, "magnet_tracker", tracker
+            )
+            with mock.patch.object(worker, "_journal", journal), patch_tracker:
+                jobs = worker.recover_jobs()
+                self.assertEqual(jobs, [Job(2, "bar", Path("/tmp"), 0)])
+
+                # A magnet received (e.g. over IPC) before the unfinished
+                # jobs are resumed must not reuse their keys.
+                self.assertEqual(tracker.new("magnet:?dn=baz"), 3)
+
+                started: List[str] = []
+
+                def start(
+                    magnet: str,
+                    _download_dir: Path,
+                    _timeout: float,
+                    _torrent_id: Optional[str],
+                ) -> int:
+                    started.append(magnet)
+                    return tracker.new(magnet)
+
+                self.assertEqual(worker.resume_jobs(jobs, start), ["bar"])
+                self.assertEqual(started, ["bar"])
+                self.assertEqual(journal.replay(), [])
+
+
+class TestMagnetTracker(unittest.TestCase):
+    def test_indexes(self) -> None:
+        ihash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+        tracker = MagnetTracker()
+        foo_key = tracker.new(f"magnet:?xt=urn:btih:{ihash}&dn=foo")
+        bar_key = tracker.new("magnet:?dn=bar")
+        tracker.bind(foo_key, ihash)
+        tracker.bind(bar_key, "abc")
+
+        self.assertEqual(tracker[foo_key], ihash)
+        self.assertEqual(tracker.key_for_id("abc"), bar_key)
+        self.assertEqual(
+            tracker.key_for_magnet(f"magnet:?xt=urn:btih:{ihash.upper()}"),
+            foo_key,
+        )
+        self.assertIsNone(tracker.key_for_magnet("magnet:?dn=bar"))
+        self.assertEqual(tracker.first_unclaimed(["abc", "def"]), "def")
+
+        with self.assertRaises(RuntimeError):
+            tracker.bind(tracker.new("magnet:?dn=baz"), "abc")
+
+    def test_duplicate_magnets(self) -> None:
+        magnet = "magnet:?xt=urn:btih:c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+        tracker = MagnetTracker()
+        key = tracker.new(magnet)
+
+        with self.assertRaises(DuplicateMagnetError) as cm:
+            tracker.new(magnet + "&dn=foo")
+        self.assertEqual(cm.exception.key, key)
+
+        # A magnet can be downloaded again once its torrent is finished.
+        tracker.done(key)
+        self.assertEqual(tracker.new(magnet), key + 1)
+
+    def test_redownload_finished_magnet(self) -> None:
+        ihash = "c12fe1c06bba254a9dc9f519b335aa7c1367a88a"
+        magnet = f"magnet:?xt=urn:btih:{ihash}"
+        tracker = MagnetTracker()
+
+        key = tracker.new(magnet)
+        tracker.bind(key, ihash)
+        tracker.done(key)
+        self.assertIsNone(tracker.key_for_id(ihash))
+
+        # Deluge assigns the same ID to the same magnet.
+        new_key = tracker.new(magnet)
+        tracker.bind(new_key, ihash)
+        self.assertEqual(tracker[new_key], ihash)
+        self.assertEqual(tracker.key_for_id(ihash), new_key)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_torrent_state(self) -> None:
+        def state_value(state: str) -> Optional[float]:
+            return pc.REGISTRY.get_sample_value(
+                "torrent_state", {"id": "abc", "name": "foo", "state": state}
+            )
+
+        metrics.record_status("foo", _status("abc", state="Queued"))
+        metrics.record_status("foo", _status("abc", state="Downloading"))
+        self.assertIsNone(state_value("Queued"))
+        self.assertEqual(state_value("Downloading"), 1)
+
+        metrics.forget_torrent("abc", "foo")
+        self.assertIsNone(state_value("Downloading"))
+        self.assertIsNone(
+            pc.REGISTRY.get_sample_value(
+                "torrent_bytes_remaining", {"id": "abc", "name": "foo"}
+            )
+        )
+
+
+class TestParseConsoleInfo(unittest.TestCase):
+    def test_multiple_torrents(self) -> None:
+        out = (
+            "Name: foo\n"
+            "ID: 123\n"
+            "State: Seeding Up Speed: 1.0 KiB/s\n"
+            "Size: 1.0 GiB/1.0 GiB Ratio: 0.000\n"
+            " \n"
+            "Name: bar\n"
+            "ID: 456\n"
+            "State: Queued\n"
+            "Progress: 12.50% [#~~~~~~~]\n"
+        )
+        statuses = deluge.parse_console_info(out)
+
+        self.assertEqual(list(statuses), ["123", "456"])
+        self.assertEqual(statuses["123"].state, "Seeding")
+        self.assertEqual(statuses["123"].upload_rate, 1024.0)
+        self.assertEqual(statuses["123"].total_wanted, 1024 ** 3)
+        self.assertEqual(statuses["456"].state, "Queued")
+        self.assertEqual(statuses["456"].progress, 12.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
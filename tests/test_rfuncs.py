@@ -0,0 +1,748 @@
+import http.client
+import io
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+import tempfile
+import textwrap
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+import unittest
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+import prometheus_client as pc
+
+from rfuncs import authenticator, routes
+from rfuncs.authenticator import ATTEMPT_LIMIT, ATTEMPT_PERIOD, Authenticator
+from rfuncs.cache import CachePolicy
+from rfuncs.jobs import Job, JobQueue, JobStore, QueueFull
+from rfuncs.log_queue import start_queued_logging, stop_queued_logging
+from rfuncs.path_dispatcher import PathDispatcher
+from rfuncs.plugins import PluginError, discover_routes, warm_up
+from rfuncs.rate_limiter import RateLimit, RateLimiter
+from rfuncs.route_registry import RouteRegistry, match_route
+from rfuncs.servers import ThreadPoolWSGIServer
+from rfuncs.types import AnyStr, AuthStatus, Environ, StartResponse
+
+
+def _environ(
+    body: bytes = b"",
+    content_type: str = "application/x-www-form-urlencoded",
+    **extra: str,
+) -> Dict[str, Any]:
+    environ: Dict[str, Any] = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/echo",
+        "CONTENT_TYPE": content_type,
+        "CONTENT_LENGTH": str(len(body)),
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": io.BytesIO(body),
+    }
+    environ.update(extra)
+    setup_testing_defaults(environ)
+    return environ
+
+
+def _echo(
+    environ: Environ, start_response: StartResponse
+) -> Iterable[AnyStr]:
+    start_response("200 OK", [("Content-type", "application/json")])
+    yield json.dumps(dict(environ["params"]))
+
+
+class TestAuthenticator(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        patcher = mock.patch.object(
+            authenticator.time, "monotonic", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.auth = Authenticator("secret")
+
+    def test_suspension_expires(self) -> None:
+        statuses: List[AuthStatus] = [
+            self.auth.check("1.2.3.4", "bad") for _ in range(ATTEMPT_LIMIT + 1)
+        ]
+        self.assertEqual(set(statuses), {AuthStatus.DENIED})
+        self.assertEqual(
+            self.auth.check("1.2.3.4", "secret"), AuthStatus.SUSPENDED
+        )
+        self.assertEqual(
+            self.auth.check("5.6.7.8", "secret"), AuthStatus.GRANTED
+        )
+
+        self.now += ATTEMPT_PERIOD * 60 + 1
+        self.assertEqual(
+            self.auth.check("1.2.3.4", "secret"), AuthStatus.GRANTED
+        )
+        self.assertEqual(len(self.auth.failures), 0)
+
+    def test_tracked_clients_are_bounded(self) -> None:
+        with mock.patch.object(authenticator, "MAX_TRACKED_CLIENTS", 5):
+            for i in range(20):
+                self.auth.check(f"10.0.0.{i}", "bad")
+
+        self.assertEqual(
+            list(self.auth.failures), [f"10.0.0.{i}" for i in range(15, 20)]
+        )
+
+
+class TestPathDispatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dispatcher = PathDispatcher(
+            "secret", {("post", "/echo"): _echo}, max_body_size=1024
+        )
+
+    def call(self, environ: Dict[str, Any]) -> Tuple[str, bytes]:
+        statuses: List[str] = []
+
+        def start_response(
+            status: str, _headers: Any, _exc_info: Any = None
+        ) -> None:
+            statuses.append(status)
+
+        body = b"".join(self.dispatcher(environ, start_response))
+        return statuses[-1], body
+
+    def test_urlencoded_body(self) -> None:
+        status, body = self.call(_environ(b"token=secret&to=a&to=b&x=1"))
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(json.loads(body), {"to": ["a", "b"], "x": "1"})
+
+    def test_json_body_with_token_header(self) -> None:
+        environ = _environ(
+            json.dumps({"to": "a", "body": ["x", "y"]}).encode(),
+            content_type="application/json",
+            HTTP_X_RFSERVER_TOKEN="secret",
+        )
+        status, body = self.call(environ)
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(json.loads(body), {"to": "a", "body": ["x", "y"]})
+
+    def test_multipart_body(self) -> None:
+        data = (
+            b"--XX\r\n"
+            b'Content-Disposition: form-data; name="to"\r\n\r\n'
+            b"a\r\n"
+            b"--XX\r\n"
+            b'Content-Disposition: form-data; name="token"\r\n\r\n'
+            b"secret\r\n"
+            b"--XX--\r\n"
+        )
+        environ = _environ(
+            data, content_type="multipart/form-data; boundary=XX"
+        )
+        status, body = self.call(environ)
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(json.loads(body), {"to": "a"})
+
+    def test_body_is_not_parsed_before_auth(self) -> None:
+        environ = _environ(
+            b"not json",
+            content_type="application/json",
+            HTTP_X_RFSERVER_TOKEN="bad",
+        )
+        status, _ = self.call(environ)
+        self.assertEqual(status, "401 Not Authorized")
+        self.assertEqual(environ["wsgi.input"].tell(), 0)
+
+    def test_malformed_body(self) -> None:
+        environ = _environ(
+            b"not json",
+            content_type="application/json",
+            HTTP_X_RFSERVER_TOKEN="secret",
+        )
+        status, _ = self.call(environ)
+        self.assertEqual(status, "400 Bad Request")
+
+    def test_body_too_large(self) -> None:
+        status, _ = self.call(_environ(b"token=secret&x=" + 2048 * b"x"))
+        self.assertEqual(status, "413 Payload Too Large")
+
+
+class TestMetrics(unittest.TestCase):
+    def test_route_metrics(self) -> None:
+        registry = RouteRegistry()
+        registry.register("/metrics-echo", methods=["POST"])(_echo)
+        dispatcher = PathDispatcher("secret", registry.to_route_map())
+
+        def sample(name: str, **labels: str) -> float:
+            return pc.REGISTRY.get_sample_value(name, labels) or 0
+
+        before = {
+            "404": sample("rfserver_error_count_total", code="404"),
+            "403": sample("rfserver_error_count_total", code="403"),
+            "responses": sample("rfserver_response_count_total", code="404"),
+        }
+
+        for path in ["/metrics-echo", "/missing"]:
+            environ = _environ(
+                b"token=secret&to=abc", PATH_INFO=path, REMOTE_ADDR="10.1.1.1"
+            )
+            b"".join(dispatcher(environ, lambda *_: None))
+
+        self.assertEqual(
+            sample(
+                "rfserver_route_time_count", endpoint="/metrics-echo"
+            ),
+            1,
+        )
+        self.assertEqual(
+            sample(
+                "rfserver_response_size_bytes_sum", endpoint="/metrics-echo"
+            ),
+            len(b'{"to": "abc"}'),
+        )
+        self.assertEqual(
+            sample("rfserver_error_count_total", code="404"),
+            before["404"] + 1,
+        )
+        self.assertEqual(
+            sample("rfserver_error_count_total", code="403"), before["403"]
+        )
+        self.assertEqual(
+            sample("rfserver_response_count_total", code="404"),
+            before["responses"] + 1,
+        )
+        self.assertEqual(sample("rfserver_requests_in_progress"), 0)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        patcher = mock.patch("rfuncs.cache.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.calls: List[str] = []
+
+        def counter(
+            environ: Environ, start_response: StartResponse
+        ) -> Iterable[AnyStr]:
+            self.calls.append(environ["PATH_INFO"])
+            if environ["params"].get("fail"):
+                start_response("500 Internal Server Error", [])
+            else:
+                start_response("200 OK", [("Content-type", "text/plain")])
+            yield f"call #{len(self.calls)}"
+
+        registry = RouteRegistry()
+        policy = CachePolicy(ttl=10, max_entries=2)
+        registry.register("/count/<n>", cache=policy)(counter)
+        self.dispatcher = PathDispatcher(
+            "secret",
+            registry.to_route_map(),
+            route_caches=registry.caches,
+        )
+
+    def get(self, path: str, query: str = "") -> Tuple[str, bytes]:
+        environ = _environ(
+            REQUEST_METHOD="GET",
+            PATH_INFO=path,
+            QUERY_STRING=query,
+            HTTP_X_RFSERVER_TOKEN="secret",
+        )
+        statuses: List[str] = []
+        body = b"".join(
+            self.dispatcher(environ, lambda s, *_: statuses.append(s))
+        )
+        return statuses[-1], body
+
+    def test_hits_expire(self) -> None:
+        self.assertEqual(self.get("/count/1"), ("200 OK", b"call #1"))
+        self.assertEqual(self.get("/count/1"), ("200 OK", b"call #1"))
+        self.assertEqual(self.get("/count/1", "x=1"), ("200 OK", b"call #2"))
+
+        self.now += 11
+        self.assertEqual(self.get("/count/1"), ("200 OK", b"call #3"))
+
+    def test_lru_eviction(self) -> None:
+        self.get("/count/1")
+        self.get("/count/2")
+        self.get("/count/1")
+        self.get("/count/3")  # evicts /count/2
+        self.assertEqual(len(self.calls), 3)
+
+        self.get("/count/1")
+        self.get("/count/3")
+        self.assertEqual(len(self.calls), 3)
+        self.get("/count/2")
+        self.assertEqual(len(self.calls), 4)
+
+    def test_errors_are_not_cached(self) -> None:
+        self.get("/count/1", "fail=1")
+        status, _ = self.get("/count/1", "fail=1")
+        self.assertEqual(status, "500 Internal Server Error")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_only_get_routes_are_cacheable(self) -> None:
+        with self.assertRaises(ValueError):
+            RouteRegistry().register(
+                "/x", methods=["POST"], cache=CachePolicy(ttl=1)
+            )
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 1000.0
+        patcher = mock.patch(
+            "rfuncs.rate_limiter.time.monotonic", lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.limiter = RateLimiter(slots=64)
+        self.addCleanup(self.limiter.close)
+        self.limit = RateLimit(rate=0.5, burst=3)
+
+    def test_token_bucket(self) -> None:
+        waits = [
+            self.limiter.acquire("1.1.1.1", "/x", self.limit)
+            for _ in range(4)
+        ]
+        self.assertEqual(waits, [0, 0, 0, 2.0])
+        self.assertEqual(self.limiter.acquire("2.2.2.2", "/x", self.limit), 0)
+        self.assertEqual(self.limiter.acquire("1.1.1.1", "/y", self.limit), 0)
+
+        self.now += 2
+        self.assertEqual(self.limiter.acquire("1.1.1.1", "/x", self.limit), 0)
+        self.assertEqual(
+            self.limiter.acquire("1.1.1.1", "/x", self.limit), 2.0
+        )
+
+    def test_buckets_are_shared_with_child_processes(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            for _ in range(3):
+                self.limiter.acquire("1.1.1.1", "/x", self.limit)
+            os._exit(0)
+
+        os.waitpid(pid, 0)
+        self.assertGreater(
+            self.limiter.acquire("1.1.1.1", "/x", self.limit), 0
+        )
+
+    def test_dispatcher_returns_429(self) -> None:
+        registry = RouteRegistry()
+        registry.register(
+            "/echo", methods=["POST"], rate_limit=RateLimit(rate=0.1, burst=1)
+        )(_echo)
+        dispatcher = PathDispatcher(
+            "secret",
+            registry.to_route_map(),
+            route_rate_limits=registry.rate_limits,
+        )
+        assert dispatcher.rate_limiter is not None
+        self.addCleanup(dispatcher.rate_limiter.close)
+
+        responses: List[Tuple[str, Any]] = []
+        for _ in range(2):
+            environ = _environ(b"token=secret", REMOTE_ADDR="10.2.2.2")
+            b"".join(
+                dispatcher(environ, lambda *args: responses.append(args[:2]))
+            )
+
+        self.assertEqual(responses[0][0], "200 OK")
+        status, headers = responses[1]
+        self.assertEqual(status, "429 Too Many Requests")
+        self.assertIn(("Retry-After", "10"), headers)
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch_results(self) -> None:
+        route_map = {
+            ("post", "/batch"): routes.batch,
+            ("post", "/echo"): _echo,
+        }
+        dispatcher = PathDispatcher("secret", route_map)
+        calls = [
+            {"path": "echo", "params": {"to": "a"}},
+            {"path": "/missing"},
+            {"path": "/batch", "params": {"calls": []}},
+            {"method": "POST", "path": "/echo", "params": {"to": "b"}},
+        ]
+        environ = _environ(
+            json.dumps({"calls": calls}).encode(),
+            content_type="application/json",
+            PATH_INFO="/batch",
+            HTTP_X_RFSERVER_TOKEN="secret",
+        )
+
+        statuses: List[str] = []
+        with mock.patch.dict(routes.route_registry.map, route_map):
+            body = b"".join(
+                dispatcher(environ, lambda s, *_: statuses.append(s))
+            )
+
+        self.assertEqual(statuses, ["200 OK"])
+        results = json.loads(body)["results"]
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["200 OK", "404 Not Found", "404 Not Found", "200 OK"],
+        )
+        self.assertEqual(json.loads(results[0]["body"]), {"to": "a"})
+        self.assertEqual(json.loads(results[3]["body"]), {"to": "b"})
+
+    def test_batched_calls_are_rate_limited(self) -> None:
+        registry = routes.route_registry
+        dispatcher = PathDispatcher(
+            "secret",
+            registry.to_route_map(),
+            route_rate_limits=registry.rate_limits,
+        )
+        self.addCleanup(dispatcher.rate_limiter.close)
+        calls = [
+            {"path": "/sendmail", "params": {"to": "foo@example.com"}}
+        ] * 11
+        environ = _environ(
+            json.dumps({"calls": calls}).encode(),
+            content_type="application/json",
+            PATH_INFO="/batch",
+            HTTP_X_RFSERVER_TOKEN="secret",
+        )
+
+        job = Job(id="abc", path="/sendmail", status="pending", created=0)
+        with mock.patch(
+            "rfuncs.route_registry.job_queue.submit", return_value=job
+        ) as submit:
+            body = b"".join(dispatcher(environ, lambda *_: None))
+
+        statuses = [result["status"] for result in json.loads(body)["results"]]
+        # /sendmail allows bursts of up to 10 emails.
+        self.assertEqual(
+            statuses, ["202 Accepted"] * 10 + ["429 Too Many Requests"]
+        )
+        self.assertEqual(submit.call_count, 10)
+
+
+class TestKeepAlive(unittest.TestCase):
+    def test_connection_is_reused(self) -> None:
+        def app(
+            environ: Environ, start_response: StartResponse
+        ) -> Iterable[bytes]:
+            start_response("200 OK", [("Content-type", "text/plain")])
+            yield b"Hello, "
+            yield environ["wsgi.input"].read(1)
+
+        httpd = ThreadPoolWSGIServer(("127.0.0.1", 0), workers=2)
+        httpd.set_app(app)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+
+        conn = http.client.HTTPConnection(*httpd.server_address[:2])
+        self.addCleanup(conn.close)
+
+        socks = []
+        for body in [b"World", b"Xavier", b""]:
+            # The unread part of the request body must not break the next
+            # request.
+            conn.request("POST", "/", body=body)
+            resp = conn.getresponse()
+            self.assertEqual(resp.status, 200)
+            self.assertFalse(resp.will_close)
+            self.assertEqual(resp.read(), b"Hello, " + body[:1])
+            socks.append(conn.sock)
+
+        self.assertIsNotNone(socks[0])
+        self.assertEqual(len(set(socks)), 1)
+
+
+class TestLogQueue(unittest.TestCase):
+    def test_full_queue_drops_records(self) -> None:
+        release = threading.Event()
+        messages: List[str] = []
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record: logging.LogRecord) -> None:
+                release.wait()
+                messages.append(record.getMessage())
+
+        logger = logging.getLogger("test_rfuncs.log_queue")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(lambda: logger.handlers.clear())
+
+        dropped_before = (
+            pc.REGISTRY.get_sample_value("rfserver_dropped_log_count_total")
+            or 0
+        )
+        listener = start_queued_logging(
+            [SlowHandler()], maxsize=2, logger=logger
+        )
+        for i in range(10):
+            logger.info(f"record #{i}")
+
+        release.set()
+        listener.stop()
+
+        # Only the records that fit in the queue (plus one record that the
+        # background thread may have already taken off of it) are written.
+        self.assertIn(len(messages), [2, 3])
+        self.assertEqual(
+            messages, [f"record #{i}" for i in range(len(messages))]
+        )
+        self.assertEqual(
+            pc.REGISTRY.get_sample_value("rfserver_dropped_log_count_total"),
+            dropped_before + 10 - len(messages),
+        )
+
+    def test_records_are_written_before_os_exit(self) -> None:
+        logger = logging.getLogger("test_rfuncs.log_queue.fork")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.handlers.clear)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_file = Path(tmpdir) / "log"
+            file_handler = logging.FileHandler(log_file)
+            self.addCleanup(file_handler.close)
+            listener = start_queued_logging([file_handler], logger=logger)
+            self.addCleanup(listener.stop)
+
+            pids = []
+            for _ in range(5):
+                pid = os.fork()
+                if pid == 0:
+                    try:
+                        raise RuntimeError("crash")
+                    except RuntimeError:
+                        logger.exception(f"Worker {os.getpid()} has crashed.")
+                    finally:
+                        stop_queued_logging()
+                        os._exit(1)  # pylint: disable=protected-access
+
+                pids.append(pid)
+
+            for pid in pids:
+                os.waitpid(pid, 0)
+
+            contents = log_file.read_text()
+
+        for pid in pids:
+            self.assertIn(f"Worker {pid} has crashed.", contents)
+
+    def test_response_log_sampling(self) -> None:
+        dispatcher = PathDispatcher(
+            "secret", {("post", "/echo"): _echo}, response_log_rate=0
+        )
+        with self.assertLogs("rfuncs.path_dispatcher", "INFO") as logs:
+            b"".join(dispatcher(_environ(b"token=secret"), mock.Mock()))
+
+        self.assertFalse(
+            [line for line in logs.output if "response from" in line]
+        )
+
+
+class TestPlugins(unittest.TestCase):
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.plugin_dir = Path(tmpdir.name)
+        self.addCleanup(
+            lambda: sys.path.remove(str(self.plugin_dir))
+            if str(self.plugin_dir) in sys.path
+            else None
+        )
+        self.addCleanup(sys.modules.pop, "rfuncs_test_plugin", None)
+
+        (self.plugin_dir / "rfuncs_test_plugin.py").write_text(
+            textwrap.dedent(
+                """
+                import json
+
+                def hello(environ, start_response):
+                    start_response("200 OK", [])
+                    yield json.dumps(dict(environ["params"]))
+                """
+            )
+        )
+        self.registry = RouteRegistry()
+
+    def write_manifest(self, *lines: str) -> None:
+        (self.plugin_dir / "routes.ini").write_text(
+            "\n".join(["[rfuncs.routes]", *lines])
+        )
+
+    def test_routes_are_loaded_lazily(self) -> None:
+        self.write_manifest(
+            "/hello = rfuncs_test_plugin:hello [post, rate_limit=1/5]",
+            "/hi = rfuncs_test_plugin:hello [cache=5]",
+        )
+        paths = discover_routes(
+            self.registry, [self.plugin_dir], use_entry_points=False
+        )
+
+        self.assertEqual(paths, ["/hello", "/hi"])
+        self.assertNotIn("rfuncs_test_plugin", sys.modules)
+        self.assertEqual(
+            list(self.registry.rate_limits.values()),
+            [("/hello", RateLimit(rate=1, burst=5))],
+        )
+        self.assertEqual(len(self.registry.caches), 1)
+        self.assertIn(("get", "/hi"), self.registry.map)
+
+        dispatcher = PathDispatcher("secret", self.registry.to_route_map())
+        environ = _environ(b"token=secret&x=1", PATH_INFO="/hello")
+        body = b"".join(dispatcher(environ, mock.Mock()))
+
+        self.assertEqual(json.loads(body), {"x": "1"})
+        self.assertIn("rfuncs_test_plugin", sys.modules)
+        self.assertTrue(self.registry.lazy_routes["/hello"].loaded)
+        self.assertFalse(self.registry.lazy_routes["/hi"].loaded)
+
+        self.assertEqual(warm_up(self.registry), ["/hello", "/hi"])
+        self.assertTrue(self.registry.lazy_routes["/hi"].loaded)
+
+    def test_invalid_routes(self) -> None:
+        for value in [
+            "rfuncs_test_plugin [post]",
+            "rfuncs_test_plugin:hello [sometimes]",
+            "rfuncs_test_plugin:hello [post, cache=5]",
+        ]:
+            with self.subTest(value=value):
+                self.write_manifest(f"/bad = {value}")
+                with self.assertRaises(PluginError):
+                    discover_routes(
+                        RouteRegistry(),
+                        [self.plugin_dir],
+                        use_entry_points=False,
+                    )
+
+        self.write_manifest("/missing = rfuncs_test_plugin:missing")
+        discover_routes(
+            self.registry, [self.plugin_dir], use_entry_points=False
+        )
+        with self.assertRaises(PluginError):
+            warm_up(self.registry)
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.queue = JobQueue(
+            JobStore(Path(tmpdir.name)), workers=1, max_pending=1
+        )
+
+    def test_job_results(self) -> None:
+        release = threading.Event()
+
+        def slow_echo(
+            environ: Environ, start_response: StartResponse
+        ) -> Iterable[AnyStr]:
+            release.wait()
+            yield from _echo(environ, start_response)
+
+        environ = _environ(b"to=a")
+        environ["params"] = {"to": "a"}
+        job = self.queue.submit(slow_echo, environ)
+        self.queue.submit(slow_echo, environ)
+        with self.assertRaises(QueueFull):
+            self.queue.submit(slow_echo, environ)
+
+        release.set()
+        assert self.queue._executor is not None
+        self.queue._executor.shutdown(wait=True)
+
+        finished_job = self.queue.get(job.id)
+        assert finished_job is not None
+        self.assertEqual(finished_job.status, "succeeded")
+        self.assertEqual(finished_job.http_status, "200 OK")
+        self.assertEqual(json.loads(finished_job.result or ""), {"to": "a"})
+        self.assertIsNone(self.queue.get("not-a-job-id"))
+
+    def test_store_permissions(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = JobStore(Path(tmpdir) / "jobs")
+            job = Job(id="a" * 32, path="/echo", status="pending", created=0)
+            store.save(job)
+
+            self.assertEqual(store.get(job.id), job)
+            self.assertEqual(store.directory.stat().st_mode & 0o777, 0o700)
+            self.assertEqual(
+                store._job_path(job.id).stat().st_mode & 0o777, 0o600
+            )
+
+            (Path(tmpdir) / "link").symlink_to(store.directory)
+            with self.assertRaises(PermissionError):
+                JobStore(Path(tmpdir) / "link").save(job)
+
+    def test_configure(self) -> None:
+        release = threading.Event()
+
+        def wait(
+            _environ: Environ, start_response: StartResponse
+        ) -> Iterable[AnyStr]:
+            release.wait()
+            start_response("200 OK", [])
+            yield ""
+
+        self.addCleanup(self.queue.shutdown)
+        self.addCleanup(release.set)
+        self.queue.configure(workers=3)
+        for _ in range(4):
+            self.queue.submit(wait, _environ())
+        with self.assertRaises(QueueFull):
+            self.queue.submit(wait, _environ())
+
+        with self.assertRaises(RuntimeError):
+            self.queue.configure(workers=1)
+
+    def test_full_queue_is_unavailable(self) -> None:
+        registry = RouteRegistry()
+        registry.register("/job-echo", methods=["POST"], job=True)(_echo)
+        dispatcher = PathDispatcher("secret", registry.to_route_map())
+
+        def sample() -> float:
+            return (
+                pc.REGISTRY.get_sample_value(
+                    "rfserver_error_count_total", {"code": "503"}
+                )
+                or 0
+            )
+
+        before = sample()
+        environ = _environ(b"token=secret&to=a", PATH_INFO="/job-echo")
+        responses: List[Tuple[str, List[Tuple[str, str]]]] = []
+        with mock.patch(
+            "rfuncs.route_registry.job_queue.submit", side_effect=QueueFull
+        ):
+            body = b"".join(
+                dispatcher(environ, lambda s, h, *_: responses.append((s, h)))
+            )
+
+        status, headers = responses[0]
+        self.assertEqual(status, "503 Service Unavailable")
+        self.assertIn(("Retry-After", "1"), headers)
+        self.assertIn(b"Too many jobs are queued", body)
+        self.assertEqual(sample(), before + 1)
+
+
+class TestMatchRoute(unittest.TestCase):
+    def test_path_params(self) -> None:
+        route_map = {
+            ("get", "/jobs/<job_id>"): _echo,
+            ("get", "/jobs"): _echo,
+        }
+        self.assertEqual(
+            match_route(route_map, "get", "/jobs/abc"),
+            (_echo, {"job_id": "abc"}),
+        )
+        self.assertEqual(match_route(route_map, "get", "/jobs"), (_echo, {}))
+        self.assertEqual(
+            match_route(route_map, "get", "/jobs/a/b"), (None, {})
+        )
+        self.assertEqual(
+            match_route(route_map, "post", "/jobs/a"), (None, {})
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
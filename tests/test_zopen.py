@@ -1,9 +1,17 @@
+import os
+from pathlib import Path
+import socket
+import tempfile
+import threading
+import time
 from typing import Iterable, List, Optional
 import unittest
+from unittest import mock
 
 from parameterized import parameterized
 import zopen
-from zopen import PathLike
+from zopen import DocIndex, PathLike
+from zopen_daemon import DocDaemon, DocServer
 
 
 class TestZopen(unittest.TestCase):
@@ -14,6 +22,18 @@ class TestZopen(unittest.TestCase):
             (["foo", "baz"], "foo", None, ["foo", "baz"]),
             (["foo", "baz"], "foo", ["foo"], ["foo", "baz"]),
             (["foo", "baz"], "baz", None, ["baz", "foo"]),
+            (
+                ["foo", "baz", "foo", "qux"],
+                "bar",
+                None,
+                ["bar", "baz", "foo", "qux"],
+            ),
+            (
+                ["a/foo", "baz", "b/foo"],
+                "bar",
+                ["foo"],
+                ["a/foo", "b/foo", "bar", "baz"],
+            ),
         ]
     )
     def test_get_new_mr_cache_lines(
@@ -30,6 +50,200 @@ class TestZopen(unittest.TestCase):
             [str(mr_doc) for mr_doc in new_mr_cache_lines], expected
         )
 
+    @parameterized.expand(
+        [
+            (["a", "b", "c"], ["c", "a"], ["c", "a", "b"]),
+            (["a", "b", "c"], ["x", "b", "b"], ["b", "a", "c"]),
+            (["a", "b", "a"], ["a"], ["a", "b", "a"]),
+            (["b", "a", "a"], ["a"], ["a", "b", "a"]),
+        ]
+    )
+    def test_promote_most_recent_docs(
+        self,
+        docs: List[str],
+        mr_docs: List[str],
+        expected: List[str],
+    ) -> None:
+        promoted_docs = zopen.promote_most_recent_docs(docs, mr_docs)
+        self.assertEqual([str(doc) for doc in promoted_docs], expected)
+
+    @parameterized.expand(
+        [
+            (["/a/x.pdf", "/b/y.pdf"], ["/a/x.pdf"], ["/b/y.pdf", "/a/x.pdf"]),
+            (
+                ["/a/x.pdf", "/b/y.pdf", "/c/x.pdf"],
+                ["y.pdf", "x.pdf"],
+                ["/b/y.pdf", "/a/x.pdf", "/c/x.pdf"],
+            ),
+            (
+                ["/a/x.pdf", "/b/y.pdf", "/a/x.pdf"],
+                ["x.pdf", "x.pdf"],
+                ["/b/y.pdf", "/a/x.pdf", "/a/x.pdf"],
+            ),
+            (["/a/x.pdf", "/b/y.pdf"], ["z.pdf"], ["/a/x.pdf", "/b/y.pdf"]),
+        ]
+    )
+    def test_demote_open_docs(
+        self,
+        docs: List[str],
+        open_docs: List[str],
+        expected: List[str],
+    ) -> None:
+        demoted_docs = zopen.demote_open_docs(docs, open_docs)
+        self.assertEqual([str(doc) for doc in demoted_docs], expected)
+
+
+class TestDocIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = Path(tmpdir.name)
+
+        for doc in ["books/a.pdf", "books/sub/b.epub", "pruned/c.pdf"]:
+            self._touch(doc)
+        self._touch("books/notes.txt")
+
+        self.roots = [str(self.root / "books"), str(self.root / "pruned")]
+        self.prune = [str(self.root / "pruned")]
+        self.index_file = self.root / "doc_index.json"
+
+    def _touch(self, name: str) -> None:
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+    def _refresh(self, index: DocIndex) -> int:
+        return index.refresh(self.roots, prune=self.prune)
+
+    def _doc_names(self, index: DocIndex) -> List[str]:
+        return [str(doc.relative_to(self.root)) for doc in index.docs()]
+
+    def test_refresh(self) -> None:
+        index = DocIndex(self.index_file)
+        self.assertEqual(self._refresh(index), 2)
+        self.assertEqual(
+            self._doc_names(index), ["books/a.pdf", "books/sub/b.epub"]
+        )
+
+    def test_only_changed_dirs_are_rescanned(self) -> None:
+        index = DocIndex(self.index_file)
+        self._refresh(index)
+        index.save()
+
+        index = DocIndex.load(self.index_file)
+        self.assertEqual(self._refresh(index), 0)
+
+        self._touch("books/sub/new.djvu")
+        # Make sure that the directory's mtime changes.
+        os.utime(self.root / "books/sub", ns=(0, 0))
+        self.assertEqual(self._refresh(index), 1)
+        self.assertIn("books/sub/new.djvu", self._doc_names(index))
+
+    def test_removed_dirs_are_dropped(self) -> None:
+        index = DocIndex(self.index_file)
+        self._refresh(index)
+
+        (self.root / "books/sub/b.epub").unlink()
+        (self.root / "books/sub").rmdir()
+        self.assertEqual(self._refresh(index), 2)
+        self.assertEqual(self._doc_names(index), ["books/a.pdf"])
+
+    def test_load_corrupt_index(self) -> None:
+        self.index_file.write_text("{not json")
+        self.assertEqual(DocIndex.load(self.index_file).dirs, {})
+
+
+class TestDocDaemon(unittest.TestCase):
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.root = Path(tmpdir.name)
+
+        self.books = self.root / "books"
+        (self.books / "sub").mkdir(parents=True)
+        (self.books / "a.pdf").touch()
+        (self.books / "sub/b.pdf").touch()
+
+        self.open_docs: List[Path] = []
+        patcher = mock.patch.multiple(
+            zopen,
+            ALL_DOCS_CACHE_FILE=self.root / "all_docs",
+            MOST_RECENT_CACHE_FILE=self.root / "recently_opened_docs",
+            get_doc_roots=lambda: [str(self.books)],
+            get_open_docs=lambda: self.open_docs,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.doc_daemon = DocDaemon(DocIndex(self.root / "doc_index.json"))
+        self.addCleanup(self.doc_daemon.close)
+        self.doc_daemon.refresh(force=True)
+
+        self.socket_path = self.root / "socket"
+        server = DocServer(self.socket_path, self.doc_daemon)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def _ranked_docs(self) -> List[str]:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(self.socket_path))
+            sock.sendall(zopen.DAEMON_RANK_REQUEST)
+            with sock.makefile("rb") as f:
+                lines = f.read().decode().splitlines()
+
+        return [str(Path(line).relative_to(self.books)) for line in lines]
+
+    def test_ranked_docs(self) -> None:
+        self.assertEqual(self._ranked_docs(), ["a.pdf", "sub/b.pdf"])
+
+        zopen.MOST_RECENT_CACHE_FILE.write_text(f"{self.books}/sub/b.pdf\n")
+        self.assertEqual(self._ranked_docs(), ["sub/b.pdf", "a.pdf"])
+
+        self.open_docs = [self.books / "sub/b.pdf"]
+        self.assertEqual(self._ranked_docs(), ["a.pdf", "sub/b.pdf"])
+
+    def test_stale_rankings_are_not_stored(self) -> None:
+        (self.books / "c.pdf").touch()
+        self.doc_daemon.refresh(force=True)
+
+        mr_cache = zopen.MOST_RECENT_CACHE_FILE
+        b_pdf, c_pdf = self.books / "sub/b.pdf", self.books / "c.pdf"
+        mr_cache.write_text(f"{c_pdf}\n{b_pdf}\n")
+        self.open_docs = [self.books / "a.pdf"]
+        demote_open_docs = zopen.demote_open_docs
+
+        def demote_during_rerank(
+            docs: Iterable[PathLike], open_docs: Iterable[PathLike]
+        ) -> List[Path]:
+            # The MR cache is reloaded (by another request) while this
+            # request is still ranking the old promoted docs.
+            mr_cache.write_text(f"{b_pdf}\n{c_pdf}\n")
+            self.doc_daemon._rerank()
+            return demote_open_docs(docs, open_docs)
+
+        patch_demote = mock.patch.object(
+            zopen, "demote_open_docs", demote_during_rerank
+        )
+        with patch_demote:
+            self.assertEqual(
+                self._ranked_docs(), ["c.pdf", "sub/b.pdf", "a.pdf"]
+            )
+
+        self.assertEqual(self._ranked_docs(), ["sub/b.pdf", "c.pdf", "a.pdf"])
+
+    def test_new_docs_are_served(self) -> None:
+        thread = threading.Thread(target=self.doc_daemon.watch)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.doc_daemon.stop)
+
+        (self.books / "sub/c.epub").touch()
+        deadline = time.monotonic() + 5
+        while "sub/c.epub" not in self._ranked_docs():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -2,7 +2,12 @@
 Zathura helper script. Used to search for and then open documents in Zathura.
 """
 
+import bisect
+import collections
+import contextlib
 from dataclasses import dataclass
+import itertools
+import json
 import os
 from pathlib import Path
 import re
@@ -11,7 +16,16 @@ import socket
 import subprocess as sp
 import sys
 import time
-from typing import Iterable, List, Optional, Sequence, Union
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
 
 from bugyi import cli, xdg
 from bugyi.core import main_factory, shell
@@ -25,16 +39,27 @@ PathLike = Union[str, Path]
 _XDG_DATA_DIR = xdg.init_full_dir("data")
 ALL_DOCS_CACHE_FILE = _XDG_DATA_DIR / "all_docs"
 BOOKS_DIR = "/home/bryan/Sync/var/books"
+DAEMON_SOCKET_FILE = _XDG_DATA_DIR / "socket"
+DOC_INDEX_FILE = _XDG_DATA_DIR / "doc_index.json"
+DOWNLOADS_DIR = "/home/bryan/Downloads"
 MAX_MOST_RECENT_DOCS = 100
 MOST_RECENT_CACHE_FILE = _XDG_DATA_DIR / "recently_opened_docs"
 
+# Sent to the zopen daemon to request the (newline-separated) ranked docs.
+DAEMON_RANK_REQUEST = b"rank\n"
+DAEMON_CHUNK_SIZE = 64 * 1024
+# These directories (and everything under them) are never indexed.
+PRUNED_DIRS = ("/home/bryan/Sync/.dropbox.cache",)
+
 _DOC_FILE_EXTS = ("pdf", "epub", "djvu", "ps", "okular")
 _DOC_FILE_EXT_GROUP = r"\({}\)".format(r"\|".join(_DOC_FILE_EXTS))
 DOC_PTTRN = rf".*\.{_DOC_FILE_EXT_GROUP}"
+_DOC_NAME_RE = re.compile(r"\.({})$".format("|".join(_DOC_FILE_EXTS)))
 
 
 @dataclass(frozen=True)
 class Arguments(cli.Arguments):
+    daemon: bool
     generate_cache: bool
     quiet: bool
     overwrite: bool
@@ -49,6 +74,15 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
         action="store_true",
         help="Re-generate the document cache.",
     )
+    parser.add_argument(
+        "-D",
+        "--daemon",
+        action="store_true",
+        help=(
+            "Run the zopen daemon, which watches our document directories and"
+            " serves the ranked list of documents to later zopen invocations."
+        ),
+    )
     parser.add_argument(
         "-q",
         "--quiet",
@@ -76,54 +110,55 @@ def parse_cli_args(argv: Sequence[str]) -> Arguments:
 
     kwargs = dict(args._get_kwargs())
     kwargs["generate_cache"] = (
-        kwargs["generate_cache"] or not Path(ALL_DOCS_CACHE_FILE).is_file()
+        kwargs["generate_cache"] or not Path(DOC_INDEX_FILE).is_file()
     )
 
     return Arguments(**kwargs)
 
 
 def run(args: Arguments) -> int:
-    all_docs = get_all_docs(use_cache=not args.generate_cache)
+    if args.daemon:
+        # Imported here, since zopen_daemon imports this module.
+        import zopen_daemon
 
-    if args.generate_cache:
-        with open(ALL_DOCS_CACHE_FILE, "w") as f:
-            f.writelines([str(adoc).rstrip() + "\n" for adoc in all_docs])
+        return zopen_daemon.run_daemon()
 
-    if args.quiet:
-        return 0
+    doc_r: Optional[BResult[Path]] = None
+    if not (args.generate_cache or args.quiet or args.refresh):
+        # If the daemon is running, it has already ranked our documents.
+        doc_r = choose_doc_from_daemon()
 
-    mr_cache_path = Path(MOST_RECENT_CACHE_FILE)
-    mr_cache_path.touch()
-    with open(mr_cache_path, "r") as f:
-        most_recent_docs = [Path(x.strip()) for x in f.readlines()]
+    if doc_r is None:
+        all_docs = get_all_docs(use_cache=not args.generate_cache)
 
-    ordered_docs = promote_most_recent_docs(all_docs, most_recent_docs)
+        if args.quiet:
+            return 0
 
+    most_recent_docs = read_mr_cache()
     open_docs = get_open_docs()
-    if open_docs:
-        ordered_docs = demote_open_docs(ordered_docs, open_docs)
 
-    pretty_docs = [
-        Path(re.sub(f"^{BOOKS_DIR}/", "", str(doc))) for doc in ordered_docs
-    ]
+    if doc_r is None:
+        ordered_docs = rank_docs(all_docs, most_recent_docs, open_docs)
 
-    doc: Optional[PathLike]
-    if args.refresh:
-        # We assume that this should be the current (i.e. focused) doc, but it
-        # isn't always. With that said, this almost always works.
-        doc = ordered_docs[-1]
-    else:
-        doc_r = choose_doc_to_open(pretty_docs)
-        if isinstance(doc_r, Err):
-            e = doc_r.err()
-            log.error(
-                "An error occurred while the user was choosing a doc to"
-                " open:\n{}",
-                e.report(),
+        if args.refresh:
+            # We assume that this should be the current (i.e. focused) doc,
+            # but it isn't always. With that said, this almost always works.
+            doc_r = Ok(ordered_docs[-1])
+        else:
+            doc_r = choose_doc_to_open(
+                pretty_doc(doc) for doc in ordered_docs
             )
-            return 1
 
-        doc = doc_r.ok()
+    if isinstance(doc_r, Err):
+        e = doc_r.err()
+        log.error(
+            "An error occurred while the user was choosing a doc to"
+            " open:\n{}",
+            e.report(),
+        )
+        return 1
+
+    doc: PathLike = doc_r.ok()
 
     replace = args.overwrite or args.refresh
     open_document(doc, replace=replace)
@@ -140,97 +175,338 @@ def run(args: Arguments) -> int:
 
 
 def get_all_docs(*, use_cache: bool) -> List[Path]:
+    """Returns every document found in our document directories.
+
+    Args:
+        use_cache: If not set, the document index is rebuilt from scratch.
+          Otherwise, only the directories which have changed since the index
+          was last refreshed are rescanned.
+    """
     if use_cache:
-        assert Path(ALL_DOCS_CACHE_FILE).is_file()
-        out = sp.check_output(["cat", ALL_DOCS_CACHE_FILE])
-        all_docs_string = out.decode().strip()
+        index = DocIndex.load(DOC_INDEX_FILE)
     else:
-        directory_list = ["/home/bryan/Sync/var/books", "/home/bryan/projects"]
-        if socket.gethostname() == "athena":
-            directory_list.append(
-                "/mnt/hercules/archive/home/bryan/Sync/var/books"
-            )
+        index = DocIndex(DOC_INDEX_FILE)
+
+    refresh_doc_index(index)
+    return index.docs()
+
+
+def refresh_doc_index(index: "DocIndex") -> int:
+    """Refreshes (and then saves) @index if any of our documents changed.
 
-        cmd_list = ["find"]
-        cmd_list.extend(directory_list)
-        cmd_list.extend(
-            ["-path", "/home/bryan/Sync/.dropbox.cache", "-prune", "-o"]
+    Returns:
+        The number of directories that had to be (re-)listed.
+    """
+    rescanned = index.refresh(get_doc_roots(), prune=PRUNED_DIRS)
+    log.debug("Rescanned {} document directories.", rescanned)
+
+    if rescanned:
+        index.save()
+        # The flat cache is still used by other scripts (e.g. zcopy).
+        _write_atomically(
+            ALL_DOCS_CACHE_FILE,
+            "".join(f"{doc}\n" for doc in index.docs()),
         )
-        cmd_list.extend(["-regex", DOC_PTTRN])
 
-        out = sp.check_output(cmd_list)
-        all_docs_string = out.decode().strip()
+    return rescanned
 
-    # Append any docs found in the Downloads directory.
-    out = sp.check_output(
-        ["find", "/home/bryan/Downloads", "-regex", DOC_PTTRN]
-    )
-    downloads_docs_string = out.decode().strip()
-    all_docs_string = all_docs_string + "\n" + downloads_docs_string
-    log.trace("----- Downloads -----\n{}", downloads_docs_string)
-
-    all_docs = [
-        Path(adoc)
-        for adoc in all_docs_string.split("\n")
-        if Path(adoc).is_file()
-    ]
-    return all_docs
+
+def get_doc_roots() -> List[str]:
+    """Returns the directories that we search for documents."""
+    roots = ["/home/bryan/Sync/var/books", "/home/bryan/projects"]
+    if socket.gethostname() == "athena":
+        roots.append("/mnt/hercules/archive/home/bryan/Sync/var/books")
+
+    roots.append(DOWNLOADS_DIR)
+    return roots
+
+
+class _IndexedDir(NamedTuple):
+    mtime_ns: int
+    docs: List[str]  # The names of the documents in this directory.
+    subdirs: List[str]  # The names of this directory's subdirectories.
+
+
+class DocIndex:
+    """Persistent Index of the Documents Under a Set of Root Directories
+
+    The index records each directory's mtime. Since a directory's mtime
+    changes whenever an entry is added to (or removed from) it, a refresh only
+    needs to stat each directory and re-list the ones that have changed. We
+    never need to stat individual documents.
+    """
+
+    VERSION = 1
+
+    def __init__(
+        self, path: PathLike, dirs: Dict[str, _IndexedDir] = None
+    ) -> None:
+        self.path = Path(path)
+        # Ordered so that documents are listed in depth-first order.
+        self.dirs: Dict[str, _IndexedDir] = {} if dirs is None else dirs
+
+    @classmethod
+    def load(cls, path: PathLike) -> "DocIndex":
+        """Loads the index stored at @path (or returns an empty index)."""
+        try:
+            data = json.loads(Path(path).read_text())
+            if data["version"] != cls.VERSION:
+                raise ValueError(f"Unknown index version: {data['version']}")
+
+            dirs = {
+                dir_path: _IndexedDir(*fields)
+                for dir_path, fields in data["dirs"].items()
+            }
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            log.debug("Unable to load the document index ({}): {}", path, e)
+            dirs = {}
+
+        return cls(path, dirs)
+
+    def save(self) -> None:
+        data = {
+            "version": self.VERSION,
+            "dirs": {
+                dir_path: list(indexed_dir)
+                for dir_path, indexed_dir in self.dirs.items()
+            },
+        }
+        _write_atomically(self.path, json.dumps(data))
+
+    def refresh(
+        self, roots: Iterable[str], *, prune: Iterable[str] = ()
+    ) -> int:
+        """Updates the index so that it reflects the contents of @roots.
+
+        Args:
+            roots: The directories to index (recursively).
+            prune: Directories which should not be indexed.
+
+        Returns:
+            The number of directories that had to be (re-)listed.
+        """
+        pruned = set(prune)
+        new_dirs: Dict[str, _IndexedDir] = {}
+        rescanned = 0
+
+        stack = list(reversed(list(roots)))
+        while stack:
+            dir_path = stack.pop()
+            if dir_path in pruned or dir_path in new_dirs:
+                continue
+
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                continue
+
+            indexed_dir = self.dirs.get(dir_path)
+            if indexed_dir is None or indexed_dir.mtime_ns != mtime_ns:
+                rescanned += 1
+                try:
+                    indexed_dir = _scan_dir(dir_path, mtime_ns)
+                except OSError as e:
+                    log.debug("Unable to scan {}: {}", dir_path, e)
+                    continue
+
+            new_dirs[dir_path] = indexed_dir
+            stack.extend(
+                os.path.join(dir_path, subdir)
+                for subdir in reversed(indexed_dir.subdirs)
+            )
+
+        # Directories which were removed count as changes too.
+        rescanned += len(self.dirs.keys() - new_dirs.keys())
+        self.dirs = new_dirs
+        return rescanned
+
+    def docs(self) -> List[Path]:
+        return [
+            Path(dir_path, doc)
+            for dir_path, indexed_dir in self.dirs.items()
+            for doc in indexed_dir.docs
+        ]
+
+
+def _scan_dir(dir_path: str, mtime_ns: int) -> _IndexedDir:
+    docs = []
+    subdirs = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif _DOC_NAME_RE.search(entry.name) and entry.is_file():
+                docs.append(entry.name)
+
+    return _IndexedDir(mtime_ns, docs, subdirs)
+
+
+def _write_atomically(path: PathLike, contents: str) -> None:
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(contents)
+    os.replace(tmp_path, path)
+
+
+def read_mr_cache() -> List[Path]:
+    try:
+        with open(MOST_RECENT_CACHE_FILE, "r") as f:
+            return [Path(x.strip()) for x in f.readlines()]
+    except FileNotFoundError:
+        return []
+
+
+def rank_docs(
+    docs: Iterable[PathLike],
+    most_recent_docs: Iterable[PathLike],
+    open_docs: Iterable[PathLike],
+) -> List[Path]:
+    """Orders @docs in the same way that we present them to the user."""
+    ordered_docs = promote_most_recent_docs(docs, most_recent_docs)
+
+    open_docs = path_list(open_docs)
+    if open_docs:
+        ordered_docs = demote_open_docs(ordered_docs, open_docs)
+
+    return ordered_docs
+
+
+def pretty_doc(doc: PathLike) -> str:
+    """
+    Examples:
+        >>> pretty_doc(f"{BOOKS_DIR}/foo/bar.pdf")
+        'foo/bar.pdf'
+
+        >>> pretty_doc("/home/bryan/Downloads/baz.pdf")
+        '/home/bryan/Downloads/baz.pdf'
+    """
+    return re.sub(f"^{BOOKS_DIR}/", "", str(doc))
 
 
 def promote_most_recent_docs(
     docs: Iterable[PathLike], most_recent_docs: Iterable[PathLike]
 ) -> List[Path]:
-    """Docs in Cache File are Brought to the Top of the List of Options"""
+    """Docs in Cache File are Brought to the Top of the List of Options
+
+    Examples:
+        >>> promote_most_recent_docs(["a", "b", "c", "d"], ["c", "x", "a"])
+        [PosixPath('c'), PosixPath('a'), PosixPath('b'), PosixPath('d')]
+
+        Only the first copy of a duplicate doc is promoted.
+
+        >>> promote_most_recent_docs(["a", "b", "a"], ["b", "a"])
+        [PosixPath('b'), PosixPath('a'), PosixPath('a')]
+    """
     docs = path_list(docs)
-    most_recent_docs = path_list(most_recent_docs)
+    doc_set = set(docs)
 
-    new_docs = list(docs)
-    for mr_doc in list(reversed(most_recent_docs)):
-        if mr_doc in new_docs:
-            new_docs.remove(mr_doc)
-            new_docs.insert(0, mr_doc)
-    return new_docs
+    # Recent docs keep the order in which they first appear in the cache.
+    promoted = [
+        mr_doc
+        for mr_doc in dict.fromkeys(path_list(most_recent_docs))
+        if mr_doc in doc_set
+    ]
+
+    return promoted + _without_first_copies(docs, promoted)
 
 
 def demote_open_docs(
     docs: Iterable[PathLike], open_docs: Iterable[PathLike]
 ) -> List[Path]:
-    """Open Docs are Moved to the Bottom of the List of Options"""
+    """Open Docs are Moved to the Bottom of the List of Options
+
+    An open doc (which may only be part of a path, e.g. a basename) matches
+    every doc that contains it.
+
+    Examples:
+        >>> demote_open_docs(["/a/x.pdf", "/b/y.pdf", "/c/z.pdf"], ["x.pdf"])
+        [PosixPath('/b/y.pdf'), PosixPath('/c/z.pdf'), PosixPath('/a/x.pdf')]
+
+        Docs are demoted in the order that the open docs are given in. A doc
+        which is open in multiple instances is only demoted once.
+
+        >>> demote_open_docs(
+        ...     ["/a/x.pdf", "/b/y.pdf", "/c/z.pdf"],
+        ...     ["z.pdf", "/a/x.pdf", "z.pdf"],
+        ... )
+        [PosixPath('/b/y.pdf'), PosixPath('/c/z.pdf'), PosixPath('/a/x.pdf')]
+    """
     docs = path_list(docs)
+    doc_strs = [str(doc) for doc in docs]
 
-    new_docs = list(docs)
+    # A doc which is listed N times can be demoted (at most) N times.
+    copies_left = collections.Counter(docs)
     sorted_open_docs = []
-    for odoc in open_docs:
-        for doc in docs:
-            if str(odoc) in str(doc):
-                try:
-                    new_docs.remove(doc)
-                    sorted_open_docs.append(doc)
-                except ValueError:
-                    # Protects against multiple attempts to remove the same doc
-                    # which happens when the same doc is opened up in multiple
-                    # different instances.
-                    pass
-    new_docs.extend(sorted_open_docs)
-    return new_docs
+    for indices in _find_docs_containing(doc_strs, map(str, open_docs)):
+        for i in indices:
+            doc = docs[i]
+            if copies_left[doc]:
+                copies_left[doc] -= 1
+                sorted_open_docs.append(doc)
 
+    return _without_first_copies(docs, sorted_open_docs) + sorted_open_docs
 
-def choose_doc_to_open(available_docs: Iterable[PathLike]) -> BResult[Path]:
-    printf_ps = sp.Popen(
-        [
-            "printf",
-            "{}".format("\n".join(str(adoc) for adoc in available_docs)),
-        ],
-        stdout=sp.PIPE,
+
+def choose_doc_to_open(available_docs: Iterable[str]) -> BResult[Path]:
+    return _choose_doc_with_rofi(
+        [("\n".join(available_docs) + "\n").encode()]
     )
+
+
+def choose_doc_from_daemon(
+    socket_path: PathLike = None,
+) -> Optional[BResult[Path]]:
+    """Lets the user choose from the documents ranked by the zopen daemon.
+
+    The daemon's response is streamed straight into rofi, so rofi can show the
+    first documents before the rest have even been sent.
+
+    Returns:
+        None if the daemon is not running (or did not send any documents).
+    """
+    if socket_path is None:
+        socket_path = DAEMON_SOCKET_FILE
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(str(socket_path))
+            sock.sendall(DAEMON_RANK_REQUEST)
+            first_chunk = sock.recv(DAEMON_CHUNK_SIZE)
+        except OSError as e:
+            log.debug("Unable to use the zopen daemon: {!r}", e)
+            return None
+
+        if not first_chunk:
+            log.debug("The zopen daemon did not send us any documents.")
+            return None
+
+        chunks = itertools.chain(
+            [first_chunk], iter(lambda: sock.recv(DAEMON_CHUNK_SIZE), b"")
+        )
+        return _choose_doc_with_rofi(chunks)
+
+
+def _choose_doc_with_rofi(doc_lines: Iterable[bytes]) -> BResult[Path]:
     rofi_ps = sp.Popen(
         ["rofi", "-p", "Document", "-m", "-4", "-dmenu", "-i"],
         stdout=sp.PIPE,
-        stdin=printf_ps.stdout,
+        stdin=sp.PIPE,
     )
-    printf_ps.wait()
+    assert rofi_ps.stdin is not None and rofi_ps.stdout is not None
 
-    stdout, stderr = rofi_ps.communicate()
+    try:
+        for chunk in doc_lines:
+            rofi_ps.stdin.write(chunk)
+    except OSError as e:
+        # The user can choose a doc before rofi has read every option.
+        log.debug("Unable to send every doc to rofi: {!r}", e)
+    finally:
+        with contextlib.suppress(OSError):
+            rofi_ps.stdin.close()
+
+    stdout = rofi_ps.stdout.read()
+    rofi_ps.wait()
 
     if rofi_ps.returncode != 0:
         emsg = "The 'rofi' command failed."
@@ -238,9 +514,6 @@ def choose_doc_to_open(available_docs: Iterable[PathLike]) -> BResult[Path]:
         if stdout:
             emsg += f"\n\n----- STDOUT -----\n{stdout.decode().strip()}"
 
-        if stderr:
-            emsg += f"\n\n----- STDERR -----\n{stderr.decode().strip()}"
-
         return BErr(emsg)
 
     assert stdout
@@ -332,6 +605,15 @@ def get_new_mr_cache_lines(
     new_doc: PathLike,
     open_docs: Iterable[PathLike] = None,
 ) -> List[Path]:
+    """Returns the new contents of the most recently opened docs cache.
+
+    Open docs come first, followed by @new_doc and then the remaining recent
+    docs. Duplicate (closed) docs keep their last position.
+
+    Examples:
+        >>> get_new_mr_cache_lines(["a", "b", "a", "c"], "c", ["b"])
+        [PosixPath('b'), PosixPath('c'), PosixPath('a')]
+    """
     most_recent_docs = path_list(most_recent_docs)
     new_doc = Path(new_doc)
 
@@ -341,33 +623,91 @@ def get_new_mr_cache_lines(
         open_docs = path_list(open_docs)
 
     log.debug("Adding {} to cache file...".format(new_doc))
-    seen_docs = set()
-    sorted_open_docs = []
-    for mr_doc in most_recent_docs[:]:
-        for odoc in open_docs:
-            if str(odoc) in str(mr_doc):
-                sorted_open_docs.append(Path(mr_doc))
-                seen_docs.add(mr_doc)
-                break
-        else:
-            if str(new_doc) == str(mr_doc):
-                seen_docs.add(mr_doc)
-
-        if mr_doc in seen_docs:
-            most_recent_docs.remove(mr_doc)
-        else:
-            seen_docs.add(mr_doc)
+    mr_doc_strs = [str(mr_doc) for mr_doc in most_recent_docs]
+    open_indices = set(
+        itertools.chain.from_iterable(
+            _find_docs_containing(mr_doc_strs, map(str, open_docs))
+        )
+    )
+    last_indices = {mr_doc: i for i, mr_doc in enumerate(most_recent_docs)}
 
-    if new_doc in most_recent_docs:
-        most_recent_docs.remove(new_doc)
+    sorted_open_docs = []
+    closed_docs = []
+    for i, mr_doc in enumerate(most_recent_docs):
+        if i in open_indices:
+            sorted_open_docs.append(mr_doc)
+        elif mr_doc != new_doc and last_indices[mr_doc] == i:
+            closed_docs.append(mr_doc)
 
     first_docs = sorted_open_docs[:]
     if new_doc not in first_docs:
         first_docs.append(new_doc)
 
-    most_recent_docs[0:0] = first_docs
+    return (first_docs + closed_docs)[:MAX_MOST_RECENT_DOCS]
+
+
+def _find_docs_containing(
+    doc_strs: Sequence[str], needles: Iterable[str]
+) -> Iterator[List[int]]:
+    """Finds the docs that contain each needle.
 
-    return most_recent_docs[:MAX_MOST_RECENT_DOCS]
+    Instead of testing every doc against every needle, we search a single
+    string (which contains every doc) once per needle.
+
+    Yields:
+        The indices of the docs that contain each needle (in order).
+
+    Examples:
+        >>> list(_find_docs_containing(
+        ...     ["/a/foo.pdf", "/b/bar.pdf", "/c/foo.pdf"], ["foo", "b", "x"]
+        ... ))
+        [[0, 2], [1], []]
+    """
+    haystack = "\n".join(doc_strs)
+    # The offset at which each doc (after the first) starts.
+    line_starts = list(itertools.accumulate(len(s) + 1 for s in doc_strs))
+
+    for needle in needles:
+        if "\n" in needle:
+            yield [i for i, s in enumerate(doc_strs) if needle in s]
+            continue
+
+        indices = []
+        start = 0
+        while True:
+            start = haystack.find(needle, start)
+            i = bisect.bisect_right(line_starts, start)
+            # An empty needle is also found at the very end of the haystack.
+            if start == -1 or i == len(doc_strs):
+                break
+
+            indices.append(i)
+            # Each doc should only be matched once.
+            start = line_starts[i]
+
+        yield indices
+
+
+def _without_first_copies(
+    docs: Sequence[Path], removed_docs: Iterable[Path]
+) -> List[Path]:
+    """Removes the first copy of @docs for each doc in @removed_docs.
+
+    This is equivalent to calling docs.remove() for each removed doc.
+
+    Examples:
+        >>> _without_first_copies(path_list(["a", "b", "a", "c"]), [Path("a")])
+        [PosixPath('b'), PosixPath('a'), PosixPath('c')]
+    """
+    copies_to_remove = collections.Counter(removed_docs)
+    new_docs = []
+    for doc in docs:
+        if copies_to_remove[doc]:
+            copies_to_remove[doc] -= 1
+        else:
+            new_docs.append(doc)
+
+    return new_docs
 
 
 def path_list(path_like_iter: Iterable[PathLike]) -> List[Path]:
@@ -383,7 +723,8 @@ def path_list(path_like_iter: Iterable[PathLike]) -> List[Path]:
         >>> path_list([Path("foo")])
         [PosixPath('foo')]
     """
-    return [Path(P) for P in path_like_iter]
+    # Paths are immutable, so there is no need to re-parse them.
+    return [P if isinstance(P, Path) else Path(P) for P in path_like_iter]
 
 
 main = main_factory(parse_cli_args, run)
@@ -0,0 +1,359 @@
+"""The zopen daemon.
+
+Watches our document directories (using inotify), keeps the ranked list of
+documents in memory, and serves it over a Unix domain socket. This lets zopen
+stream the list straight into rofi without re-indexing or re-ranking our
+documents first.
+
+Each connection carries a single "rank" request. The daemon replies with the
+ranked documents (one per line, formatted as they are shown to the user) and
+then closes the connection.
+"""
+
+import ctypes
+import errno
+import os
+from pathlib import Path
+import selectors
+import signal
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from loguru import logger as log
+import zopen
+from zopen import DocIndex, PathLike
+
+
+# How long (in seconds) we wait for a burst of filesystem events to end before
+# refreshing the document index.
+DEBOUNCE_DELAY = 0.5
+
+# How often (in seconds) we refresh the document index even if we have not
+# received any events. This catches changes to directories which we could not
+# watch (e.g. because we ran out of inotify watches) or which do not exist yet
+# (e.g. unmounted document roots).
+REFRESH_INTERVAL = 300
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# These are the events which change a directory's mtime (and which can
+# therefore change the document index).
+WATCH_MASK = (
+    IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    name: str
+
+
+class Inotify:
+    """Minimal (ctypes) Wrapper Around Linux's inotify API"""
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._check(
+            self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        )
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def add_watch(self, path: PathLike, mask: int = WATCH_MASK) -> int:
+        return self._check(
+            self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask),
+            path,
+        )
+
+    def rm_watch(self, wd: int) -> None:
+        self._check(self._libc.inotify_rm_watch(self.fd, wd))
+
+    def read_events(self) -> List[InotifyEvent]:
+        """Returns every pending event (without blocking)."""
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, name_size = _EVENT_HEADER.unpack_from(
+                    data, offset
+                )
+                offset += _EVENT_HEADER.size
+                name = data[offset : offset + name_size].rstrip(b"\0")
+                offset += name_size
+                events.append(InotifyEvent(wd, mask, os.fsdecode(name)))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+    @staticmethod
+    def _check(result: int, path: PathLike = None) -> int:
+        if result < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+
+        return result
+
+
+class DocDaemon:
+    """Keeps the ranked list of documents up-to-date."""
+
+    def __init__(self, index: DocIndex) -> None:
+        self.index = index
+
+        self._inotify = Inotify()
+        self._watches: Dict[str, int] = {}  # directory -> watch descriptor
+        self._out_of_watches = False
+
+        self._mr_cache_mtime: Optional[int] = None
+        # The promoted (but not yet demoted) docs and their pretty lines.
+        self._promoted: Tuple[List[Path], bytes] = ([], b"")
+        # The most recent ranking (keyed by the open docs it was made with).
+        self._ranked: Tuple[Tuple[Path, ...], bytes] = ((), b"")
+        # Incremented by every rerank, so that rankings which were made from
+        # an outdated promoted list are never stored.
+        self._generation = 0
+
+        # Guards the fields above, which are also used by request threads.
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def refresh(self, *, force: bool = False) -> None:
+        """Refreshes the document index and updates our watches."""
+        rescanned = zopen.refresh_doc_index(self.index)
+        self._update_watches()
+        if rescanned or force:
+            self._rerank()
+
+    def ranked_lines(self) -> bytes:
+        """Returns the ranked docs (in the same format as the zopen CLI)."""
+        self._reload_mr_cache()
+
+        open_docs = tuple(zopen.get_open_docs())
+        with self._lock:
+            generation = self._generation
+            promoted, promoted_lines = self._promoted
+            ranked_open_docs, ranked_lines = self._ranked
+
+        if not open_docs:
+            return promoted_lines
+
+        if ranked_open_docs == open_docs:
+            return ranked_lines
+
+        # This is done without holding the lock, since it can take a while.
+        ranked_lines = _doc_lines(zopen.demote_open_docs(promoted, open_docs))
+        with self._lock:
+            if generation == self._generation:
+                self._ranked = (open_docs, ranked_lines)
+
+        return ranked_lines
+
+    def watch(self) -> None:
+        """Refreshes the document index whenever our documents change.
+
+        Runs until stop() is called.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self._inotify, selectors.EVENT_READ)
+
+        next_refresh = time.monotonic() + REFRESH_INTERVAL
+        while not self._stopped.is_set():
+            timeout = max(next_refresh - time.monotonic(), 0)
+            # Wake up every so often, so we notice when we have been stopped.
+            if selector.select(min(timeout, 1)):
+                events = self._inotify.read_events()
+                self._forget_removed_watches(events)
+                if any(not event.mask & IN_IGNORED for event in events):
+                    next_refresh = min(
+                        next_refresh, time.monotonic() + DEBOUNCE_DELAY
+                    )
+
+            if time.monotonic() >= next_refresh:
+                self.refresh()
+                next_refresh = time.monotonic() + REFRESH_INTERVAL
+
+        selector.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def close(self) -> None:
+        self._inotify.close()
+
+    def _reload_mr_cache(self) -> None:
+        if _mtime_ns(zopen.MOST_RECENT_CACHE_FILE) != self._mr_cache_mtime:
+            self._rerank()
+
+    def _rerank(self) -> None:
+        with self._lock:
+            # This is checked before reading the MR cache so that we never
+            # miss an update.
+            mtime = _mtime_ns(zopen.MOST_RECENT_CACHE_FILE)
+            promoted = zopen.promote_most_recent_docs(
+                self.index.docs(), zopen.read_mr_cache()
+            )
+            self._promoted = (promoted, _doc_lines(promoted))
+            self._ranked = ((), b"")
+            self._generation += 1
+            self._mr_cache_mtime = mtime
+
+    def _update_watches(self) -> None:
+        for dir_path in list(self._watches):
+            if dir_path not in self.index.dirs:
+                wd = self._watches.pop(dir_path)
+                try:
+                    self._inotify.rm_watch(wd)
+                except OSError:
+                    # The watch is removed automatically when its directory
+                    # is deleted.
+                    pass
+
+        if self._out_of_watches:
+            return
+
+        for dir_path in self.index.dirs:
+            if dir_path in self._watches:
+                continue
+
+            try:
+                self._watches[dir_path] = self._inotify.add_watch(dir_path)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    log.warning(
+                        "Unable to watch every document directory (see"
+                        " /proc/sys/fs/inotify/max_user_watches). The other"
+                        " directories are refreshed every {} seconds.",
+                        REFRESH_INTERVAL,
+                    )
+                    self._out_of_watches = True
+                    return
+
+                log.debug("Unable to watch {}: {!r}", dir_path, e)
+
+    def _forget_removed_watches(self, events: List[InotifyEvent]) -> None:
+        removed = {event.wd for event in events if event.mask & IN_IGNORED}
+        if not removed:
+            return
+
+        for dir_path, wd in list(self._watches.items()):
+            if wd in removed:
+                del self._watches[dir_path]
+        self._out_of_watches = False
+
+
+class DocServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves the ranked list of documents to zopen clients."""
+
+    daemon_threads = True
+
+    def __init__(self, path: Path, doc_daemon: DocDaemon) -> None:
+        self.path = path
+        self.doc_daemon = doc_daemon
+
+        if _is_listening(path):
+            raise RuntimeError(
+                f"Another zopen daemon is already listening on {path}."
+            )
+
+        if path.exists():
+            path.unlink()
+
+        super().__init__(str(path), _DocRequestHandler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class _DocRequestHandler(socketserver.StreamRequestHandler):
+    server: DocServer
+
+    def handle(self) -> None:
+        request = self.rfile.readline()
+        if not request:
+            # Probably another daemon checking whether we are running.
+            return
+
+        if request != zopen.DAEMON_RANK_REQUEST:
+            log.warning("Received an invalid request: {!r}", request)
+            return
+
+        try:
+            self.wfile.write(self.server.doc_daemon.ranked_lines())
+        except BrokenPipeError:
+            # The client (or rofi) exited before reading every document.
+            pass
+
+
+def run_daemon(socket_path: Path = None) -> int:
+    if socket_path is None:
+        socket_path = Path(zopen.DAEMON_SOCKET_FILE)
+
+    doc_daemon = DocDaemon(DocIndex.load(zopen.DOC_INDEX_FILE))
+    signal.signal(signal.SIGTERM, lambda *_: doc_daemon.stop())
+    try:
+        doc_daemon.refresh(force=True)
+        server = DocServer(socket_path, doc_daemon)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        log.info("Serving ranked documents on {}.", socket_path)
+
+        try:
+            doc_daemon.watch()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+            server.server_close()
+    finally:
+        doc_daemon.close()
+
+    return 0
+
+
+def _doc_lines(docs: List[Path]) -> bytes:
+    return "".join(f"{zopen.pretty_doc(doc)}\n" for doc in docs).encode()
+
+
+def _mtime_ns(path: PathLike) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _is_listening(path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(path))
+        except OSError:
+            return False
+
+    return True